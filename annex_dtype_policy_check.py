@@ -0,0 +1,149 @@
+
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+import scipy.signal
+import pandas as pd
+
+from n00_config_params import *
+from n00bis_config_analysis_functions import *
+
+debug = False
+
+
+
+
+
+################################
+######## SYNTHETIC DATA ########
+################################
+
+
+#n_chan, duration = 2, 120
+def get_synthetic_eeg(n_chan=2, duration=120, seed=0):
+
+    """
+    pink noise with respiration locked theta bursts, volts scale as mne data
+    """
+
+    rng = np.random.default_rng(seed)
+    n_time = int(duration*srate)
+    time = np.arange(n_time)/srate
+
+    #### 1/f noise
+    spectrum = rng.standard_normal((n_chan, n_time//2+1)) + 1j*rng.standard_normal((n_chan, n_time//2+1))
+    hzfft = np.fft.rfftfreq(n_time, 1/srate)
+    spectrum[:,1:] /= np.sqrt(hzfft[1:])
+    spectrum[:,0] = 0
+    data = np.fft.irfft(spectrum, n=n_time, axis=1)
+    data /= data.std(axis=1, keepdims=True)
+
+    #### theta bursts at 0.25 Hz respi, phase lag between chan
+    respi = np.sin(2*np.pi*.25*time)
+    for chan_i in range(n_chan):
+        data[chan_i,:] += 2 * np.clip(respi, 0, None) * np.sin(2*np.pi*6*time - chan_i*np.pi/4)
+
+    return data * 1e-5
+
+
+
+
+
+################################
+######## COMPARE POLICIES ########
+################################
+
+
+def compute_all_policy(data, policy):
+
+    res = {}
+    cycle_len = 4*srate
+
+    #### TF and baselines
+    wavelets = get_wavelets()
+    tf = np.stack([get_tf_conv(data[chan_i,:], wavelets, policy=policy) for chan_i in range(data.shape[0])])
+    res['tf_power'] = tf
+
+    res['baseline_stats'] = np.stack([get_baseline_stats(tf[chan_i,:,:]) for chan_i in range(tf.shape[0])])
+
+    #### cycle median then zscore, as precompute_tf_all_conv
+    n_cycle = tf.shape[-1] // cycle_len
+    tf_cycle = np.median(tf[:,:,:n_cycle*cycle_len].reshape(tf.shape[0], nfrex, n_cycle, cycle_len), axis=2)
+    res['tf_zscore'] = (tf_cycle - tf_cycle.mean(axis=-1, keepdims=True)) / tf_cycle.std(axis=-1, keepdims=True)
+
+    #### ISPC WPLI theta, as get_pli_ispc
+    wavelets_fc = get_wavelets_fc(freq_band_fc['theta'])
+    x = data.astype(get_dtype('float', policy))
+    conv = np.stack([convolve_wavelet_family(x[chan_i,:], wavelets_fc, policy=policy) for chan_i in range(x.shape[0])])
+    as1 = conv[0,:,:n_cycle*cycle_len].reshape(wavelets_fc['freqs'].size, n_cycle, cycle_len).transpose(1,0,2)
+    as2 = conv[1,:,:n_cycle*cycle_len].reshape(wavelets_fc['freqs'].size, n_cycle, cycle_len).transpose(1,0,2)
+    cdd = np.exp(1j*(np.angle(as1)-np.angle(as2)))
+    res['ispc'] = np.abs(np.mean(cdd, axis=0)).mean(axis=0)
+    cross = as1 * np.conj(as2)
+    res['wpli'] = (np.abs(np.mean(np.imag(cross), axis=0)) / np.mean(np.abs(np.imag(cross)), axis=0)).mean(axis=0)
+
+    #### entropy, always dtype_acc
+    amp = np.abs(conv[0,0,:n_cycle*cycle_len]).reshape(n_cycle, cycle_len)
+    distrib = amp.mean(axis=0).reshape(20, -1).mean(axis=1)
+    res['MI'] = np.array([Modulation_Index(distrib / distrib.sum())])
+
+    #### group diff feeding cluster stats
+    res['cluster_obs'] = np.mean(res['tf_zscore'][1:], axis=0) - np.mean(res['tf_zscore'][:1], axis=0)
+
+    return res
+
+
+
+def check_dtype_policy():
+
+    """
+    Same synthetic data through both policies, errors of float32 relative to float64 reference
+    """
+
+    data = get_synthetic_eeg()
+
+    res_ref = compute_all_policy(data, 'float64')
+    res_test = compute_all_policy(data, 'float32')
+
+    #### tolerance on error relative to the rms of the reference along the last axis
+    tol = {'tf_power' : 1e-4, 'baseline_stats' : 1e-3, 'tf_zscore' : 1e-4, 'ispc' : 1e-4, 'wpli' : 1e-4, 'MI' : 1e-4, 'cluster_obs' : 1e-4}
+
+    df_check = {'metric' : [], 'max_abs_err' : [], 'max_rel_err' : [], 'tol' : [], 'mem_ratio' : [], 'pass' : []}
+
+    for metric in res_ref:
+
+        ref, test = res_ref[metric], res_test[metric]
+        abs_err = np.abs(ref - test.astype(np.float64))
+        rel_err = abs_err / np.sqrt(np.mean(ref**2, axis=-1, keepdims=True))
+
+        df_check['metric'].append(metric)
+        df_check['max_abs_err'].append(np.nanmax(abs_err))
+        df_check['max_rel_err'].append(np.nanmax(rel_err))
+        df_check['tol'].append(tol[metric])
+        df_check['mem_ratio'].append(test.nbytes / ref.nbytes)
+        df_check['pass'].append(np.nanmax(rel_err) <= tol[metric])
+
+    df_check = pd.DataFrame(df_check)
+
+    if debug:
+
+        plt.pcolormesh(res_ref['tf_zscore'][0] - res_test['tf_zscore'][0])
+        plt.colorbar()
+        plt.show()
+
+    return df_check
+
+
+
+
+
+
+################################
+######## EXECUTE ########
+################################
+
+
+if __name__ == '__main__':
+
+    df_check = check_dtype_policy()
+    print(df_check.to_string(), flush=True)
@@ -79,6 +79,13 @@ params_extraction_data = {'COVEM_ITL' : {'time_cutoff' : 13},
                       'SLP' : {'time_cutoff' : 0},
                        'ITL_LEO' : {'time_cutoff' : 0}}
 
+#### dtype policy
+# storage and bulk compute in single precision, float64 only as accumulator where a numerical check shows it matters
+# (entropy sums, baseline running sums, cluster statistics, covariances), see annex_dtype_policy_check.py
+dtype_policy = 'float32' # 'float64' to reproduce legacy outputs
+dtype_policy_list = {'float32' : {'float' : np.float32, 'complex' : np.complex64}, 'float64' : {'float' : np.float64, 'complex' : np.complex128}}
+dtype_acc = np.float64
+
 
 
 ########################################
@@ -197,6 +204,10 @@ os.chdir(init_workdir)
 mem_crnl_cluster = '10G'
 n_core_slurms = 10
 
+#### scratch buffers for inter process results, node local first and path_memmap as last resort
+path_scratch_list = ['/dev/shm', os.environ.get('TMPDIR')]
+scratch_free_ratio = 0.8 # max fraction of the free space taken in a scratch dir
+
 
 
 
@@ -316,6 +327,16 @@ nfrex_fc = 50
 tf_stats_percentile_cluster_manual_perm = 80
 erp_time_cluster_thresh = 50 #ms
 
+cluster_inference_mode = 'size' # 'size' pointwise surrogate thresh + size rule, 'mass' max cluster mass p-values, 'tfce' max TFCE p-values
+cluster_forming_alpha = 0.05 # pointwise t thresh forming the clusters in 'mass'
+cluster_mass_alpha = 0.05
+cluster_median_thresh_n_surr = 200 # surrogates drawn before the main pass to set the median cluster forming thresh
+perm_batch_mem = 2e9 # bytes per surrogate batch in the batched permutation engine
+tfce_E = 0.5
+tfce_H = 2
+tfce_n_steps = 50 # dh = max |observed stat| / tfce_n_steps, shared by the surrogates
+surr_block_mem = 2e7 # bytes per block of ERP surrogates, small blocks stay in cache
+
 
 
 
@@ -328,12 +349,27 @@ nfrex = 150
 ncycle_list = [7, 41]
 freq_list = [2, 150]
 srate_dw = 10
+tf_decimate = True # TF / FC envelopes decimated per wavelet before stretching
+tf_dw_n_sd = 6 # power envelope kept up to tf_dw_n_sd * freq / cycles Hz, output rate floored at srate_dw
+wavelet_env_tol = 1e-6 # Morlet kernels cut where the gaussian envelope falls under wavelet_env_tol
+wavelet_len_ratio = 1.25 # kernel half lengths rounded up on this geometric grid, one convolution batch per length
+wavelet_norm = 'peak' # 'peak' envelope max at 1, 'gain' envelope sum at 1 (unit gain at the wavelet freq)
 wavetime = np.arange(-3,3,1/srate)
 frex = np.logspace(np.log10(freq_list[0]), np.log10(freq_list[1]), nfrex) 
 cycles = np.logspace(np.log10(ncycle_list[0]), np.log10(ncycle_list[1]), nfrex).astype('int')
 
 ratio_stretch_TF = 0.5
 n_surrogates_tf = 1000
+
+baseline_cond = 'VS'
+baseline_stat_list = ['mean', 'std', 'median', 'mad']
+baseline_robust_mode = 'online' # 'online' histogram quantiles or 'exact' np.median
+baseline_n_bins = 2000
+baseline_chunk_size = 60*srate
+
+tf_store_file = 'allsujet_tf_stretch.h5' # (cond, chan, sujet, freq, phase), one chunk per cond x chan
+tf_store_compression = 'lzf'
+tf_store_version = 2 # bumped when the tf_stretch layout changes, a store of another version is rebuilt
 tf_stats_percentile_cluster = 95
 tf_stats_percentile_cluster_size_thresh = 75
 
@@ -346,6 +382,20 @@ tf_stats_percentile_cluster_size_thresh = 75
 freq_band_fc_list = ['theta', 'alpha', 'gamma']
 freq_band_fc = {'theta' : [4,8], 'alpha' : [8,12], 'gamma' : [80,150]}
 n_surr_fc = 1000
+fc_metric_band_list = ['ISPC', 'WPLI', 'COH', 'ICOH', 'LCOH', 'DWPLI', 'AEC', 'AEC_ORTH'] # (sujet, band, cond, pair, time) arrays, same stats and plots
+dfc_win_size = 10 # sec, sliding window of the dynamic FC
+dfc_win_step = 1 # sec
+
+
+
+########################
+######## PAC ########
+########################
+
+pac_phase_band_list = ['resp', 'theta', 'alpha'] # 'resp' from respfeatures, others from freq_band_fc
+pac_amp_band_list = ['gamma'] # one amp_freq row per wavelet of the band
+pac_n_bins = 18
+n_surr_pac = 1000
 
 
 
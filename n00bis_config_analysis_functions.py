@@ -8,13 +8,19 @@ import mne
 import pandas as pd
 import sys
 import stat
+import atexit
+import signal
+import shutil
 import subprocess
 import scipy.stats
+import scipy.ndimage
+import scipy.sparse
+import scipy.sparse.csgraph
 import xarray as xr
 import physio
 import paramiko
 import getpass
-import cv2
+import h5py
 import statsmodels
 import seaborn as sns
 #install netcdf4
@@ -445,35 +451,210 @@ def execute_function_in_slurm_bash(name_script, name_function, params, n_core=15
 
 
 
+################################
+######## DTYPE POLICY ########
+################################
+
+
+#kind = 'float'
+def get_dtype(kind='float', policy=None):
+
+    """
+    kind in 'float', 'complex' or 'acc', policy defaults to dtype_policy
+    """
+
+    if kind == 'acc':
+        return dtype_acc
+
+    if policy is None:
+        policy = dtype_policy
+
+    return dtype_policy_list[policy][kind]
+
+
+
+def zeros_policy(shape, kind='float', policy=None):
+
+    return np.zeros(shape, dtype=get_dtype(kind, policy))
+
+
+
+def memmap_policy(filename, shape, kind='float', mode='w+', policy=None):
+
+    return np.memmap(filename, dtype=get_dtype(kind, policy), mode=mode, shape=shape)
+
+
+
+
+
+
+################################
+######## SCRATCH BUFFERS ########
+################################
+
+
+scratch_buffer_list = []
+scratch_cleanup_registered = False
+
+
+
+#nbytes = 1e9
+def get_scratch_dir(nbytes):
+
+    """
+    First dir of path_scratch_list with enough free space, path_memmap otherwise
+    """
+
+    for path_scratch in path_scratch_list:
+
+        if path_scratch is None or os.path.isdir(path_scratch) == False or os.access(path_scratch, os.W_OK) == False:
+            continue
+
+        if shutil.disk_usage(path_scratch).free * scratch_free_ratio >= nbytes:
+            return path_scratch
+
+    return path_memmap
+
+
+
+def clean_scratch_buffers():
+
+    for filename in scratch_buffer_list:
+
+        try:
+            os.remove(filename)
+        except:
+            pass
+
+    scratch_buffer_list.clear()
+
+
+
+def scratch_signal_handler(signum, frame):
+
+    clean_scratch_buffers()
+
+    #### then default behaviour of the signal
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+
+
+def register_scratch_cleanup():
+
+    global scratch_cleanup_registered
+
+    if scratch_cleanup_registered:
+        return
+
+    atexit.register(clean_scratch_buffers)
+
+    #### slurm sends SIGTERM on scancel and time limit, handlers only from the main thread
+    try:
+        for signum in [signal.SIGTERM, signal.SIGINT]:
+            signal.signal(signum, scratch_signal_handler)
+    except ValueError:
+        pass
+
+    scratch_cleanup_registered = True
+
+
+
+#name, shape = 'data_stretch_ERP', (len(sujet_list), len(cond_list), len(chan_list_eeg), stretch_point_ERP)
+def scratch_memmap(name, shape, kind='float', policy=None):
+
+    """
+    Result memmap shared by joblib workers, on node local scratch so writes stay off the network share,
+    removed on exit, on SIGTERM / SIGINT or by release_scratch_memmap
+    """
+
+    register_scratch_cleanup()
+
+    nbytes = np.prod(shape) * np.dtype(get_dtype(kind, policy)).itemsize
+    path_scratch = get_scratch_dir(nbytes)
+
+    filename = os.path.join(path_scratch, f'{name}_{os.getpid()}.dat')
+    scratch_buffer_list.append(filename)
+
+    print(f'SCRATCH {name} {np.round(nbytes/1e9, 2)}Go in {path_scratch}', flush=True)
+
+    return memmap_policy(filename, shape, kind=kind, policy=policy)
+
+
+
+def release_scratch_memmap(buffer):
+
+    filename = buffer.filename
+    del buffer
+
+    if filename in scratch_buffer_list:
+        scratch_buffer_list.remove(filename)
+
+    try:
+        os.remove(filename)
+    except:
+        pass
+
+
+
+
+
+
 ################################
 ######## WAVELETS ########
 ################################
 
+#freqs, ncycles = frex, cycles
+def get_wavelet_family(freqs, ncycles):
 
-def get_wavelets():
+    """
+    Morlet family with one kernel length per wavelet, the gaussian envelope (sd ncycles / (2 pi freq) s) is cut where
+    it falls under wavelet_env_tol and the half lengths rounded up on a wavelet_len_ratio geometric grid,
+    wavelets of the same length are convolved as one batch (convolve_wavelet_family)
+    kernels odd and centred on t=0, amplitude from wavelet_norm
+    returns a dict : freqs, ncycles, sd_time (s), half_len (samples) per wavelet, kernels {half_len : (n_rows, 2*half_len+1)}
+    and rows {half_len : wavelet index of the kernels}
+    """
 
-    #### compute wavelets
-    wavelets = np.zeros((nfrex, len(wavetime)), dtype=complex)
+    freqs, ncycles = np.asarray(freqs, dtype=float), np.asarray(ncycles, dtype=float)
+    sd_time = ncycles / (2*np.pi*freqs)
 
-    # create Morlet wavelet family
-    for fi in range(nfrex):
-        
-        s = cycles[fi] / (2*np.pi*frex[fi])
-        gw = np.exp(-wavetime**2/ (2*s**2)) 
-        sw = np.exp(1j*(2*np.pi*frex[fi]*wavetime))
-        mw =  gw * sw
+    #### truncation then length grid
+    half_len = np.ceil(sd_time*srate*np.sqrt(-2*np.log(wavelet_env_tol)))
+    half_len = np.ceil(wavelet_len_ratio**np.ceil(np.log(half_len)/np.log(wavelet_len_ratio))).astype(int)
 
-        wavelets[fi,:] = mw
+    wavelets = {'freqs' : freqs, 'ncycles' : ncycles, 'sd_time' : sd_time, 'half_len' : half_len, 'kernels' : {}, 'rows' : {}}
 
-    if debug:
+    for h in np.unique(half_len):
 
-        plt.plot(np.sum(np.abs(wavelets),axis=1))
-        plt.show()
+        rows = np.where(half_len == h)[0]
+        wavetime_h = np.arange(-h, h+1)/srate
+
+        gw = np.exp(-wavetime_h**2 / (2*sd_time[rows,np.newaxis]**2))
+        sw = np.exp(1j*(2*np.pi*freqs[rows,np.newaxis]*wavetime_h))
+
+        if wavelet_norm == 'gain':
+            gw = gw / gw.sum(axis=1, keepdims=True)
+
+        wavelets['kernels'][h] = gw * sw
+        wavelets['rows'][h] = rows
+
+    return wavelets
 
-        plt.pcolormesh(np.real(wavelets))
+
+
+def get_wavelets():
+
+    #### compute wavelets
+    wavelets = get_wavelet_family(frex, cycles)
+
+    if debug:
+
+        plt.plot(frex, 2*wavelets['half_len']+1)
         plt.show()
 
-        plt.plot(np.real(wavelets)[0,:])
+        h = wavelets['half_len'][0]
+        plt.plot(np.real(wavelets['kernels'][h][0,:]))
         plt.show()
 
     return wavelets
@@ -485,41 +666,130 @@ def get_wavelets_fc(freq):
 
     #### select wavelet parameters
     wavelets_mask = (frex >= freq[0]) & (frex <= freq[-1])
-    frex_list = frex[wavelets_mask]
-    ncycle_list = cycles[wavelets_mask]
-    nfrex_freq = wavelets_mask.sum()
 
-    if freq[0] < 45:
-        wavetime = np.arange(-2,2,1/srate)
+    #### compute wavelets
+    wavelets = get_wavelet_family(frex[wavelets_mask], cycles[wavelets_mask])
 
-    if freq[0] > 45:
-        wavetime = np.arange(-.5,.5,1/srate)
+    if debug:
 
-    #### compute wavelets
-    wavelets = np.zeros((nfrex_freq,len(wavetime)) ,dtype=complex)
+        plt.plot(wavelets['freqs'], 2*wavelets['half_len']+1)
+        plt.show()
 
-    # create Morlet wavelet family
-    for fi in range(nfrex_freq):
-        
-        s = ncycle_list[fi] / (2*np.pi*frex_list[fi])
-        gw = np.exp(-wavetime**2/ (2*s**2)) 
-        sw = np.exp(1j*(2*np.pi*frex_list[fi]*wavetime))
-        mw =  gw * sw
+    return wavelets
 
-        wavelets[fi,:] = mw
 
-    if debug:
 
-        plt.plot(np.sum(np.abs(wavelets),axis=1))
-        plt.show()
+#x, wavelets = data[chan_i,:], get_wavelets()
+def convolve_wavelet_family(x, wavelets, policy=None, batch_mem=perm_batch_mem):
 
-        plt.pcolormesh(np.real(wavelets))
-        plt.show()
+    """
+    Analytic signals (freq, time) of x (time), 'same' alignment, kernels in the complex dtype of the policy
+    each length group in one overlap add call (oaconvolve), blocks sized on the kernel so the short high freq
+    wavelets cost less than a full length fft, rows chunked by batch_mem
+    """
 
-        plt.plot(np.real(wavelets)[0,:])
-        plt.show()
+    conv = zeros_policy((wavelets['freqs'].size, x.shape[-1]), kind='complex', policy=policy)
+    rows_chunk = int(max(batch_mem // (x.shape[-1]*16*4), 1))
 
-    return wavelets
+    for h, kernels in wavelets['kernels'].items():
+
+        rows = wavelets['rows'][h]
+        kernels = kernels.astype(get_dtype('complex', policy))
+
+        for chunk_start in range(0, rows.size, rows_chunk):
+
+            chunk = slice(chunk_start, chunk_start+rows_chunk)
+            #### x broadcast as a view, 'same' crops on the in1 shape
+            conv[rows[chunk],:] = scipy.signal.oaconvolve(np.broadcast_to(x, kernels[chunk].shape[:1] + x.shape), kernels[chunk], mode='same', axes=-1)
+
+    return conv
+
+
+
+#x, wavelets = data[chan_i,:], get_wavelets()
+def get_tf_conv(x, wavelets, policy=None, output='power'):
+
+    """
+    (freq, time) power of x for a get_wavelet_family dict, convolution and output in the dtype policy
+    output='complex' keeps the analytic signal for phase based metrics
+    """
+
+    x = x.astype(get_dtype('float', policy))
+
+    tf = convolve_wavelet_family(x, wavelets, policy=policy)
+
+    if output == 'complex':
+        return tf
+
+    return (np.abs(tf)**2).astype(get_dtype('float', policy))
+
+
+
+#freqs, ncycles = frex, cycles
+def get_tf_decimation_factors(freqs, ncycles):
+
+    """
+    Integer decimation factor per wavelet, the power envelope of a Morlet (sd freq / ncycles Hz) is kept up to
+    tf_dw_n_sd sd and the output rate floored at srate_dw, 1 everywhere when tf_decimate is off
+    """
+
+    if tf_decimate == False:
+        return np.ones(len(freqs), dtype=int)
+
+    srate_out = np.maximum(srate_dw, 2*tf_dw_n_sd*np.asarray(freqs)/np.asarray(ncycles))
+
+    return np.clip(np.floor(srate/srate_out), 1, None).astype(int)
+
+
+
+#x, q = power, q_list[0]
+def decimate_tf(x, q, freqs=None):
+
+    """
+    Low pass and downsample (..., time) by q with a polyphase FIR (resample_poly), output rate srate/q
+    analytic signals are first demodulated by their wavelet freqs (broadcast on x.shape[:-1]) so only the envelope band
+    is kept, |x| and the products x_i * conj(x_j) at the same freq are unchanged
+    """
+
+    if q == 1:
+        return x
+
+    if freqs is not None:
+        x = x * np.exp(-2j*np.pi*np.asarray(freqs)[...,np.newaxis]*np.arange(x.shape[-1])/srate)
+
+    return scipy.signal.resample_poly(x, 1, q, axis=-1)
+
+
+
+#tf_complex, inspi_starts = tf_complex, respfeatures['inspi_index'].values
+def get_tf_erp(tf_complex, inspi_starts):
+
+    """
+    Inspi locked trial average of the power and inter trial phase coherence (freq, time) on ERP_time_vec at srate,
+    each epoch is a slice of the convolution, only the (freq, time) epoch is squared / normalized before being summed,
+    epochs out of the recording left out, raise if none is left
+    """
+
+    n_times = int((ERP_time_vec[1] - ERP_time_vec[0])*srate)
+
+    t_start = (inspi_starts + ERP_time_vec[0]*srate).astype(int)
+    t_start = t_start[(t_start >= 0) & (t_start + n_times <= tf_complex.shape[-1])]
+
+    if t_start.size == 0:
+        raise ValueError(f'no inspi epoch of {ERP_time_vec} sec inside the recording ({tf_complex.shape[-1]} points)')
+
+    power_sum = np.zeros((tf_complex.shape[0], n_times), dtype=dtype_acc)
+    phase_sum = np.zeros((tf_complex.shape[0], n_times), dtype=np.complex128)
+
+    for start in t_start:
+
+        epoch = tf_complex[:,start:start+n_times]
+        amp = np.abs(epoch)
+
+        power_sum += amp**2
+        phase_sum += epoch / np.where(amp > 0, amp, 1)
+
+    return power_sum / t_start.size, np.abs(phase_sum) / t_start.size
 
 
 
@@ -591,6 +861,21 @@ def get_pos_file(sujet, band_prep):
 
 
 
+#sujet, cond, metric = sujet_list[0], cond_list[0], 'ISPC'
+def load_dfc_sujet(sujet, cond, metric):
+
+    """
+    Sliding window FC of compute_dfc_sujet (n07) for one metric, (pair, band, window) with window the centers in sec
+    """
+
+    xr_dfc = xr.open_dataarray(os.path.join(path_precompute, 'FC', 'DFC', f'{sujet}_{cond}_DFC.nc'))
+    xr_dfc_metric = xr_dfc.loc[metric].load()
+    xr_dfc.close()
+
+    return xr_dfc_metric
+
+
+
 ########################################
 ######## LOAD RESPI FEATURES ########
 ########################################
@@ -702,9 +987,9 @@ def stretch_data(resp_features, nb_point_by_cycle, data, srate):
 
     #### reshape
     if np.iscomplex(data[0]):
-        data_stretch = np.zeros(( cycles.shape[0], nb_point_by_cycle ), dtype='complex')
+        data_stretch = zeros_policy(( cycles.shape[0], nb_point_by_cycle ), kind='complex')
     else:
-        data_stretch = np.zeros(( cycles.shape[0], nb_point_by_cycle ))
+        data_stretch = zeros_policy(( cycles.shape[0], nb_point_by_cycle ))
 
     for cycle_i in range(cycles.shape[0]):
 
@@ -744,9 +1029,9 @@ def stretch_data_tf(resp_features, nb_point_by_cycle, data, srate):
 
     #### reshape
     if np.iscomplex(data[0,0]):
-        data_stretch = np.zeros(( cycles.shape[0], data.shape[0], nb_point_by_cycle ), dtype='complex')
+        data_stretch = zeros_policy(( cycles.shape[0], data.shape[0], nb_point_by_cycle ), kind='complex')
     else:
-        data_stretch = np.zeros(( cycles.shape[0], data.shape[0], nb_point_by_cycle ))
+        data_stretch = zeros_policy(( cycles.shape[0], data.shape[0], nb_point_by_cycle ))
 
     for cycle_i in range(cycles.shape[0]):
 
@@ -762,6 +1047,133 @@ def stretch_data_tf(resp_features, nb_point_by_cycle, data, srate):
 
 
 
+#x, resp_features, nb_point_by_cycle, n_surr = x, respfeatures_stretch, stretch_point_ERP, 1000
+def get_stretch_surrogates(x, resp_features, nb_point_by_cycle, n_surr, batch_mem=surr_block_mem, seed=None):
+
+    """
+    Yield blocks (batch, n_cycles, nb_point_by_cycle) of stretch_data on shuffled cycle lengths, laid end to end from the first inspi
+    cycle boundaries fall on samples so the physio warp is, per point, a fractional sample index inside its segment :
+    every template of a block is one gather and one linear blend on the raw signal, no re-stretch per surrogate
+    """
+
+    rng = np.random.default_rng(seed)
+
+    #### cycle sample ranges once
+    cycles_length = resp_features[['inspi_index', 'expi_index', 'next_inspi_index']].diff(axis=1)[['expi_index', 'next_inspi_index']].values.astype(np.int64)
+    n_cycles = cycles_length.shape[0]
+    start_inspi_init = int(resp_features['inspi_index'].values[0])
+
+    if stretch_TF_auto:
+        mean_cycle_duration = np.mean(resp_features[['inspi_duration', 'expi_duration']].values, axis=0)
+        inspi_ratio = mean_cycle_duration[0]/mean_cycle_duration.sum()
+    else:
+        inspi_ratio = ratio_stretch_TF
+
+    #### position of every template point inside its segment
+    point_phase = np.arange(nb_point_by_cycle) / nb_point_by_cycle
+    point_inspi = point_phase < inspi_ratio
+    frac_inspi, frac_expi = point_phase[point_inspi]/inspi_ratio, (point_phase[~point_inspi] - inspi_ratio)/(1 - inspi_ratio)
+
+    #### last sample kept by physio, points past it are extrapolated from the last two samples
+    stop_idx = start_inspi_init + cycles_length.sum() - 1
+
+    batch_size = int(np.clip(batch_mem // (n_cycles*nb_point_by_cycle*8*4), 1, n_surr))
+
+    for batch_start in range(0, n_surr, batch_size):
+
+        n_batch = min(batch_size, n_surr - batch_start)
+
+        #### shuffled lengths, (batch, cycle, inspi / expi)
+        shuffle = rng.permuted(np.tile(np.arange(n_cycles), (n_batch, 1)), axis=1)
+        length_surr = cycles_length[shuffle]
+
+        inspi_start = start_inspi_init + np.cumsum(length_surr.sum(axis=-1), axis=1) - length_surr.sum(axis=-1)
+        expi_start = inspi_start + length_surr[...,0]
+
+        idx_frac = np.concatenate((inspi_start[...,np.newaxis] + frac_inspi*length_surr[...,0:1], expi_start[...,np.newaxis] + frac_expi*length_surr[...,1:2]), axis=-1)
+
+        idx_low = idx_frac.astype(np.int64)
+        np.clip(idx_low, start_inspi_init, stop_idx-1, out=idx_low)
+        weight = idx_frac - idx_low
+
+        yield x[idx_low] + (x[idx_low+1] - x[idx_low])*weight
+
+
+
+#x, len_epoch, n_epoch, n_surr = x, data_cond.shape[-1], data_cond.shape[0], 1000
+def get_epoch_surrogates(x, len_epoch, n_epoch, n_surr, batch_mem=surr_block_mem, seed=None):
+
+    """
+    Yield blocks (surr_epochs, epoch_keep) of random epochs z-scored on themselves, 2*n_epoch draws per surrogate
+    surr_epochs (batch, 2*n_epoch, len_epoch) gathered from a strided view of x, window mean / std from prefix sums
+    epoch_keep (batch, 2*n_epoch) : the first n_epoch draws with no |z| >= 3
+    """
+
+    rng = np.random.default_rng(seed)
+
+    n_draw = n_epoch*2
+    x = np.asarray(x, dtype=dtype_acc)
+    x_windows = np.lib.stride_tricks.sliding_window_view(x, len_epoch)
+
+    #### window mean / std from prefix sums, centered against cancellation
+    x_centered = x - x.mean()
+    csum = np.concatenate(([0], np.cumsum(x_centered)))
+    csum_sq = np.concatenate(([0], np.cumsum(x_centered**2)))
+    win_mean = (csum[len_epoch:] - csum[:-len_epoch]) / len_epoch
+    win_std = np.sqrt(np.clip((csum_sq[len_epoch:] - csum_sq[:-len_epoch]) / len_epoch - win_mean**2, 0, None))
+    win_mean += x.mean()
+
+    batch_size = int(np.clip(batch_mem // (n_draw*len_epoch*8*3), 1, n_surr))
+
+    for batch_start in range(0, n_surr, batch_size):
+
+        n_batch = min(batch_size, n_surr - batch_start)
+
+        onsets = rng.integers(low=0, high=x.size-len_epoch, size=(n_batch, n_draw))
+
+        surr_epochs = x_windows[onsets]
+        surr_epochs -= win_mean[onsets][...,np.newaxis]
+        surr_epochs /= win_std[onsets][...,np.newaxis]
+
+        epoch_clean = (np.abs(surr_epochs) < 3).all(axis=-1)
+        epoch_keep = epoch_clean & (np.cumsum(epoch_clean, axis=1) <= n_epoch)
+
+        yield surr_epochs, epoch_keep
+
+
+
+#data, n_surr = data_chunk, 1000
+def get_circular_shift_surrogates(data, n_surr, mode='mean', batch_mem=surr_block_mem, seed=None):
+
+    """
+    Yield blocks of surrogates where every trial of data (trials, time) is rotated by its own random cut,
+    cut points drawn as one (batch, trials) matrix and all rotated trials gathered with one modular index
+    mode 'mean' : (batch, time) trial average of each surrogate, 'stack' : (batch, trials, time)
+    seed as int or sequence of ints (e.g. [sujet_i, chan_i]) for surrogates reproducible across processes
+    """
+
+    rng = np.random.default_rng(seed)
+
+    n_trials, n_times = data.shape
+    trial_idx = np.arange(n_trials)[np.newaxis,:,np.newaxis]
+    time_idx = np.arange(n_times)
+
+    batch_size = int(np.clip(batch_mem // (n_trials*n_times*8*2), 1, n_surr))
+
+    for batch_start in range(0, n_surr, batch_size):
+
+        n_batch = min(batch_size, n_surr - batch_start)
+
+        cuts = rng.integers(low=0, high=n_times, size=(n_batch, n_trials))
+        surr = data[trial_idx, (time_idx + cuts[...,np.newaxis]) % n_times]
+
+        if mode == 'mean':
+            yield surr.mean(axis=1)
+        elif mode == 'stack':
+            yield surr
+
+
+
 
 
 
@@ -881,17 +1293,18 @@ def shuffle_Cxy(x):
    return x_shift
 
 
+#### entropy sums stay in dtype_acc whatever the policy
 def Kullback_Leibler_Distance(a, b):
-    a = np.asarray(a, dtype=float)
-    b = np.asarray(b, dtype=float)
+    a = np.asarray(a, dtype=dtype_acc)
+    b = np.asarray(b, dtype=dtype_acc)
     return np.sum(np.where(a != 0, a * np.log(a / b), 0))
 
 def Shannon_Entropy(a):
-    a = np.asarray(a, dtype=float)
+    a = np.asarray(a, dtype=dtype_acc)
     return - np.sum(np.where(a != 0, a * np.log(a), 0))
 
 def Modulation_Index(distrib, show=False, verbose=False):
-    distrib = np.asarray(distrib, dtype = float)
+    distrib = np.asarray(distrib, dtype = dtype_acc)
     
     if verbose:
         if np.sum(distrib) != 1:
@@ -920,7 +1333,7 @@ def Modulation_Index(distrib, show=False, verbose=False):
     return mi
 
 def Shannon_MI(a):
-    a = np.asarray(a, dtype = float)
+    a = np.asarray(a, dtype = dtype_acc)
     N = a.size
     kl_divergence_shannon = np.log(N) - Shannon_Entropy(a)
     return kl_divergence_shannon / np.log(N)
@@ -945,42 +1358,224 @@ def get_MVL(x):
 
 
 
-def get_MI_2sig(x, y):
+#distrib = distrib
+def get_MI_vec(distrib):
 
-    #### Freedman and Diaconis rule
-    nbins_x = int(np.ceil((x.max() - x.min()) / (2 * scipy.stats.iqr(x)*(x.size**(-1/3)))))
-    nbins_y = int(np.ceil((y.max() - y.min()) / (2 * scipy.stats.iqr(y)*(y.size**(-1/3)))))
+    """
+    Modulation_Index along the last axis, KL to the uniform distrib / log(n_bins)
+    """
 
-    #### compute proba
-    hist_x = np.histogram(x,bins = nbins_x)[0]
-    hist_x = hist_x/np.sum(hist_x)
-    hist_y = np.histogram(y,bins = nbins_y)[0]
-    hist_y = hist_y/np.sum(hist_y)
+    distrib = np.asarray(distrib, dtype=dtype_acc)
+    N = distrib.shape[-1]
 
-    hist_2d = np.histogram2d(x, y, bins=[nbins_x, nbins_y])[0]
-    hist_2d = hist_2d / np.sum(hist_2d)
+    plogp = np.where(distrib > 0, distrib * np.log(np.where(distrib > 0, distrib, 1)), 0)
 
-    #### compute MI
-    E_x = 0
-    E_y = 0
-    E_x_y = 0
+    return (np.log(N) + plogp.sum(axis=-1)) / np.log(N)
 
-    for p in hist_x:
-        if p!=0 :
-            E_x += -p*np.log2(p)
 
-    for p in hist_y:
-        if p!=0 :
-            E_y += -p*np.log2(p)
 
-    for p0 in hist_2d:
-        for p in p0 :
-            if p!=0 :
-                E_x_y += -p*np.log2(p)
+#distrib = distrib
+def get_MVL_vec(distrib):
 
-    MI = E_x+E_y-E_x_y
+    """
+    get_MVL along the last axis
+    """
 
-    return MI
+    _phase = np.arange(0, distrib.shape[-1])*2*np.pi/distrib.shape[-1]
+
+    return np.abs(np.mean(distrib * np.exp(1j*_phase), axis=-1))
+
+
+
+#resp_features, n_times = respfeatures[cond], data.shape[-1]
+def get_resp_phase(resp_features, n_times, srate):
+
+    """
+    Respiratory phase (time) in [0, 2pi), 0 at inspi onset and 2pi*inspi_ratio at expi onset, linear within each segment,
+    same segment ratio as stretch_data, NaN outside the cycles
+    """
+
+    cycle_times = resp_features[['inspi_time', 'expi_time', 'next_inspi_time']].values
+    mean_cycle_duration = np.mean(resp_features[['inspi_duration', 'expi_duration']].values, axis=0)
+
+    if stretch_TF_auto:
+        inspi_ratio = mean_cycle_duration[0]/mean_cycle_duration.sum()
+    else:
+        inspi_ratio = ratio_stretch_TF
+
+    times = np.arange(n_times)/srate
+
+    cycle_i = np.searchsorted(cycle_times[:,0], times, side='right') - 1
+    in_cycle = (cycle_i >= 0) & (times < cycle_times[np.clip(cycle_i, 0, None), 2])
+    cycle_i = np.clip(cycle_i, 0, None)
+
+    inspi, expi, next_inspi = cycle_times[cycle_i,0], cycle_times[cycle_i,1], cycle_times[cycle_i,2]
+
+    cycle_pos = np.where(times < expi, inspi_ratio*(times - inspi)/(expi - inspi), inspi_ratio + (1 - inspi_ratio)*(times - expi)/(next_inspi - expi))
+
+    return np.where(in_cycle, 2*np.pi*cycle_pos, np.nan)
+
+
+
+
+#x, resp_features = data, respfeatures[cond]
+def get_resp_phase_binned(x, resp_features, srate, n_bins=pac_n_bins, bin_edges=None, batch_mem=perm_batch_mem):
+
+    """
+    Mean, variance and counts of x (..., time) per respiratory phase bin, the O(N) alternative to stretch_data / stretch_data_tf
+    when only phase bins are needed : phase of every sample from get_resp_phase, then np.bincount over the flattened
+    (row, bin) index, rows in chunks bounded by batch_mem, samples outside the cycles left out, complex x binned on real / imag
+    bin_edges in cycle fraction [0, 1] (e.g. I, T_IE, E, T_EI windows) instead of n_bins uniform bins
+    returns mean, var (..., n_bins) and counts (n_bins)
+    """
+
+    n_times = x.shape[-1]
+    phase = get_resp_phase(resp_features, n_times, srate) / (2*np.pi)
+
+    if bin_edges is None:
+        bin_edges = np.linspace(0, 1, n_bins+1)
+
+    n_bins = len(bin_edges) - 1
+
+    #### samples out of the cycles or of the edges go to the extra bin n_bins
+    bin_idx = np.full(n_times, n_bins)
+    valid = np.isfinite(phase)
+    bin_idx[valid] = np.searchsorted(bin_edges, phase[valid], side='right') - 1
+    bin_idx[(bin_idx < 0) | (bin_idx >= n_bins)] = n_bins
+
+    counts = np.bincount(bin_idx, minlength=n_bins+1)
+
+    rows = x.reshape(-1, n_times)
+    n_rows = rows.shape[0]
+
+    mean = np.zeros((n_rows, n_bins), dtype=np.complex128 if np.iscomplexobj(x) else dtype_acc)
+    var = np.zeros((n_rows, n_bins))
+
+    chunk_size = int(np.clip(batch_mem // (n_times*8*4), 1, n_rows))
+
+    for chunk_start in range(0, n_rows, chunk_size):
+
+        chunk = rows[chunk_start:chunk_start+chunk_size]
+        idx = (bin_idx + (n_bins+1)*np.arange(chunk.shape[0]).reshape(-1,1)).reshape(-1)
+
+        def _binned_sum(weights):
+            return np.bincount(idx, weights=weights.reshape(-1), minlength=chunk.shape[0]*(n_bins+1)).reshape(-1, n_bins+1)
+
+        #### two passes, variance on the centered samples
+        if np.iscomplexobj(chunk):
+            chunk_mean = (_binned_sum(chunk.real) + 1j*_binned_sum(chunk.imag)) / np.maximum(counts, 1)
+            chunk_var = _binned_sum(np.abs(chunk - np.take_along_axis(chunk_mean, np.broadcast_to(bin_idx, chunk.shape), axis=1))**2) / np.maximum(counts - 1, 1)
+        else:
+            chunk_mean = _binned_sum(chunk) / np.maximum(counts, 1)
+            chunk_var = _binned_sum((chunk - np.take_along_axis(chunk_mean, np.broadcast_to(bin_idx, chunk.shape), axis=1))**2) / np.maximum(counts - 1, 1)
+
+        mean[chunk_start:chunk_start+chunk_size] = chunk_mean[:,:n_bins]
+        var[chunk_start:chunk_start+chunk_size] = chunk_var[:,:n_bins]
+
+    counts = counts[:n_bins]
+    mean[:, counts == 0], var[:, counts < 2] = np.nan, np.nan
+
+    if debug:
+
+        plt.plot((bin_edges[:-1] + bin_edges[1:])/2, np.real(mean).mean(axis=0))
+        plt.show()
+
+    return mean.reshape(x.shape[:-1] + (n_bins,)), var.reshape(x.shape[:-1] + (n_bins,)), counts
+
+
+
+#phase, amp, n_surr = phase, amp, n_surr_pac
+def get_pac_surr(phase, amp, n_surr, n_bins=pac_n_bins, batch_mem=perm_batch_mem, seed=None):
+
+    """
+    Phase binned amplitude distributions of amp (n_amp, time) on one phase (time), MI and MVL vectorized over the amp rows
+    observed bins from one np.bincount, NaN phase left out
+    surrogates shift amp circularly against phase as shuffle_sig, the binned sums of every possible shift are one circular
+    cross-correlation of each amp row with each bin indicator (rfft), surrogates only gather n_surr random shifts
+    returns distrib (n_amp, n_bins), MI, MVL (n_amp) and MI_surr, MVL_surr (n_amp, n_surr)
+    """
+
+    rng = np.random.default_rng(seed)
+
+    amp = np.asarray(amp, dtype=dtype_acc).reshape(-1, phase.size)
+    n_amp, n_times = amp.shape
+
+    bin_idx = np.full(n_times, n_bins)
+    valid = np.isfinite(phase)
+    bin_idx[valid] = np.clip(((phase[valid] % (2*np.pi)) / (2*np.pi) * n_bins).astype(int), 0, n_bins-1)
+
+    counts = np.bincount(bin_idx, minlength=n_bins+1)[:n_bins]
+
+    #### observed
+    sums = np.bincount((bin_idx + (n_bins+1)*np.arange(n_amp).reshape(-1,1)).reshape(-1), weights=amp.reshape(-1),
+                       minlength=n_amp*(n_bins+1)).reshape(n_amp, n_bins+1)[:,:n_bins]
+
+    #### surrogates, shift k : sum_t amp[(t+k) % n_times] * (bin_idx[t] == b)
+    cuts = rng.integers(low=0, high=n_times, size=n_surr)
+    bins_fft = np.conj(np.fft.rfft(bin_idx == np.arange(n_bins).reshape(-1,1), axis=-1))
+    sums_surr = np.zeros((n_amp, n_bins, n_surr))
+
+    chunk_size = int(np.clip(batch_mem // (n_bins*n_times*8*3), 1, n_amp))
+
+    for chunk_start in range(0, n_amp, chunk_size):
+
+        amp_fft = np.fft.rfft(amp[chunk_start:chunk_start+chunk_size], axis=-1)
+        sums_surr[chunk_start:chunk_start+chunk_size] = np.fft.irfft(amp_fft[:,np.newaxis,:] * bins_fft, n=n_times, axis=-1)[...,cuts]
+
+    #### mean amplitude per bin, normalized
+    distrib = np.where(counts > 0, sums / np.maximum(counts, 1), 0)
+    distrib /= distrib.sum(axis=-1, keepdims=True)
+
+    distrib_surr = np.where(counts.reshape(-1,1) > 0, sums_surr / np.maximum(counts, 1).reshape(-1,1), 0)
+    distrib_surr /= distrib_surr.sum(axis=1, keepdims=True)
+    distrib_surr = distrib_surr.transpose(0,2,1)
+
+    if debug:
+
+        Modulation_Index(distrib[0], show=True)
+        plt.show()
+
+    return distrib, get_MI_vec(distrib), get_MVL_vec(distrib), get_MI_vec(distrib_surr), get_MVL_vec(distrib_surr)
+
+
+
+
+def get_MI_2sig(x, y):
+
+    #### Freedman and Diaconis rule
+    nbins_x = int(np.ceil((x.max() - x.min()) / (2 * scipy.stats.iqr(x)*(x.size**(-1/3)))))
+    nbins_y = int(np.ceil((y.max() - y.min()) / (2 * scipy.stats.iqr(y)*(y.size**(-1/3)))))
+
+    #### compute proba
+    hist_x = np.histogram(x,bins = nbins_x)[0]
+    hist_x = hist_x/np.sum(hist_x)
+    hist_y = np.histogram(y,bins = nbins_y)[0]
+    hist_y = hist_y/np.sum(hist_y)
+
+    hist_2d = np.histogram2d(x, y, bins=[nbins_x, nbins_y])[0]
+    hist_2d = hist_2d / np.sum(hist_2d)
+
+    #### compute MI
+    E_x = 0
+    E_y = 0
+    E_x_y = 0
+
+    for p in hist_x:
+        if p!=0 :
+            E_x += -p*np.log2(p)
+
+    for p in hist_y:
+        if p!=0 :
+            E_y += -p*np.log2(p)
+
+    for p0 in hist_2d:
+        for p in p0 :
+            if p!=0 :
+                E_x_y += -p*np.log2(p)
+
+    MI = E_x+E_y-E_x_y
+
+    return MI
 
 
 
@@ -1062,124 +1657,339 @@ def rscore_mat(x):
 
 
 
+#### online median
+#chunk_iter = (np.log10(tf[:,chunk]) for chunk in chunk_list)
+def get_online_median(chunk_iter, lo, hi, n_bins):
+
+    """
+    Row wise median of a (rows, time) signal given chunk by chunk along time,
+    counts are accumulated in one histogram per row with a single bincount over (row, bin) indices
+    and the median is interpolated inside the bin crossing half of the counts
+    """
+
+    n_rows = lo.size
+    width = (hi - lo) / n_bins
+    width[width == 0] = 1
+    row_offset = np.arange(n_rows).reshape(-1,1) * n_bins
+
+    counts = np.zeros(n_rows*n_bins, dtype=np.int64)
+
+    for x in chunk_iter:
+
+        bin_i = np.clip(((x - lo.reshape(-1,1)) / width.reshape(-1,1)).astype('int'), 0, n_bins-1)
+        counts += np.bincount((bin_i + row_offset).reshape(-1), minlength=n_rows*n_bins)
+
+    counts = counts.reshape(n_rows, n_bins)
+    counts_cum = np.cumsum(counts, axis=1)
+    half = counts_cum[:,-1] / 2
+
+    row_i = np.arange(n_rows)
+    bin_median = np.argmax(counts_cum >= half.reshape(-1,1), axis=1)
+    counts_before = np.where(bin_median > 0, counts_cum[row_i, bin_median-1], 0)
+    frac = (half - counts_before) / counts[row_i, bin_median]
+
+    return lo + (bin_median + frac) * width
+
+
+
+#tf = tf_conv[chan_i,:,:]
+def get_baseline_stats(tf, robust_mode=baseline_robust_mode, n_bins=baseline_n_bins, chunk_size=baseline_chunk_size):
+
+    """
+    Baseline statistics of a (freq, time) power map along time, returned as (freq, stat) with stat ordered as baseline_stat_list
+    mean and std come from float64 running sums, median and mad from online histograms in log power
+    when robust_mode == 'online' so the map is never sorted
+    """
+
+    n_freq, n_time = tf.shape
+    chunk_list = [slice(start, start+chunk_size) for start in range(0, n_time, chunk_size)]
+
+    #### first pass : sums and range
+    _sum = np.zeros(n_freq, dtype=dtype_acc)
+    _sum_sq = np.zeros(n_freq, dtype=dtype_acc)
+    _min = np.full(n_freq, np.inf)
+    _max = np.full(n_freq, -np.inf)
+
+    for chunk in chunk_list:
+
+        x = tf[:,chunk].astype(dtype_acc)
+        _sum += x.sum(axis=1)
+        _sum_sq += (x**2).sum(axis=1)
+        _min = np.minimum(_min, x.min(axis=1))
+        _max = np.maximum(_max, x.max(axis=1))
+
+    mean = _sum / n_time
+    std = np.sqrt(np.clip(_sum_sq / n_time - mean**2, 0, None))
+
+    #### robust stats
+    if robust_mode == 'exact':
+
+        median = np.median(tf, axis=1)
+        mad = np.median(np.abs(tf - median.reshape(-1,1)), axis=1)
+
+    elif robust_mode == 'online':
+
+        eps = np.finfo(np.float64).tiny
+        log_lo, log_hi = np.log10(np.clip(_min, eps, None)), np.log10(np.clip(_max, eps, None))
+        median = 10**get_online_median((np.log10(np.clip(tf[:,chunk], eps, None)) for chunk in chunk_list), log_lo, log_hi, n_bins)
+
+        dev_max = np.maximum(_max - median, median - _min)
+        log_hi = np.log10(np.clip(dev_max, eps, None))
+        log_lo = log_hi - 8
+        mad = 10**get_online_median((np.log10(np.clip(np.abs(tf[:,chunk] - median.reshape(-1,1)), eps, None)) for chunk in chunk_list), log_lo, log_hi, n_bins)
+
+    baseline_stats = {'mean' : mean, 'std' : std, 'median' : median, 'mad' : mad}
+
+    return np.stack([baseline_stats[stat] for stat in baseline_stat_list], axis=-1)
+
+
+
+#sujet = sujet_list[0]
+def load_baselines(sujet):
+
+    """
+    (chan, freq, stat) baselines for chan_list_eeg_short with stat ordered as baseline_stat_list,
+    read from the numpy file of precompute_baselines, or from the legacy netcdf when it is missing,
+    never written here since the numpy file is the marker precompute_baselines skips on
+    """
+
+    path_baselines = os.path.join(path_precompute, sujet, 'baselines')
+
+    if os.path.exists(os.path.join(path_baselines, f'{sujet}_baselines.npy')):
+
+        baselines = np.load(os.path.join(path_baselines, f'{sujet}_baselines.npy'))
+
+    else:
+
+        xr_baselines = xr.open_dataarray(os.path.join(path_baselines, f'{sujet}_baselines.nc'))
+        baselines = xr_baselines.loc[chan_list_eeg_short, :, baseline_stat_list].values.astype(np.float32)
+
+    return baselines
+
+
+
 #tf_conv = tf_median_cycle[nchan, :, :]
 def norm_tf(sujet, tf_conv, norm_method):
 
-    path_source = os.getcwd()
-
-    chan_list_sel = chan_list_eeg_short
+    """
+    Normalize a (chan, freq, time) TF for chan_list_eeg_short, one broadcast over the whole tensor
+    """
 
     if norm_method not in ['rscore', 'zscore']:
 
         #### load baseline
-        os.chdir(os.path.join(path_precompute, sujet, 'baselines'))
-
-        baselines = xr.open_dataarray(f'{sujet}_baselines.nc')
+        baselines = load_baselines(sujet)
+        baselines = {stat : baselines[:,:,stat_i][:,:,np.newaxis] for stat_i, stat in enumerate(baseline_stat_list)}
 
     if norm_method == 'dB':
 
-        for n_chan_i, n_chan in enumerate(chan_list_sel):
-
-            tf_conv[n_chan_i,:,:] = 10*np.log10(tf_conv[n_chan_i,:,:] / baselines.loc[n_chan, :, 'median'].values.reshape(-1,1))
+        tf_conv[:] = 10*np.log10(tf_conv / baselines['median'])
 
     if norm_method == 'zscore_baseline':
 
-        for n_chan_i, n_chan in enumerate(chan_list_sel):
-
-            tf_conv[n_chan_i,:,:] = (tf_conv[n_chan_i,:,:] - baselines.loc[n_chan,:,'mean'].values.reshape(-1,1)) / baselines.loc[n_chan,:,'std'].values.reshape(-1,1)
+        tf_conv[:] = (tf_conv - baselines['mean']) / baselines['std']
                 
     if norm_method == 'rscore_baseline':
 
-        for n_chan_i, n_chan in enumerate(chan_list_sel):
-
-            tf_conv[n_chan_i,:,:] = (tf_conv[n_chan_i,:,:] - baselines.loc[n_chan,:,'median'].values.reshape(-1,1)) * 0.6745 / baselines.loc[n_chan,:,'mad'].values.reshape(-1,1)
+        tf_conv[:] = (tf_conv - baselines['median']) * 0.6745 / baselines['mad']
 
     if norm_method == 'zscore':
 
-        for n_chan_i, n_chan in enumerate(chan_list_sel):
-
-            tf_conv[n_chan_i,:,:] = zscore_mat(tf_conv[n_chan_i,:,:])
+        tf_conv[:] = (tf_conv - tf_conv.mean(axis=-1, keepdims=True)) / tf_conv.std(axis=-1, keepdims=True)
                 
     if norm_method == 'rscore':
 
-        for n_chan_i, n_chan in enumerate(chan_list_sel):
-
-            tf_conv[n_chan_i,:,:] = rscore_mat(tf_conv[n_chan_i,:,:])
+        tf_median = np.median(tf_conv, axis=-1, keepdims=True)
+        tf_mad = np.median(np.abs(tf_conv - tf_median), axis=-1, keepdims=True)
 
+        tf_conv[:] = (tf_conv - tf_median) * 0.6745 / tf_mad
 
     #### verify baseline
-    if debug:
+    if debug and norm_method not in ['rscore', 'zscore']:
 
         nchan = 0
-        nchan_name = chan_list_sel[nchan]
 
         fig, axs = plt.subplots(ncols=2)
         axs[0].set_title('mean std')
-        axs[0].plot(baselines.loc[nchan_name,:,'mean'], label='mean')
-        axs[0].plot(baselines.loc[nchan_name,:,'std'], label='std')
+        axs[0].plot(baselines['mean'][nchan,:,0], label='mean')
+        axs[0].plot(baselines['std'][nchan,:,0], label='std')
         axs[0].legend()
         axs[0].set_yscale('log')
         axs[1].set_title('median mad')
-        axs[1].plot(baselines.loc[nchan_name,:,'median'], label='median')
-        axs[1].plot(baselines.loc[nchan_name,:,'mad'], label='mad')
+        axs[1].plot(baselines['median'][nchan,:,0], label='median')
+        axs[1].plot(baselines['mad'][nchan,:,0], label='mad')
         axs[1].legend()
         axs[1].set_yscale('log')
         plt.show()
 
-        tf_test = tf_conv[nchan,:,:int(tf_conv.shape[-1]/10)].copy()
-
-        fig, axs = plt.subplots(nrows=6)
-        fig.set_figheight(10)
-        fig.set_figwidth(15)
-
-        percentile_sel = 0
-
-        vmin = np.percentile(tf_test.reshape(-1),percentile_sel)
-        vmax = np.percentile(tf_test.reshape(-1),100-percentile_sel)
-        im = axs[0].pcolormesh(tf_test, vmin=vmin, vmax=vmax)
-        axs[0].set_title('raw')
-        fig.colorbar(im, ax=axs[0])
-
-        tf_baseline = 10*np.log10(tf_test / baselines.loc[chan_list_eeg[nchan], :, 'median'].values.reshape(-1,1))
-        vmin = np.percentile(tf_baseline.reshape(-1),percentile_sel)
-        vmax = np.percentile(tf_baseline.reshape(-1),100-percentile_sel)
-        im = axs[1].pcolormesh(tf_baseline, vmin=vmin, vmax=vmax)
-        axs[1].set_title('db')
-        fig.colorbar(im, ax=axs[1])
-
-        tf_baseline = (tf_test - baselines.loc[chan_list_eeg[nchan],:,'mean'].values.reshape(-1,1)) / baselines.loc[chan_list_eeg[nchan],:,'std'].values.reshape(-1,1)
-        vmin = np.percentile(tf_baseline.reshape(-1),percentile_sel)
-        vmax = np.percentile(tf_baseline.reshape(-1),100-percentile_sel)
-        im = axs[2].pcolormesh(tf_baseline, vmin=vmin, vmax=vmax)
-        axs[2].set_title('zscore')
-        fig.colorbar(im, ax=axs[2])
-
-        tf_baseline = (tf_test - baselines.loc[chan_list_eeg[nchan],:,'median'].values.reshape(-1,1)) / baselines.loc[chan_list_eeg[nchan],:,'mad'].values.reshape(-1,1)
-        vmin = np.percentile(tf_baseline.reshape(-1),percentile_sel)
-        vmax = np.percentile(tf_baseline.reshape(-1),100-percentile_sel)
-        im = axs[3].pcolormesh(tf_baseline, vmin=vmin, vmax=vmax)
-        axs[3].set_title('rscore')
-        fig.colorbar(im, ax=axs[3])
-
-        tf_baseline = zscore_mat(tf_test)
-        vmin = np.percentile(tf_baseline.reshape(-1),percentile_sel)
-        vmax = np.percentile(tf_baseline.reshape(-1),100-percentile_sel)
-        im = axs[4].pcolormesh(tf_baseline, vmin=vmin, vmax=vmax)
-        axs[4].set_title('zscore_mat')
-        fig.colorbar(im, ax=axs[4])
-
-        tf_baseline = rscore_mat(tf_test)
-        vmin = np.percentile(tf_baseline.reshape(-1),percentile_sel)
-        vmax = np.percentile(tf_baseline.reshape(-1),100-percentile_sel)
-        im = axs[5].pcolormesh(tf_baseline, vmin=vmin, vmax=vmax)
-        axs[5].set_title('rscore_mat')
-        fig.colorbar(im, ax=axs[5])
+    return tf_conv
 
-        plt.show()
 
-    os.chdir(path_source)
 
-    return tf_conv
+
+
+
+################################
+######## TF STORE ########
+################################
+
+
+
+def get_tf_store_path():
+
+    return os.path.join(path_precompute, 'TF', tf_store_file)
+
+
+
+#### sources in (cond, sujet) order
+def get_tf_store_sources():
+
+    return [os.path.join(path_precompute, 'TF', 'STRETCH', f'{sujet}_{cond}_tf_stretch.npy') for cond in cond_list for sujet in sujet_list]
+
+
+
+def is_tf_store_fresh():
+
+    """
+    True when the store exists for sujet_list and tf_store_version and no tf_stretch .npy changed since it was built,
+    the latest source mtime is kept as a store attribute
+    """
+
+    path_store = get_tf_store_path()
+
+    if os.path.exists(path_store) == False:
+        return False
+
+    source_mtime = max([os.path.getmtime(path) for path in get_tf_store_sources()])
+
+    with h5py.File(path_store, 'r') as f:
+
+        return (f['sujet'].asstr()[:].tolist() == list(sujet_list) and f.attrs.get('version') == tf_store_version
+                and f.attrs.get('source_mtime') == source_mtime)
+
+
+
+def compile_tf_store():
+
+    """
+    Gather every {sujet}_{cond}_tf_stretch.npy in one (cond, chan, sujet, freq, phase) store,
+    chunked so that one chan for all sujet is one contiguous read
+    rebuilt whenever is_tf_store_fresh is False, written to a temporary file then moved so a killed run leaves no store
+    """
+
+    path_store = get_tf_store_path()
+
+    if is_tf_store_fresh():
+        print('TF STORE ALREADY COMPUTED')
+        return
+
+    print('#### COMPILE TF STORE ####')
+
+    #### mtime taken before reading, a source rewritten during the build leaves the store stale
+    source_mtime = max([os.path.getmtime(path) for path in get_tf_store_sources()])
+    path_tmp = f'{path_store}.tmp'
+
+    with h5py.File(path_tmp, 'w') as f:
+
+        tf_store = f.create_dataset('tf', shape=(len(cond_list), len(chan_list_eeg_short), len(sujet_list), nfrex, stretch_point_ERP), dtype=get_dtype('float'),
+                                    chunks=(1, 1, len(sujet_list), nfrex, stretch_point_ERP), compression=tf_store_compression)
+
+        f.create_dataset('cond', data=np.array(cond_list, dtype='S'))
+        f.create_dataset('chan', data=np.array(chan_list_eeg_short, dtype='S'))
+        f.create_dataset('sujet', data=np.array(sujet_list, dtype='S'))
+        f.create_dataset('freq', data=frex)
+        f.create_dataset('phase', data=np.arange(stretch_point_ERP)/stretch_point_ERP)
+
+        f.attrs['version'] = tf_store_version
+        f.attrs['source_mtime'] = source_mtime
+
+        #cond_i, cond = 0, cond_list[0]
+        for cond_i, cond in enumerate(cond_list):
+
+            print(cond)
+
+            #### every sujet read once, then each chan chunk written whole
+            tf_cond = zeros_policy((len(chan_list_eeg_short), len(sujet_list), nfrex, stretch_point_ERP))
+
+            for sujet_i, sujet in enumerate(sujet_list):
+
+                tf_cond[:, sujet_i, :, :] = np.load(os.path.join(path_precompute, 'TF', 'STRETCH', f'{sujet}_{cond}_tf_stretch.npy'))
+
+            for chan_i, chan in enumerate(chan_list_eeg_short):
+
+                tf_store[cond_i, chan_i, :, :, :] = tf_cond[chan_i, :, :, :]
+
+            del tf_cond
+
+    os.replace(path_tmp, path_store)
+
+
+
+#chan = chan_list_eeg_short[0]
+def load_tf_store_chan(chan, cond_sel=cond_list):
+
+    """
+    Read (cond, sujet, freq, phase) for one chan, one chunk per cond
+    """
+
+    chan_i = np.where(chan_list_eeg_short == chan)[0][0]
+
+    if is_tf_store_fresh() == False:
+        raise ValueError('TF store missing or older than the tf_stretch .npy, run compile_tf_store')
+
+    with h5py.File(get_tf_store_path(), 'r') as f:
+
+        cond_store = f['cond'].asstr()[:].tolist()
+        tf_chan = np.stack([f['tf'][cond_store.index(cond), chan_i, :, :, :] for cond in cond_sel])
+
+    return tf_chan
+
+
+
+def load_tf_store_lazy():
+
+    """
+    Lazy (cond, chan, sujet, freq, phase) view, dask if available else the h5py dataset
+    Caller closes the returned file
+    """
+
+    f = h5py.File(get_tf_store_path(), 'r')
+    tf = f['tf']
+
+    try:
+        import dask.array as da
+        tf = da.from_array(tf, chunks=tf.chunks)
+    except ImportError:
+        pass
+
+    return f, tf
+
+
+
+def get_tf_store_allsujet_median():
+
+    """
+    (cond, chan, freq, phase) median across sujet, chunk by chunk
+    """
+
+    f, tf = load_tf_store_lazy()
+
+    if isinstance(tf, h5py.Dataset):
+
+        tf_median = np.zeros((tf.shape[0], tf.shape[1], tf.shape[3], tf.shape[4]), dtype=tf.dtype)
+
+        for cond_i in range(tf.shape[0]):
+            for chan_i in range(tf.shape[1]):
+                tf_median[cond_i, chan_i, :, :] = np.median(tf[cond_i, chan_i, :, :, :], axis=0)
+
+    else:
+
+        import dask.array as da
+        tf_median = da.median(tf, axis=2).compute()
+
+    f.close()
+
+    return tf_median
 
 
 
@@ -1356,249 +2166,913 @@ def get_dHR(RRI_resample, srate_resample, f_RRI):
 #ecg_allcond[cond][odor_i], ecg_cR_allcond[cond][odor_i], prms_hrv
 def ecg_analysis_homemade(ecg_i, srate, srate_resample_hrv, fig_token=False):
 
-    #### load params
-    nwind_hrv, nfft_hrv, noverlap_hrv, win_hrv, f_RRI = get_params_hrv_homemade(srate_resample_hrv)
+    #### load params
+    nwind_hrv, nfft_hrv, noverlap_hrv, win_hrv, f_RRI = get_params_hrv_homemade(srate_resample_hrv)
+
+    #### load cR
+    ecg_cR = scipy.signal.find_peaks(ecg_i, distance=srate*0.5)[0]
+    ecg_cR = ecg_cR/srate
+
+    #### verif
+    if debug:
+        times = np.arange(ecg_i.shape[0])/srate
+        plt.plot(times, ecg_i)
+        plt.vlines(ecg_cR, ymin=np.min(ecg_i) ,ymax=np.max(ecg_i), colors='r')
+        plt.show()
+
+
+    #### initiate metrics names
+    res_list = ['HRV_MeanNN', 'HRV_SDNN', 'HRV_RMSSD', 'HRV_pNN50', 'HRV_LF', 'HRV_HF', 'HRV_LFHF', 'HRV_SD1', 'HRV_SD2', 'HRV_S', 'HRV_rCOV', 'HRV_MAD', 'HRV_MEDIAN']
+
+    #### RRI
+    RRI, RRI_resample, IFR = get_RRI_IFR(ecg_i, ecg_cR, srate, srate_resample_hrv)
+
+    HRV_MeanNN = np.mean(RRI)
+    
+    #### PSD
+    VLF, LF, HF = .04, .15, .4
+    AUC_LF, AUC_HF, LF_HF_ratio, hzPxx, Pxx = get_PSD_LF_HF(RRI_resample, srate_resample_hrv, nwind_hrv, nfft_hrv, noverlap_hrv, win_hrv, VLF, LF, HF)
+
+    #### descriptors
+    MeanNN, SDNN, RMSSD, NN50, pNN50, COV, mad, median = get_stats_descriptors(RRI)
+
+    #### poincarré
+    SD1, SD2, Tot_HRV = get_poincarre(RRI)
+
+    #### df
+    res_tmp = [HRV_MeanNN*1e3, SDNN*1e3, RMSSD, pNN50*100, AUC_LF/10, AUC_HF/10, LF_HF_ratio, SD1*1e3, SD2*1e3, Tot_HRV*1e6, COV, mad*1e3, median*1e3]
+    data_df = {}
+    for i, dv in enumerate(res_list):
+        data_df[dv] = [res_tmp[i]]
+
+    hrv_metrics_homemade = pd.DataFrame(data=data_df)
+
+    #### for figures
+
+    #### dHR
+    if fig_token:
+        fig_verif, fig_dHR = get_dHR(RRI_resample, srate_resample_hrv, f_RRI)
+
+    #### fig
+    if fig_token:
+        fig_RRI = get_fig_RRI_IFR(ecg_i, ecg_cR, RRI, IFR, srate, srate_resample_hrv)
+        fig_PSD = get_fig_PSD_LF_HF(Pxx, hzPxx, VLF, LF, HF) 
+        fig_poincarre = get_fig_poincarre(RRI)
+
+        fig_list = [fig_RRI, fig_PSD, fig_poincarre, fig_verif, fig_dHR]
+
+        plt.close('all')
+
+        return hrv_metrics_homemade, fig_list
+
+    else:
+
+        return hrv_metrics_homemade
+
+
+
+def get_hrv_metrics_win(RRI):
+
+    #### initiate metrics names
+    res_list = ['HRV_MeanNN', 'HRV_SDNN', 'HRV_RMSSD', 'HRV_pNN50', 'HRV_SD1', 'HRV_SD2', 'HRV_S', 'HRV_COV', 'HRV_MAD', 'HRV_MEDIAN']
+
+    HRV_MeanNN = np.mean(RRI)
+    
+    #### descriptors
+    MeanNN, SDNN, RMSSD, NN50, pNN50, COV, mad, median = get_stats_descriptors(RRI)
+
+    #### poincarré
+    SD1, SD2, Tot_HRV = get_poincarre(RRI)
+
+    #### df
+    res_tmp = [HRV_MeanNN*1e3, SDNN*1e3, RMSSD, pNN50*100, SD1*1e3, SD2*1e3, Tot_HRV*1e6, COV, mad*1e3, median*1e3]
+    data_df = {}
+    for i, dv in enumerate(res_list):
+        data_df[dv] = [res_tmp[i]]
+
+    hrv_metrics_homemade = pd.DataFrame(data=data_df)
+
+    return hrv_metrics_homemade
+
+
+
+########################################
+######## HRV METRICS HOMEMADE ######## 
+########################################
+
+
+
+def get_PSD_LF_HF(RRI_resample, prms_hrv, VLF, LF, HF):
+
+    srate_resample, nwind, nfft, noverlap, win = prms_hrv['srate_resample_hrv'], prms_hrv['nwind_hrv'], prms_hrv['nfft_hrv'], prms_hrv['noverlap_hrv'], prms_hrv['win_hrv']
+
+    # DETREND
+    RRI_detrend = RRI_resample-np.median(RRI_resample)
+
+    # FFT WELCH
+    hzPxx, Pxx = scipy.signal.welch(RRI_detrend, fs=srate_resample, window=win, nperseg=nwind, noverlap=noverlap, nfft=nfft)
+
+    AUC_LF = scipy.integrate.trapezoid(Pxx[(hzPxx>VLF) & (hzPxx<LF)])
+    AUC_HF = scipy.integrate.trapezoid(Pxx[(hzPxx>LF) & (hzPxx<HF)])
+    LF_HF_ratio = AUC_LF/AUC_HF
+
+    return AUC_LF, AUC_HF, LF_HF_ratio, hzPxx, Pxx
+
+
+
+def get_stats_descriptors(RRI) :
+
+    MeanNN = np.mean(RRI)
+
+    SDNN = np.std(RRI)
+
+    RMSSD = np.sqrt(np.mean((np.diff(RRI)*1e3)**2))
+
+    NN50 = np.abs(np.diff(RRI))*1e3
+    pNN50 = np.sum(NN50>50)/len(NN50)
+
+    mad = np.median( np.abs(RRI-np.median(RRI)) )
+    COV = mad / np.median(RRI)
+
+    median = np.median(RRI)
+
+    return MeanNN, SDNN, RMSSD, NN50, pNN50, COV, mad, median
+
+
+def get_poincarre(RRI):
+
+    SD1_val = (RRI[1:] - RRI[:-1])/np.sqrt(2)
+    SD2_val = (RRI[1:] + RRI[:-1])/np.sqrt(2)
+
+    SD1 = np.std(SD1_val)
+    SD2 = np.std(SD2_val)
+    Tot_HRV = SD1*SD2*np.pi
+
+    return SD1, SD2, Tot_HRV
+
+
+
+def get_hrv_metrics_homemade(cR_time, prms_hrv, analysis_time='5min'):
+
+    """
+    One cR series, computed by get_hrv_metrics_homemade_mat
+    """
+
+    return get_hrv_metrics_homemade_mat([cR_time], prms_hrv, analysis_time=analysis_time)
+
+
+
+
+
+
+########################################
+######## HRV METRICS VECTORIZED ########
+########################################
+
+
+
+#RRI_mat = np.array([RRI_A, RRI_B]), nan padded if series have different length
+def get_hrv_time_metrics_mat(RRI_mat):
+
+    RRI_mat = np.atleast_2d(RRI_mat)
+    RRI_diff = np.diff(RRI_mat, axis=1)
+
+    MeanNN = np.nanmean(RRI_mat, axis=1)
+    SDNN = np.nanstd(RRI_mat, axis=1)
+    RMSSD = np.sqrt(np.nanmean((RRI_diff*1e3)**2, axis=1))
+
+    NN50 = np.abs(RRI_diff)*1e3
+    pNN50 = np.sum(NN50 > 50, axis=1) / np.sum(~np.isnan(NN50), axis=1)
+
+    median = np.nanmedian(RRI_mat, axis=1)
+    mad = np.nanmedian(np.abs(RRI_mat - median.reshape(-1,1)), axis=1)
+    COV = mad / median
+
+    #### poincarre
+    SD1 = np.nanstd(RRI_diff/np.sqrt(2), axis=1)
+    SD2 = np.nanstd((RRI_mat[:,1:] + RRI_mat[:,:-1])/np.sqrt(2), axis=1)
+    Tot_HRV = SD1*SD2*np.pi
+
+    time_metrics = {'MeanNN' : MeanNN, 'SDNN' : SDNN, 'RMSSD' : RMSSD, 'pNN50' : pNN50, 'COV' : COV, 'MAD' : mad, 'MEDIAN' : median,
+                    'SD1' : SD1, 'SD2' : SD2, 'S' : Tot_HRV}
+
+    return time_metrics
+
+
+
+#RRI_resample_mat = (series, time) resampled RRI of same length
+def get_hrv_freq_metrics_mat(RRI_resample_mat, prms_hrv, VLF=.04, LF=.15, HF=.4):
+
+    srate_resample, nwind, nfft, noverlap, win = prms_hrv['srate_resample_hrv'], prms_hrv['nwind_hrv'], prms_hrv['nfft_hrv'], prms_hrv['noverlap_hrv'], prms_hrv['win_hrv']
+
+    RRI_resample_mat = np.atleast_2d(RRI_resample_mat)
+    RRI_detrend = RRI_resample_mat - np.median(RRI_resample_mat, axis=1).reshape(-1,1)
+
+    hzPxx, Pxx = scipy.signal.welch(RRI_detrend, fs=srate_resample, window=win, nperseg=nwind, noverlap=noverlap, nfft=nfft, axis=1)
+
+    AUC_LF = scipy.integrate.trapezoid(Pxx[:,(hzPxx>VLF) & (hzPxx<LF)], axis=1)
+    AUC_HF = scipy.integrate.trapezoid(Pxx[:,(hzPxx>LF) & (hzPxx<HF)], axis=1)
+
+    freq_metrics = {'LF' : AUC_LF, 'HF' : AUC_HF, 'LFHF' : AUC_LF/AUC_HF}
+
+    return freq_metrics
+
+
+
+#cR_time_list = [cR_time_A, cR_time_B]
+def get_hrv_metrics_homemade_mat(cR_time_list, prms_hrv, analysis_time='5min'):
+
+    """
+    Same metrics as get_hrv_metrics_homemade but for a list of cR series,
+    time and poincarre metrics are computed on a nan padded (series, RRI) matrix
+    and PSD on the stacked resampled RRI when series share the same length
+    """
+
+    #### get RRI
+    RRI_list = []
+    RRI_resample_list = []
+
+    for cR_time in cR_time_list:
+
+        cR_sec = cR_time/prms_hrv['srate']
+
+        if analysis_time == '3min':
+
+            cR_sec_mask = (cR_sec >= 60) & (cR_sec <= 240)
+            cR_sec = cR_sec[cR_sec_mask] - 60
+
+        RRI = np.diff(cR_sec)
+        RRI = np.insert(RRI, 0, np.median(RRI))
+
+        f = scipy.interpolate.interp1d(cR_sec, RRI, kind='quadratic', fill_value="extrapolate")
+        cR_sec_resample = np.arange(cR_sec[0], cR_sec[-1], 1/prms_hrv['srate_resample_hrv'])
+
+        RRI_list.append(RRI)
+        RRI_resample_list.append(f(cR_sec_resample))
+
+    RRI_mat = np.full((len(RRI_list), np.max([RRI.size for RRI in RRI_list])), np.nan)
+
+    for series_i, RRI in enumerate(RRI_list):
+        RRI_mat[series_i,:RRI.size] = RRI
+
+    #### time & poincarre
+    time_metrics = get_hrv_time_metrics_mat(RRI_mat)
+
+    #### PSD
+    if np.unique([RRI_resample.size for RRI_resample in RRI_resample_list]).size == 1:
+
+        freq_metrics = get_hrv_freq_metrics_mat(np.stack(RRI_resample_list), prms_hrv)
+
+    else:
+
+        freq_metrics = {'LF' : [], 'HF' : [], 'LFHF' : []}
+
+        for RRI_resample in RRI_resample_list:
+
+            _freq_metrics = get_hrv_freq_metrics_mat(RRI_resample, prms_hrv)
+
+            for metric in freq_metrics:
+                freq_metrics[metric].append(_freq_metrics[metric][0])
+
+        freq_metrics = {metric : np.array(val) for metric, val in freq_metrics.items()}
+
+    #### df
+    res_tmp = {'HRV_MeanNN' : time_metrics['MeanNN']*1e3, 'HRV_SDNN' : time_metrics['SDNN']*1e3, 'HRV_RMSSD' : time_metrics['RMSSD'], 'HRV_pNN50' : time_metrics['pNN50']*100,
+               'HRV_LF' : freq_metrics['LF']/10, 'HRV_HF' : freq_metrics['HF']/10, 'HRV_LFHF' : freq_metrics['LFHF'],
+               'HRV_SD1' : time_metrics['SD1']*1e3, 'HRV_SD2' : time_metrics['SD2']*1e3, 'HRV_S' : time_metrics['S']*1e6,
+               'HRV_COV' : time_metrics['COV'], 'HRV_MAD' : time_metrics['MAD'], 'HRV_MEDIAN' : time_metrics['MEDIAN']}
+
+    hrv_metrics_homemade = pd.DataFrame({dv : res_tmp[dv] for dv in prms_hrv['metric_list']})
+
+    return hrv_metrics_homemade
+
+
+
+#cR_time, win_size, step = cR_time, 60, 5 (sec)
+def get_hrv_metrics_sliding_win(cR_time, prms_hrv, win_size=60, step=5, VLF=.04, LF=.15, HF=.4):
+
+    """
+    HRV time series computed on sliding windows over the whole recording
+    time and poincarre metrics come from cumulative sums over RRI so each window is O(1),
+    LF/HF come from a hann windowed FFT of the resampled RRI, all windows in one rfft,
+    LF/HF rescaled to the Welch bins of get_hrv_metrics_homemade so both report the same columns on the same scale
+    """
+
+    #### RRI
+    cR_sec = cR_time/prms_hrv['srate']
+
+    RRI = np.diff(cR_sec)
+    RRI = np.insert(RRI, 0, np.median(RRI))
+    RRI_diff = np.diff(RRI)
+    RRI_sum = RRI[1:] + RRI[:-1]
+
+    #### windows in beats
+    win_start = np.arange(cR_sec[0], cR_sec[-1] - win_size, step)
+    win_center = win_start + win_size/2
+
+    beat_start = np.searchsorted(cR_sec, win_start, side='left')
+    beat_stop = np.searchsorted(cR_sec, win_start + win_size, side='left')
+
+    #### cumulative sums, float64 to avoid drift on long recordings
+    def _cumsum(x):
+        return np.concatenate(([0], np.cumsum(x, dtype=np.float64)))
+
+    cs_RRI, cs_RRI_sq = _cumsum(RRI), _cumsum(RRI**2)
+    cs_diff, cs_diff_sq = _cumsum(RRI_diff), _cumsum(RRI_diff**2)
+    cs_sum, cs_sum_sq = _cumsum(RRI_sum), _cumsum(RRI_sum**2)
+    cs_NN50 = _cumsum(np.abs(RRI_diff)*1e3 > 50)
+
+    def _win_mean_std(cs, cs_sq, start, stop):
+        n = stop - start
+        mean = (cs[stop] - cs[start]) / n
+        var = (cs_sq[stop] - cs_sq[start]) / n - mean**2
+        return mean, np.sqrt(np.clip(var, 0, None))
+
+    n_beats = beat_stop - beat_start
+    #### successive differences of the window are the pairs (i, i+1) with both beats inside
+    diff_stop = np.maximum(beat_stop - 1, beat_start)
+
+    MeanNN, SDNN = _win_mean_std(cs_RRI, cs_RRI_sq, beat_start, beat_stop)
+    _, SD1 = _win_mean_std(cs_diff/np.sqrt(2), cs_diff_sq/2, beat_start, diff_stop)
+    _, SD2 = _win_mean_std(cs_sum/np.sqrt(2), cs_sum_sq/2, beat_start, diff_stop)
+    RMSSD = np.sqrt((cs_diff_sq[diff_stop] - cs_diff_sq[beat_start]) / (diff_stop - beat_start)) * 1e3
+    pNN50 = (cs_NN50[diff_stop] - cs_NN50[beat_start]) / (diff_stop - beat_start)
+
+    #### PSD on resampled RRI
+    srate_resample = prms_hrv['srate_resample_hrv']
+    f = scipy.interpolate.interp1d(cR_sec, RRI, kind='quadratic', fill_value="extrapolate")
+    cR_sec_resample = np.arange(cR_sec[0], cR_sec[-1], 1/srate_resample)
+    RRI_resample = f(cR_sec_resample)
+
+    win_len = int(win_size*srate_resample)
+    win_start_resample = np.round((win_start - cR_sec[0])*srate_resample).astype('int')
+    win_start_resample = win_start_resample[win_start_resample + win_len <= RRI_resample.size]
+
+    RRI_win = np.lib.stride_tricks.sliding_window_view(RRI_resample, win_len)[win_start_resample,:]
+    RRI_win = RRI_win - np.median(RRI_win, axis=1).reshape(-1,1)
+
+    hann = scipy.signal.windows.hann(win_len)
+    hzPxx = np.fft.rfftfreq(win_len, d=1/srate_resample)
+    Pxx = np.abs(np.fft.rfft(RRI_win*hann, axis=1))**2 / (srate_resample * np.sum(hann**2))
+    Pxx[:,1:] *= 2
+
+    AUC_LF = np.full(win_start.size, np.nan)
+    AUC_HF = np.full(win_start.size, np.nan)
+    #### band power over the window freq step, expressed in Welch bins (nfft_hrv) as get_hrv_metrics_homemade
+    df, df_welch = hzPxx[1] - hzPxx[0], srate_resample / prms_hrv['nfft_hrv']
+    AUC_LF[:win_start_resample.size] = scipy.integrate.trapezoid(Pxx[:,(hzPxx>VLF) & (hzPxx<LF)], dx=df, axis=1) / df_welch
+    AUC_HF[:win_start_resample.size] = scipy.integrate.trapezoid(Pxx[:,(hzPxx>LF) & (hzPxx<HF)], dx=df, axis=1) / df_welch
+
+    #### df
+    res_tmp = {'HRV_MeanNN' : MeanNN*1e3, 'HRV_SDNN' : SDNN*1e3, 'HRV_RMSSD' : RMSSD, 'HRV_pNN50' : pNN50*100,
+               'HRV_LF' : AUC_LF/10, 'HRV_HF' : AUC_HF/10, 'HRV_LFHF' : AUC_LF/AUC_HF,
+               'HRV_SD1' : SD1*1e3, 'HRV_SD2' : SD2*1e3, 'HRV_S' : SD1*SD2*np.pi*1e6}
+
+    hrv_metrics_win = pd.DataFrame({'time' : win_center, 'n_beats' : n_beats})
+
+    for dv in prms_hrv['metric_list']:
+        if dv in res_tmp:
+            hrv_metrics_win[dv] = res_tmp[dv]
+
+    return hrv_metrics_win
+
+
+
+
+
+
+################################
+######## NEUROKIT ########
+################################
+
+#ecg_i = xr_chunk[sujet_i, cond_i, trial_i, :].data
+def nk_analysis(ecg_i, srate):
+
+    ecg_cR = scipy.signal.find_peaks(ecg_i, distance=srate*0.5)[0]
+    peaks_dict = {'ECG_R_Peaks' : ecg_cR}
+    ecg_peaks = pd.DataFrame(peaks_dict)
+
+    hrv_metrics = nk.hrv(ecg_peaks, sampling_rate=srate, show=False)
+
+    hrv_metrics_name = ['HRV_MeanNN', 'HRV_SDNN', 'HRV_RMSSD', 'HRV_pNN50', 'HRV_LF', 'HRV_HF', 'HRV_LFHF', 'HRV_SD1', 'HRV_SD2', 'HRV_S']
+
+    col_to_drop = []
+    col_hrv = list(hrv_metrics.columns.values) 
+    for metric_name in col_hrv :
+        if (metric_name in hrv_metrics_name) == False :
+            col_to_drop.append(metric_name)
+
+    hrv_metrics_short = hrv_metrics.copy()
+    hrv_metrics_short = hrv_metrics_short.drop(col_to_drop, axis=1)
+
+    return hrv_metrics_short
+
+
+
+
+########################################
+######## CLUSTER EXTRACTION ########
+########################################
+
+
+#ndim, connectivity = 2, 'full'
+def get_cluster_offsets(ndim, connectivity='full'):
+
+    """
+    Neighbour offsets, one per undirected edge : unit steps for 'face', every step in {-1,0,1}^ndim for 'full'
+    """
+
+    offsets = np.array(np.meshgrid(*[[-1, 0, 1]]*ndim, indexing='ij')).reshape(ndim, -1).T
+    offsets = offsets[np.abs(offsets).sum(axis=1) != 0]
+
+    if connectivity == 'face':
+        offsets = offsets[np.abs(offsets).sum(axis=1) == 1]
+
+    #### keep one direction per edge, first non zero step positive
+    first_nonzero = offsets[np.arange(offsets.shape[0]), np.argmax(offsets != 0, axis=1)]
+
+    return offsets[first_nonzero > 0]
+
+
+
+#mask, idx, offset = mask, idx, offsets[0]
+def get_shift_pairs(mask, idx, offset):
+
+    """
+    Voxel index of every (voxel, voxel + offset) pair that is True on both sides
+    """
+
+    sel_src, sel_dst = [], []
+
+    for step in offset:
+        if step >= 0:
+            sel_src.append(slice(0, None if step == 0 else -step))
+            sel_dst.append(slice(step, None))
+        else:
+            sel_src.append(slice(-step, None))
+            sel_dst.append(slice(0, step))
+
+    sel_src, sel_dst = tuple(sel_src), tuple(sel_dst)
+    both = mask[sel_src] & mask[sel_dst]
+
+    return idx[sel_src][both], idx[sel_dst][both]
+
+
+
+#mask = mask
+def get_cluster_labels(mask, adjacency=None, connectivity='full', batch=False):
+
+    """
+    Label connected clusters of a bool mask, 0 for background and 1..n_clusters
+    1d (time) and 2d (freq, time) : scipy.ndimage.label, 'full' matches the 8 connectivity of cv2
+    3d (chan, freq, time) with adjacency (chan, chan) bool : freq / time neighbours within chan and the same
+    (freq, time) point across adjacent chan, merged with sparse connected_components
+    batch=True : leading axis holds independent maps (surrogates), labels are unique across the batch
+    """
+
+    mask = np.asarray(mask, dtype='bool')
+    ndim_map = mask.ndim - int(batch)
+
+    if adjacency is None:
+
+        structure = scipy.ndimage.generate_binary_structure(ndim_map, ndim_map if connectivity == 'full' else 1)
+
+        if batch:
+            structure = np.stack([np.zeros_like(structure), structure, np.zeros_like(structure)])
+
+        labels, n_clusters = scipy.ndimage.label(mask, structure=structure)
+
+        return labels, n_clusters
+
+    #### graph over the True voxels
+    n_vox = mask.sum()
+    idx = np.full(mask.shape, -1, dtype=np.int64)
+    idx[mask] = np.arange(n_vox)
+
+    chan_axis = int(batch)
+    src_list, dst_list = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+
+    #### within chan neighbours
+    for offset in get_cluster_offsets(ndim_map-1, connectivity):
+
+        src, dst = get_shift_pairs(mask, idx, np.concatenate(([0]*(chan_axis+1), offset)))
+        src_list.append(src)
+        dst_list.append(dst)
+
+    #### across chan neighbours, same point
+    chan_A, chan_B = np.where(np.triu(adjacency, k=1))
+
+    for A, B in zip(chan_A, chan_B):
+
+        idx_A, idx_B = np.take(idx, A, axis=chan_axis), np.take(idx, B, axis=chan_axis)
+        both = (idx_A >= 0) & (idx_B >= 0)
+        src_list.append(idx_A[both])
+        dst_list.append(idx_B[both])
+
+    src, dst = np.concatenate(src_list), np.concatenate(dst_list)
+    graph = scipy.sparse.coo_matrix((np.ones(src.size, dtype='bool'), (src, dst)), shape=(n_vox, n_vox))
+    n_clusters, vox_labels = scipy.sparse.csgraph.connected_components(graph, directed=False)
+
+    labels = np.zeros(mask.shape, dtype=np.int64)
+    labels[mask] = vox_labels + 1
+
+    return labels, n_clusters
+
+
+
+#labels, n_clusters, stat = labels, n_clusters, obs_distrib
+def get_cluster_stats(labels, n_clusters, stat=None):
+
+    """
+    Size and summed stat (mass) of every cluster, one bincount each
+    """
+
+    labels_flat = labels.reshape(-1)
+    sizes = np.bincount(labels_flat, minlength=n_clusters+1)[1:]
+
+    if stat is None:
+        return sizes, None
+
+    mass = np.bincount(labels_flat, weights=np.broadcast_to(stat, labels.shape).reshape(-1), minlength=n_clusters+1)[1:]
+
+    return sizes, mass
+
+
+
+#labels, cluster_keep = labels, sizes >= min_size
+def filter_clusters(labels, cluster_keep):
+
+    """
+    Bool mask of the kept clusters, cluster_keep is one bool per cluster in label order
+    """
+
+    lookup = np.concatenate(([False], np.asarray(cluster_keep, dtype='bool')))
+
+    return lookup[labels]
+
+
+
+#chan_list = chan_list_eeg
+def get_chan_adjacency(chan_list, montage='standard_1020'):
+
+    """
+    Bool (chan, chan) neighbours of the montage used for topoplots, Delaunay triangulation from mne.channels.find_ch_adjacency
+    """
+
+    info = mne.create_info(list(chan_list), ch_types=['eeg']*len(chan_list), sfreq=srate)
+    info.set_montage(montage)
+
+    adjacency, adjacency_names = mne.channels.find_ch_adjacency(info, 'eeg')
+
+    return adjacency.toarray().astype('bool')
+
+
+
+
+
+
+########################################
+######## CLUSTER MASS PERMUTATION ########
+########################################
+
+
+#data_baseline, data_cond, n_surr = tf_stretch_baseline_allsujet, tf_stretch_cond_allsujet, 100
+def get_permutation_batches_2groups(data_baseline, data_cond, n_surr, mode_grouped='mean', design='between', batch_mem=perm_batch_mem, seed=None):
+
+    """
+    Yield (diff, tstat) for batches of label shuffled surrogates, shape (batch, *data.shape[1:])
+    mean : all surrogates of a batch from two matrix products with the 0/1 group assignment,
+    Welch t from the same sums, tstat is None for median
+    design='within' : paired rows, sign flips of the cond - baseline differences, one sample t, the sum of squares is flip invariant
+    """
+
+    rng = np.random.default_rng(seed)
+
+    if design == 'within':
+
+        n_pair = data_baseline.shape[0]
+        shape = data_baseline.shape[1:]
+
+        data_diff = (data_cond.astype(dtype_acc) - data_baseline.astype(dtype_acc)).reshape(n_pair, -1)
+        sum_sq = (data_diff**2).sum(axis=0)
+        batch_size = int(np.clip(batch_mem // (data_diff.shape[-1]*8*(3 if mode_grouped == 'mean' else n_pair)), 1, n_surr))
+
+        for batch_start in range(0, n_surr, batch_size):
+
+            n_batch = min(batch_size, n_surr - batch_start)
+            flips = rng.choice([-1., 1.], size=(n_batch, n_pair))
+
+            if mode_grouped == 'mean':
+
+                diff = flips @ data_diff / n_pair
+                tstat = diff / np.sqrt(np.clip(sum_sq - n_pair*diff**2, 0, None) / (n_pair - 1) / n_pair)
+
+                yield diff.reshape((n_batch,) + shape), tstat.reshape((n_batch,) + shape)
+
+            elif mode_grouped == 'median':
+
+                diff = np.median(flips[...,np.newaxis] * data_diff, axis=1)
+
+                yield diff.reshape((n_batch,) + shape), None
+
+        return
+
+    n_baseline, n_cond = data_baseline.shape[0], data_cond.shape[0]
+    n_tot = n_baseline + n_cond
+    shape = data_baseline.shape[1:]
+
+    data_shuffle = np.concatenate((data_baseline, data_cond), axis=0).reshape(n_tot, -1).astype(dtype_acc)
+    n_feat = data_shuffle.shape[-1]
+
+    if mode_grouped == 'mean':
+
+        #### centered to limit cancellation in the variance
+        data_shuffle = data_shuffle - data_shuffle.mean(axis=0)
+        data_shuffle_sq = data_shuffle**2
+        sum_tot, sum_sq_tot = data_shuffle.sum(axis=0), data_shuffle_sq.sum(axis=0)
+        batch_size = int(np.clip(batch_mem // (n_feat*8*8), 1, n_surr))
+
+    elif mode_grouped == 'median':
+
+        batch_size = int(np.clip(batch_mem // (n_tot*n_feat*8), 1, n_surr))
+
+    for batch_start in range(0, n_surr, batch_size):
+
+        n_batch = min(batch_size, n_surr - batch_start)
+        random_sel = rng.permuted(np.tile(np.arange(n_tot), (n_batch, 1)), axis=1)
+
+        if mode_grouped == 'mean':
+
+            assign_cond = np.zeros((n_batch, n_tot))
+            assign_cond[np.arange(n_batch).reshape(-1,1), random_sel[:,n_baseline:]] = 1
+
+            sum_cond, sum_sq_cond = assign_cond @ data_shuffle, assign_cond @ data_shuffle_sq
+            sum_baseline, sum_sq_baseline = sum_tot - sum_cond, sum_sq_tot - sum_sq_cond
+
+            mean_cond, mean_baseline = sum_cond / n_cond, sum_baseline / n_baseline
+            var_cond = np.clip(sum_sq_cond - n_cond*mean_cond**2, 0, None) / (n_cond - 1)
+            var_baseline = np.clip(sum_sq_baseline - n_baseline*mean_baseline**2, 0, None) / (n_baseline - 1)
+
+            diff = mean_cond - mean_baseline
+            tstat = diff / np.sqrt(var_cond/n_cond + var_baseline/n_baseline)
+
+            yield diff.reshape((n_batch,) + shape), tstat.reshape((n_batch,) + shape)
+
+        elif mode_grouped == 'median':
 
-    #### load cR
-    ecg_cR = scipy.signal.find_peaks(ecg_i, distance=srate*0.5)[0]
-    ecg_cR = ecg_cR/srate
+            diff = np.median(data_shuffle[random_sel[:,n_baseline:]], axis=1) - np.median(data_shuffle[random_sel[:,:n_baseline]], axis=1)
 
-    #### verif
-    if debug:
-        times = np.arange(ecg_i.shape[0])/srate
-        plt.plot(times, ecg_i)
-        plt.vlines(ecg_cR, ymin=np.min(ecg_i) ,ymax=np.max(ecg_i), colors='r')
-        plt.show()
+            yield diff.reshape((n_batch,) + shape), None
 
 
-    #### initiate metrics names
-    res_list = ['HRV_MeanNN', 'HRV_SDNN', 'HRV_RMSSD', 'HRV_pNN50', 'HRV_LF', 'HRV_HF', 'HRV_LFHF', 'HRV_SD1', 'HRV_SD2', 'HRV_S', 'HRV_rCOV', 'HRV_MAD', 'HRV_MEDIAN']
 
-    #### RRI
-    RRI, RRI_resample, IFR = get_RRI_IFR(ecg_i, ecg_cR, srate, srate_resample_hrv)
+#data_baseline, data_cond, n_surr = data_baseline, data_cond, n_surr
+def get_median_cluster_thresh(data_baseline, data_cond, n_surr, design='between', seed=None):
 
-    HRV_MeanNN = np.mean(RRI)
-    
-    #### PSD
-    VLF, LF, HF = .04, .15, .4
-    AUC_LF, AUC_HF, LF_HF_ratio, hzPxx, Pxx = get_PSD_LF_HF(RRI_resample, srate_resample_hrv, nwind_hrv, nfft_hrv, noverlap_hrv, win_hrv, VLF, LF, HF)
+    """
+    Cluster forming thresh of the median diff, 1-cluster_forming_alpha quantile of |diff| pooled over a pre-pass of
+    min(n_surr, cluster_median_thresh_n_surr) surrogates, a fixed count so it does not depend on perm_batch_mem,
+    pooling all n_surr would hold every surrogate in memory
+    """
 
-    #### descriptors
-    MeanNN, SDNN, RMSSD, NN50, pNN50, COV, mad, median = get_stats_descriptors(RRI)
+    abs_diff = [np.abs(diff) for diff, tstat in get_permutation_batches_2groups(data_baseline, data_cond, min(n_surr, cluster_median_thresh_n_surr), 
+                                                                                mode_grouped='median', design=design, seed=seed)]
 
-    #### poincarré
-    SD1, SD2, Tot_HRV = get_poincarre(RRI)
+    return np.percentile(np.concatenate(abs_diff), 100*(1 - cluster_forming_alpha))
 
-    #### df
-    res_tmp = [HRV_MeanNN*1e3, SDNN*1e3, RMSSD, pNN50*100, AUC_LF/10, AUC_HF/10, LF_HF_ratio, SD1*1e3, SD2*1e3, Tot_HRV*1e6, COV, mad*1e3, median*1e3]
-    data_df = {}
-    for i, dv in enumerate(res_list):
-        data_df[dv] = [res_tmp[i]]
 
-    hrv_metrics_homemade = pd.DataFrame(data=data_df)
 
-    #### for figures
+#stat, thresh, tail = tstat, thresh, 0
+def get_cluster_mass_batch(stat, thresh, tail=0, adjacency=None):
 
-    #### dHR
-    if fig_token:
-        fig_verif, fig_dHR = get_dHR(RRI_resample, srate_resample_hrv, f_RRI)
+    """
+    Max cluster mass of every map of a (batch, ...) stack, clusters of both signs for tail=0
+    """
 
-    #### fig
-    if fig_token:
-        fig_RRI = get_fig_RRI_IFR(ecg_i, ecg_cR, RRI, IFR, srate, srate_resample_hrv)
-        fig_PSD = get_fig_PSD_LF_HF(Pxx, hzPxx, VLF, LF, HF) 
-        fig_poincarre = get_fig_poincarre(RRI)
+    n_batch = stat.shape[0]
+    max_mass = np.zeros(n_batch)
 
-        fig_list = [fig_RRI, fig_PSD, fig_poincarre, fig_verif, fig_dHR]
+    sign_list = {0 : [1, -1], 1 : [1], -1 : [-1]}[tail]
 
-        plt.close('all')
+    for sign in sign_list:
 
-        return hrv_metrics_homemade, fig_list
+        labels, n_clusters = get_cluster_labels(sign*stat > thresh, adjacency=adjacency, batch=True)
 
-    else:
+        if n_clusters == 0:
+            continue
 
-        return hrv_metrics_homemade
+        mass = get_cluster_stats(labels, n_clusters, sign*stat)[1]
 
+        #### batch index of every cluster then max per batch
+        cluster_batch = np.zeros(n_clusters+1, dtype=np.int64)
+        cluster_batch[labels.reshape(n_batch, -1)] = np.arange(n_batch).reshape(-1,1)
+        np.maximum.at(max_mass, cluster_batch[1:], mass)
 
+    return max_mass
 
-def get_hrv_metrics_win(RRI):
 
-    #### initiate metrics names
-    res_list = ['HRV_MeanNN', 'HRV_SDNN', 'HRV_RMSSD', 'HRV_pNN50', 'HRV_SD1', 'HRV_SD2', 'HRV_S', 'HRV_COV', 'HRV_MAD', 'HRV_MEDIAN']
 
-    HRV_MeanNN = np.mean(RRI)
-    
-    #### descriptors
-    MeanNN, SDNN, RMSSD, NN50, pNN50, COV, mad, median = get_stats_descriptors(RRI)
+#stat, dh = tstat, dh
+def get_tfce(stat, dh, adjacency=None, E=tfce_E, H=tfce_H, tail=0, batch=False, batch_mem=perm_batch_mem):
 
-    #### poincarré
-    SD1, SD2, Tot_HRV = get_poincarre(RRI)
+    """
+    Signed threshold free cluster enhancement, sum over h = dh, 2dh, ... of extent(h)**E * h**H * dh
+    every threshold of the stack is labelled in one get_cluster_labels call (thresholds as extra batch axis),
+    extents come from one bincount and one lookup
+    fast path : maps cropped to the bounding box of the voxels above dh, steps stop at the max of the batch,
+    so low surrogates cost only their few supra threshold steps
+    """
 
-    #### df
-    res_tmp = [HRV_MeanNN*1e3, SDNN*1e3, RMSSD, pNN50*100, SD1*1e3, SD2*1e3, Tot_HRV*1e6, COV, mad*1e3, median*1e3]
-    data_df = {}
-    for i, dv in enumerate(res_list):
-        data_df[dv] = [res_tmp[i]]
+    if batch == False:
+        stat = stat[np.newaxis]
 
-    hrv_metrics_homemade = pd.DataFrame(data=data_df)
+    n_batch, map_shape = stat.shape[0], stat.shape[1:]
+    tfce = np.zeros(stat.shape)
 
-    return hrv_metrics_homemade
+    sign_list = {0 : [1, -1], 1 : [1], -1 : [-1]}[tail]
 
+    for sign in sign_list:
 
+        x = sign*stat
 
-########################################
-######## HRV METRICS HOMEMADE ######## 
-########################################
+        #### only steps below the max contribute, none when the max is under dh (zero tfce for that sign)
+        steps = np.arange(dh, x.max(), dh)
 
+        if steps.size == 0:
+            continue
 
+        #### crop, chan axis kept whole with adjacency
+        above = (x > steps[0]).any(axis=0)
+        sel = []
+        for axis in range(above.ndim):
+            if adjacency is not None and axis == 0:
+                sel.append(slice(None))
+                continue
+            axis_i = np.where(above.any(axis=tuple(a for a in range(above.ndim) if a != axis)))[0]
+            sel.append(slice(axis_i[0], axis_i[-1]+1))
+        sel = (slice(None),) + tuple(sel)
 
-def get_PSD_LF_HF(RRI_resample, prms_hrv, VLF, LF, HF):
+        x_crop = x[sel]
+        tfce_crop = np.zeros(x_crop.shape)
 
-    srate_resample, nwind, nfft, noverlap, win = prms_hrv['srate_resample_hrv'], prms_hrv['nwind_hrv'], prms_hrv['nfft_hrv'], prms_hrv['noverlap_hrv'], prms_hrv['win_hrv']
+        #### threshold stack in chunks bounded by batch_mem
+        step_chunk = int(np.clip(batch_mem // (x_crop.size*8*3), 1, steps.size))
 
-    # DETREND
-    RRI_detrend = RRI_resample-np.median(RRI_resample)
+        for step_start in range(0, steps.size, step_chunk):
 
-    # FFT WELCH
-    hzPxx, Pxx = scipy.signal.welch(RRI_detrend, fs=srate_resample, window=win, nperseg=nwind, noverlap=noverlap, nfft=nfft)
+            h = steps[step_start:step_start+step_chunk]
+            h_shape = (1, -1) + (1,)*len(map_shape)
 
-    AUC_LF = np.trapz(Pxx[(hzPxx>VLF) & (hzPxx<LF)])
-    AUC_HF = np.trapz(Pxx[(hzPxx>LF) & (hzPxx<HF)])
-    LF_HF_ratio = AUC_LF/AUC_HF
+            mask = x_crop[:,np.newaxis] > h.reshape(h_shape)
+            labels, n_clusters = get_cluster_labels(mask.reshape((-1,) + x_crop.shape[1:]), adjacency=adjacency, batch=True)
+            sizes = get_cluster_stats(labels, n_clusters)[0]
 
-    return AUC_LF, AUC_HF, LF_HF_ratio, hzPxx, Pxx
+            extent = np.concatenate(([0], sizes))[labels].reshape(mask.shape)
+            tfce_crop += (extent**E * h.reshape(h_shape)**H * dh).sum(axis=1)
 
+        tfce[sel] += sign*tfce_crop
 
+    if batch == False:
+        tfce = tfce[0]
 
-def get_stats_descriptors(RRI) :
+    return tfce
 
-    MeanNN = np.mean(RRI)
 
-    SDNN = np.std(RRI)
 
-    RMSSD = np.sqrt(np.mean((np.diff(RRI)*1e3)**2))
+#data_baseline, data_cond, n_surr = tf_stretch_baseline_allsujet, tf_stretch_cond_allsujet, 100
+def get_permutation_cluster_mass(data_baseline, data_cond, n_surr, mode_grouped='mean', mode_inference='cluster_mass', tail=0, thresh=None,
+                                 adjacency=None, mode_generate_surr='minmax', alpha=cluster_mass_alpha, design='between', seed=None):
 
-    NN50 = []
-    for RR in range(len(RRI)) :
-        if RR == len(RRI)-1 :
-            continue
-        else :
-            NN = abs(RRI[RR+1] - RRI[RR])
-            NN50.append(NN)
+    """
+    Two groups cluster inference along data.shape[1:], (time), (freq, time) or (chan, freq, time) with adjacency
+    surrogates are drawn once in batches, each batch feeds :
+        surr_distrib (n_surr, *shape[:-1], 2) : min / max (or 1 / 99 percentiles) of the surrogate diff along the last axis,
+        the pointwise threshold used by get_permutation_cluster_1d / 2d
+        null_max_mass (n_surr) : max cluster mass of the surrogate, only for mode_inference='cluster_mass'
+    clusters are formed on the Welch t (mean) thresholded at cluster_forming_alpha, or on the median diff with thresh
+    given or from get_median_cluster_thresh
+    mode_inference='tfce' : the same surrogates feed null_max_tfce, max |TFCE| per surrogate, and every point gets
+    a p-value against it, no cluster forming threshold
+    tail : 0 two tailed on max |mass|, 1 cond > baseline, -1 cond < baseline
+    design='within' : paired rows, sign flip surrogates and one sample t on cond - baseline
+    """
 
-    NN50 = np.array(NN50)*1e3
-    pNN50 = np.sum(NN50>50)/len(NN50)
+    n_baseline, n_cond = data_baseline.shape[0], data_cond.shape[0]
 
-    mad = np.median( np.abs(RRI-np.median(RRI)) )
-    COV = mad / np.median(RRI)
+    #### observed
+    if design == 'within':
+        data_diff = data_cond.astype(dtype_acc) - data_baseline.astype(dtype_acc)
+        if mode_grouped == 'mean':
+            obs_diff = data_diff.mean(axis=0)
+            obs_stat = obs_diff / np.sqrt(data_diff.var(axis=0, ddof=1) / n_baseline)
+            if thresh is None:
+                thresh = scipy.stats.t.ppf(1 - cluster_forming_alpha/(2 if tail == 0 else 1), df=n_baseline - 1)
+        elif mode_grouped == 'median':
+            obs_diff = np.median(data_diff, axis=0)
+            obs_stat = obs_diff
+    elif mode_grouped == 'mean':
+        obs_diff = np.mean(data_cond, axis=0, dtype=dtype_acc) - np.mean(data_baseline, axis=0, dtype=dtype_acc)
+        obs_stat = obs_diff / np.sqrt(np.var(data_cond, axis=0, ddof=1, dtype=dtype_acc)/n_cond + np.var(data_baseline, axis=0, ddof=1, dtype=dtype_acc)/n_baseline)
+        if thresh is None:
+            thresh = scipy.stats.t.ppf(1 - cluster_forming_alpha/(2 if tail == 0 else 1), df=n_baseline + n_cond - 2)
+    elif mode_grouped == 'median':
+        obs_diff = np.median(data_cond, axis=0).astype(dtype_acc) - np.median(data_baseline, axis=0).astype(dtype_acc)
+        obs_stat = obs_diff
 
-    median = np.median(RRI)
+    if mode_inference == 'tfce':
+        dh = np.abs(obs_stat).max() / tfce_n_steps
 
-    return MeanNN, SDNN, RMSSD, NN50, pNN50, COV, mad, median
+    if mode_inference == 'cluster_mass' and thresh is None:
+        thresh = get_median_cluster_thresh(data_baseline, data_cond, n_surr, design=design, seed=seed)
 
+    #### surrogates
+    surr_distrib = np.zeros((n_surr,) + obs_diff.shape[:-1] + (2,))
+    null_max_mass = np.zeros(n_surr)
+    surr_i = 0
 
-def get_poincarre(RRI):
-    RRI_1 = RRI[1:]
-    RRI_1 = np.append(RRI_1, RRI[-1]) 
+    for diff, tstat in get_permutation_batches_2groups(data_baseline, data_cond, n_surr, mode_grouped=mode_grouped, design=design, seed=seed):
 
-    SD1_val = []
-    SD2_val = []
-    for RR in range(len(RRI)) :
-        if RR == len(RRI)-1 :
-            continue
-        else :
-            SD1_val_tmp = (RRI[RR+1] - RRI[RR])/np.sqrt(2)
-            SD2_val_tmp = (RRI[RR+1] + RRI[RR])/np.sqrt(2)
-            SD1_val.append(SD1_val_tmp)
-            SD2_val.append(SD2_val_tmp)
+        n_batch = diff.shape[0]
 
-    SD1 = np.std(SD1_val)
-    SD2 = np.std(SD2_val)
-    Tot_HRV = SD1*SD2*np.pi
+        if mode_generate_surr == 'minmax':
+            surr_distrib[surr_i:surr_i+n_batch,...,0], surr_distrib[surr_i:surr_i+n_batch,...,1] = diff.min(axis=-1), diff.max(axis=-1)
+        elif mode_generate_surr == 'percentile':
+            surr_distrib[surr_i:surr_i+n_batch,...,0], surr_distrib[surr_i:surr_i+n_batch,...,1] = np.percentile(diff, 1, axis=-1), np.percentile(diff, 99, axis=-1)
 
-    return SD1, SD2, Tot_HRV
+        if mode_inference == 'cluster_mass':
 
+            stat = tstat if mode_grouped == 'mean' else diff
+            null_max_mass[surr_i:surr_i+n_batch] = get_cluster_mass_batch(stat, thresh, tail=tail, adjacency=adjacency)
 
+        elif mode_inference == 'tfce':
 
-def get_hrv_metrics_homemade(cR_time, prms_hrv, analysis_time='5min'):
+            stat = tstat if mode_grouped == 'mean' else diff
+            null_max_mass[surr_i:surr_i+n_batch] = np.abs(get_tfce(stat, dh, adjacency=adjacency, tail=tail, batch=True)).reshape(n_batch, -1).max(axis=1)
 
-    #### get RRI
-    cR_sec = cR_time/prms_hrv['srate'] # cR in sec
+        surr_i += n_batch
 
-    if analysis_time == '3min':
+    res = {'obs_diff' : obs_diff, 'obs_stat' : obs_stat, 'thresh' : thresh, 'surr_distrib' : surr_distrib}
 
-        cR_sec_mask = (cR_sec >= 60) & (cR_sec <= 240)
-        cR_sec = cR_sec[cR_sec_mask] - 60
+    if mode_inference == 'pointwise':
+        return res
 
-    RRI = np.diff(cR_sec)
-    RRI = np.insert(RRI, 0, np.median(RRI))
+    if mode_inference == 'tfce':
 
-    if debug:
-        plt.plot(cR_sec, RRI)
-        plt.show()
-    
-    #### descriptors
-    MeanNN, SDNN, RMSSD, NN50, pNN50, COV, mad, median = get_stats_descriptors(RRI)
+        tfce = get_tfce(obs_stat, dh, adjacency=adjacency, tail=tail)
+        tfce_p = (1 + (null_max_mass.reshape((-1,) + (1,)*tfce.ndim) >= np.abs(tfce)).sum(axis=0)) / (n_surr + 1)
 
-    #### poincarré
-    SD1, SD2, Tot_HRV = get_poincarre(RRI)
+        res.update({'tfce' : tfce, 'tfce_p' : tfce_p, 'null_max_tfce' : null_max_mass, 'mask_signi' : tfce_p < alpha})
 
-    #### PSD
-    f = scipy.interpolate.interp1d(cR_sec, RRI, kind='quadratic', fill_value="extrapolate")
-    cR_sec_resample = np.arange(cR_sec[0], cR_sec[-1], 1/prms_hrv['srate_resample_hrv'])
-    RRI_resample = f(cR_sec_resample)
+        return res
 
-    if debug:
-        plt.plot(cR_sec, RRI, label='raw')
-        plt.plot(cR_sec_resample, RRI_resample, label='resampled')
-        plt.legend()
-        plt.show()
+    #### observed clusters, positive then negative labels
+    labels = np.zeros(obs_stat.shape, dtype=np.int64)
+    cluster_mass, cluster_extent, cluster_sign = [], [], []
 
-    VLF, LF, HF = .04, .15, .4
-    AUC_LF, AUC_HF, LF_HF_ratio, hzPxx, Pxx = get_PSD_LF_HF(RRI_resample, prms_hrv, VLF, LF, HF)
+    sign_list = {0 : [1, -1], 1 : [1], -1 : [-1]}[tail]
 
-    #### df
-    res_tmp = {'HRV_MeanNN' : MeanNN*1e3, 'HRV_SDNN' : SDNN*1e3, 'HRV_RMSSD' : RMSSD, 'HRV_pNN50' : pNN50*100, 'HRV_LF' : AUC_LF/10, 'HRV_HF' : AUC_HF/10, 
-               'HRV_LFHF' : LF_HF_ratio, 'HRV_SD1' : SD1*1e3, 'HRV_SD2' : SD2*1e3, 'HRV_S' : Tot_HRV*1e6, 'HRV_COV' : COV, 'HRV_MAD' : mad, 'HRV_MEDIAN' : median}
-    
-    data_df = {}
-    for i, dv in enumerate(prms_hrv['metric_list']):
-        data_df[dv] = res_tmp[dv]
+    for sign in sign_list:
 
-    hrv_metrics_homemade = pd.DataFrame([data_df])
+        _labels, n_clusters = get_cluster_labels(sign*obs_stat > thresh, adjacency=adjacency)
+        sizes, mass = get_cluster_stats(_labels, n_clusters, sign*obs_stat)
 
-    return hrv_metrics_homemade
+        labels[_labels > 0] = _labels[_labels > 0] + len(cluster_mass)
+        cluster_mass.extend(mass)
+        cluster_extent.extend(sizes)
+        cluster_sign.extend([sign]*n_clusters)
 
+    cluster_mass = np.array(cluster_mass)
 
+    #### p from the max mass null, +1 for the observed
+    cluster_p = (1 + (null_max_mass.reshape(-1,1) >= cluster_mass.reshape(1,-1)).sum(axis=0)) / (n_surr + 1)
 
+    res.update({'labels' : labels, 'cluster_mass' : cluster_mass * np.array(cluster_sign), 'cluster_extent' : np.array(cluster_extent, dtype=np.int64),
+                'cluster_p' : cluster_p, 'null_max_mass' : null_max_mass, 'mask_signi' : filter_clusters(labels, cluster_p < alpha)})
 
+    if debug:
 
+        count, _, _ = plt.hist(null_max_mass, bins=50, color='k', alpha=0.5)
+        plt.vlines(np.abs(res['cluster_mass']), ymin=0, ymax=count.max(), colors='g')
+        plt.show()
 
-################################
-######## NEUROKIT ######## 
-################################
+    return res
 
-#ecg_i = xr_chunk[sujet_i, cond_i, trial_i, :].data
-def nk_analysis(ecg_i, srate):
 
-    ecg_cR = scipy.signal.find_peaks(ecg_i, distance=srate*0.5)[0]
-    peaks_dict = {'ECG_R_Peaks' : ecg_cR}
-    ecg_peaks = pd.DataFrame(peaks_dict)
 
-    hrv_metrics = nk.hrv(ecg_peaks, sampling_rate=srate, show=False)
+#data_baseline, data_cond, chan_list, n_surr = xr_data.loc[:, 'FR_CV_1', 'o', :, :].values, xr_data.loc[:, 'CO2', 'o', :, :].values, chan_list_eeg, ERP_n_surrogate
+def get_permutation_cluster_spatiotemporal(data_baseline, data_cond, chan_list, n_surr, design='within', mode_inference='cluster_mass', tail=0, seed=None):
 
-    hrv_metrics_name = ['HRV_MeanNN', 'HRV_SDNN', 'HRV_RMSSD', 'HRV_pNN50', 'HRV_LF', 'HRV_HF', 'HRV_LFHF', 'HRV_SD1', 'HRV_SD2', 'HRV_S']
+    """
+    Cluster permutation on (sujet, chan, ...) tensors, clusters span neighbouring electrodes of the standard_1020
+    montage and neighbouring points of the trailing axes (time, or freq x time), p-values against the max cluster null (FWER)
+    """
 
-    col_to_drop = []
-    col_hrv = list(hrv_metrics.columns.values) 
-    for metric_name in col_hrv :
-        if (metric_name in hrv_metrics_name) == False :
-            col_to_drop.append(metric_name)
+    adjacency = get_chan_adjacency(chan_list)
+
+    return get_permutation_cluster_mass(data_baseline, data_cond, n_surr, mode_inference=mode_inference, tail=tail, adjacency=adjacency,
+                                        design=design, seed=seed)
 
-    hrv_metrics_short = hrv_metrics.copy()
-    hrv_metrics_short = hrv_metrics_short.drop(col_to_drop, axis=1)
 
-    return hrv_metrics_short
 
 
 
@@ -1726,6 +3200,37 @@ def get_permutation_2groups(data_baseline, data_cond, n_surr, mode_grouped='mean
 
 
 
+#data_baseline, data_cond, n_surr = data_baseline, data_cond, n_surr_fc
+def get_permutation_2groups_tensor(data_baseline, data_cond, n_surr, mode_grouped='mean', seed=None):
+
+    """
+    get_permutation_2groups on every point of (trial, ...) at once, one test per point on shared surrogate draws
+    surrogate diffs from get_permutation_batches_2groups, thresholds are the 0.5 / 99.5 percentiles per point
+    """
+
+    if mode_grouped == 'mean':
+        obs_distrib = np.mean(data_cond, axis=0, dtype=dtype_acc) - np.mean(data_baseline, axis=0, dtype=dtype_acc)
+    elif mode_grouped == 'median':
+        obs_distrib = np.median(data_cond, axis=0).astype(dtype_acc) - np.median(data_baseline, axis=0).astype(dtype_acc)
+
+    surr_distrib = np.zeros((n_surr,) + obs_distrib.shape)
+    surr_i = 0
+
+    for diff, _ in get_permutation_batches_2groups(data_baseline, data_cond, n_surr, mode_grouped=mode_grouped, seed=seed):
+
+        surr_distrib[surr_i:surr_i+diff.shape[0]] = diff
+        surr_i += diff.shape[0]
+
+    #### thresh
+    surr_dw, surr_up = np.percentile(surr_distrib, 0.5, axis=0), np.percentile(surr_distrib, 99.5, axis=0)
+
+    stats_res = (obs_distrib < surr_dw) | (obs_distrib > surr_up)
+
+    return stats_res
+
+
+
+
 
 # # data_baseline, data_cond, n_surr = data_baseline, data_cond, n_surr_fc
 # def get_permutation_cluster_1d_DEBUG(data_baseline, data_cond, n_surr):
@@ -1853,13 +3358,12 @@ def get_permutation_2groups(data_baseline, data_cond, n_surr, mode_grouped='mean
 
 
 # data_baseline, data_cond, n_surr = data_baseline, data_cond, n_surr_fc
-def get_permutation_cluster_1d(data_baseline, data_cond, n_surr, mode_grouped='mean', mode_generate_surr='minmax', mode_select_thresh='mean', size_thresh_alpha=0.01):
+def get_permutation_cluster_1d(data_baseline, data_cond, n_surr, mode_grouped='mean', mode_generate_surr='minmax', mode_select_thresh='mean', size_thresh_alpha=0.01, mode_cluster=cluster_inference_mode):
 
-    n_trials_baselines = data_baseline.shape[0]
-    len_sig = data_baseline.shape[-1]
+    #### cluster statistics in dtype_acc whatever the storage policy
+    data_baseline, data_cond = data_baseline.astype(dtype_acc), data_cond.astype(dtype_acc)
 
-    data_shuffle = np.concatenate((data_baseline, data_cond), axis=0)
-    n_trial_tot = data_shuffle.shape[0]
+    len_sig = data_baseline.shape[-1]
 
     if mode_grouped == 'mean':
         data_baseline_grouped = np.mean(data_baseline, axis=0)
@@ -1882,37 +3386,14 @@ def get_permutation_cluster_1d(data_baseline, data_cond, n_surr, mode_grouped='m
 
     obs_distrib = data_cond_grouped - data_baseline_grouped
 
-    surr_distrib = np.zeros((n_surr, 2))
-
-    #surr_i = 0
-    for surr_i in range(n_surr):
-
-        #### shuffle
-        random_sel = np.random.choice(n_trial_tot, size=n_trial_tot, replace=False)
-        data_shuffle_baseline = data_shuffle[random_sel[:n_trials_baselines]]
-        data_shuffle_cond = data_shuffle[random_sel[n_trials_baselines:]]
-
-        if mode_grouped == 'mean':
-            diff_shuffle = np.mean(data_shuffle_cond, axis=0) - np.mean(data_shuffle_baseline, axis=0)
-        elif mode_grouped == 'median':
-            diff_shuffle = np.median(data_shuffle_cond, axis=0) - np.median(data_shuffle_baseline, axis=0)
-
-        if debug:
-            plt.plot(np.mean(data_shuffle_baseline, axis=0), label='baseline')
-            plt.plot(np.mean(data_shuffle_cond, axis=0), label='cond')
-            plt.legend()
-            plt.show()
+    #### surrogates in batches, the cluster mass null comes from the same draws
+    res_perm = get_permutation_cluster_mass(data_baseline, data_cond, n_surr, mode_grouped=mode_grouped, mode_generate_surr=mode_generate_surr,
+                                            mode_inference={'size' : 'pointwise', 'mass' : 'cluster_mass', 'tfce' : 'tfce'}[mode_cluster])
 
-            plt.hist(np.median(data_shuffle_baseline, axis=0), bins=50, label='baseline', alpha=0.5)
-            plt.hist(np.median(data_shuffle_cond, axis=0), bins=50, label='cond', alpha=0.5)
-            plt.legend()
-            plt.show()
+    if mode_cluster in ['mass', 'tfce']:
+        return res_perm['mask_signi']
 
-        #### generate distrib
-        if mode_generate_surr == 'minmax':
-            surr_distrib[surr_i, 0], surr_distrib[surr_i, 1] = diff_shuffle.min(), diff_shuffle.max()
-        elif mode_generate_surr == 'percentile':
-            surr_distrib[surr_i, 0], surr_distrib[surr_i, 1] = np.percentile(diff_shuffle, 1), np.percentile(diff_shuffle, 99)    
+    surr_distrib = res_perm['surr_distrib']
 
     if debug:
         count, _, _ = plt.hist(surr_distrib[:,0], bins=50, color='k', alpha=0.5)
@@ -1960,11 +3441,8 @@ def get_permutation_cluster_1d(data_baseline, data_cond, n_surr, mode_grouped='m
     if mask.sum() != 0:
     
         #### thresh cluster
-        mask_thresh = mask.astype('uint8')
-        nb_blobs, im_with_separated_blobs, stats, _ = cv2.connectedComponentsWithStats(mask_thresh)
-        #### nb_blobs, im_with_separated_blobs, stats = nb clusters, clusters image with labeled clusters, info on clusters
-        sizes = stats[1:, -1]
-        nb_blobs -= 1
+        labels, n_clusters = get_cluster_labels(mask)
+        sizes = get_cluster_stats(labels, n_clusters)[0]
         # min_size = np.percentile(sizes,size_thresh)  
         min_size = len_sig*size_thresh_alpha  
 
@@ -1974,12 +3452,7 @@ def get_permutation_cluster_1d(data_baseline, data_cond, n_surr, mode_grouped='m
             plt.vlines(min_size, ymin=0, ymax=count.max(), colors='r')
             plt.show()
 
-        mask_thresh = np.zeros_like(im_with_separated_blobs)
-        for blob in range(nb_blobs):
-            if sizes[blob] >= min_size:
-                mask_thresh[im_with_separated_blobs == blob + 1] = 1
-
-        mask_thresh = mask_thresh.reshape(-1)
+        mask_thresh = filter_clusters(labels, sizes >= min_size)
 
         if debug:
 
@@ -2014,21 +3487,111 @@ def get_permutation_cluster_1d(data_baseline, data_cond, n_surr, mode_grouped='m
 
 
 
+# data_baseline, data_cond, n_surr = data_baseline, data_cond, n_surr_fc
+def get_permutation_cluster_1d_tensor(data_baseline, data_cond, n_surr, mode_grouped='mean', mode_generate_surr='minmax', mode_select_thresh='mean', size_thresh_alpha=0.01, mode_cluster=cluster_inference_mode, seed=None):
+
+    """
+    get_permutation_cluster_1d on every row of (trial, ..., time) in one pass, rows stay independent tests on shared surrogate draws
+    size : per row thresholds from surr_distrib then cluster size filter, rows labelled as batch axis
+    mass : per row max cluster mass null
+    tfce : row loop on get_permutation_cluster_1d, dh depends on the row
+    """
+
+    #### cluster statistics in dtype_acc whatever the storage policy
+    data_baseline, data_cond = data_baseline.astype(dtype_acc), data_cond.astype(dtype_acc)
+
+    shape = data_baseline.shape[1:]
+    len_sig = shape[-1]
+
+    data_baseline = data_baseline.reshape(data_baseline.shape[0], -1, len_sig)
+    data_cond = data_cond.reshape(data_cond.shape[0], -1, len_sig)
+    n_row = data_baseline.shape[1]
+
+    if mode_cluster == 'tfce':
+
+        mask_thresh = np.stack([get_permutation_cluster_1d(data_baseline[:,row_i], data_cond[:,row_i], n_surr, mode_grouped=mode_grouped, mode_cluster='tfce') for row_i in range(n_row)])
+
+        return mask_thresh.reshape(shape)
+
+    if mode_cluster == 'mass':
+
+        n_baseline, n_cond = data_baseline.shape[0], data_cond.shape[0]
+
+        if mode_grouped == 'mean':
+            obs_stat = (data_cond.mean(axis=0) - data_baseline.mean(axis=0)) / np.sqrt(data_cond.var(axis=0, ddof=1)/n_cond + data_baseline.var(axis=0, ddof=1)/n_baseline)
+            thresh = scipy.stats.t.ppf(1 - cluster_forming_alpha/2, df=n_baseline + n_cond - 2)
+        elif mode_grouped == 'median':
+            obs_stat = np.median(data_cond, axis=0) - np.median(data_baseline, axis=0)
+            thresh = get_median_cluster_thresh(data_baseline, data_cond, n_surr, seed=seed)
+
+        null_max_mass = np.zeros((n_surr, n_row))
+        surr_i = 0
+
+        for diff, tstat in get_permutation_batches_2groups(data_baseline, data_cond, n_surr, mode_grouped=mode_grouped, seed=seed):
+
+            n_batch = diff.shape[0]
+            stat = tstat if mode_grouped == 'mean' else diff
+
+            null_max_mass[surr_i:surr_i+n_batch] = get_cluster_mass_batch(stat.reshape(-1, len_sig), thresh).reshape(n_batch, n_row)
+            surr_i += n_batch
+
+        #### observed clusters against the null of their own row
+        mask_thresh = np.zeros(obs_stat.shape, dtype='bool')
+
+        for sign in [1, -1]:
+
+            labels, n_clusters = get_cluster_labels(sign*obs_stat > thresh, batch=True)
+
+            if n_clusters == 0:
+                continue
+
+            mass = get_cluster_stats(labels, n_clusters, sign*obs_stat)[1]
+
+            cluster_row = np.zeros(n_clusters+1, dtype=np.int64)
+            cluster_row[labels] = np.arange(n_row).reshape(-1,1)
+            cluster_p = (1 + (null_max_mass[:,cluster_row[1:]] >= mass).sum(axis=0)) / (n_surr + 1)
+
+            mask_thresh |= filter_clusters(labels, cluster_p < cluster_mass_alpha)
+
+        return mask_thresh.reshape(shape)
+
+    #### size, pointwise thresholds per row
+    res_perm = get_permutation_cluster_mass(data_baseline, data_cond, n_surr, mode_grouped=mode_grouped, mode_generate_surr=mode_generate_surr, mode_inference='pointwise', seed=seed)
+    obs_distrib, surr_distrib = res_perm['obs_diff'], res_perm['surr_distrib']
+
+    if mode_select_thresh == 'percentile':
+        surr_dw, surr_up = np.percentile(surr_distrib[...,0], 1, axis=0), np.percentile(surr_distrib[...,1], 99, axis=0)
+    elif mode_select_thresh == 'mean':
+        surr_dw, surr_up = np.mean(surr_distrib[...,0], axis=0), np.median(surr_distrib[...,1], axis=0)
+    elif mode_select_thresh == 'median':
+        surr_dw, surr_up = np.median(surr_distrib[...,0], axis=0), np.median(surr_distrib[...,1], axis=0)
+
+    mask = (obs_distrib < surr_dw.reshape(-1,1)) | (obs_distrib > surr_up.reshape(-1,1))
+
+    #### thresh cluster, one label pass for all rows
+    labels, n_clusters = get_cluster_labels(mask, batch=True)
+    sizes = get_cluster_stats(labels, n_clusters)[0]
+    min_size = len_sig*size_thresh_alpha
+
+    mask_thresh = filter_clusters(labels, sizes >= min_size)
+
+    return mask_thresh.reshape(shape)
+
+
+
+
 # data_baseline, data_cond, n_surr = tf_stretch_baseline_allsujet, tf_stretch_cond_allsujet, 100
-def get_permutation_cluster_2d(data_baseline, data_cond, n_surr, mode_grouped='mean', mode_generate_surr='minmax', mode_select_thresh='mean', size_thresh_alpha=0.05):
+def get_permutation_cluster_2d(data_baseline, data_cond, n_surr, mode_grouped='mean', mode_generate_surr='minmax', mode_select_thresh='mean', size_thresh_alpha=0.05, mode_cluster=cluster_inference_mode):
 
     """
     For data shape (trial,frequences,time)
 
     """
 
-    #### define ncycle
-    n_trial_baselines = data_baseline.shape[0]
-    n_trial_cond = data_cond.shape[0]
-    n_trial_tot = n_trial_baselines + n_trial_cond
-    len_sig = data_baseline.shape[-1]
+    #### cluster statistics in dtype_acc whatever the storage policy
+    data_baseline, data_cond = data_baseline.astype(dtype_acc), data_cond.astype(dtype_acc)
 
-    data_shuffle = np.concatenate((data_baseline, data_cond), axis=0)
+    len_sig = data_baseline.shape[-1]
 
     if mode_grouped == 'mean':
         data_baseline_grouped = np.mean(data_baseline, axis=0)
@@ -2044,33 +3607,14 @@ def get_permutation_cluster_2d(data_baseline, data_cond, n_surr, mode_grouped='m
         plt.pcolormesh(obs_distrib)
         plt.show()
 
-    #### space allocation
-    surr_distrib = np.zeros((nfrex, n_surr, 2), dtype=np.float32)
-
-    #surr_i = 0
-    for surr_i in range(n_surr):
-
-        print_advancement(surr_i, n_surr, steps=[25, 50, 75])
-
-        #### shuffle
-        random_sel = np.random.choice(n_trial_tot, size=n_trial_tot, replace=False)
-        data_shuffle_baseline = data_shuffle[random_sel[:n_trial_baselines]]
-        data_shuffle_cond = data_shuffle[random_sel[n_trial_baselines:]]
-
-        if mode_grouped == 'mean':
-            diff_shuffle = np.mean(data_shuffle_cond, axis=0) - np.mean(data_shuffle_baseline, axis=0)
-        elif mode_grouped == 'median':
-            diff_shuffle = np.median(data_shuffle_cond, axis=0) - np.median(data_shuffle_baseline, axis=0)
+    #### surrogates in batches, the cluster mass null comes from the same draws
+    res_perm = get_permutation_cluster_mass(data_baseline, data_cond, n_surr, mode_grouped=mode_grouped, mode_generate_surr=mode_generate_surr,
+                                            mode_inference={'size' : 'pointwise', 'mass' : 'cluster_mass', 'tfce' : 'tfce'}[mode_cluster])
 
-        if debug:
-            plt.pcolormesh(diff_shuffle)
-            plt.show()
+    if mode_cluster in ['mass', 'tfce']:
+        return res_perm['mask_signi']
 
-        #### generate distrib
-        if mode_generate_surr == 'minmax':
-            surr_distrib[:, surr_i, 0], surr_distrib[:, surr_i, 1] = diff_shuffle.min(axis=1), diff_shuffle.max(axis=1)
-        elif mode_generate_surr == 'percentile':
-            surr_distrib[:, surr_i, 0], surr_distrib[:, surr_i, 1] = np.percentile(diff_shuffle, 1, axis=1), np.percentile(diff_shuffle, 99, axis=1)    
+    surr_distrib = res_perm['surr_distrib'].transpose(1,0,2)
 
     if mode_select_thresh == 'percentile':
         # surr_dw, surr_up = np.percentile(surr_distrib[:,:,0], 2.5, axis=1), np.percentile(surr_distrib[:,:,1], 97.5, axis=1)
@@ -2120,11 +3664,8 @@ def get_permutation_cluster_2d(data_baseline, data_cond, n_surr, mode_grouped='m
     if mask.sum() != 0:
     
         #### thresh cluster
-        mask_thresh = mask.astype('uint8')
-        nb_blobs, im_with_separated_blobs, stats, _ = cv2.connectedComponentsWithStats(mask_thresh)
-        #### nb_blobs, im_with_separated_blobs, stats = nb clusters, clusters image with labeled clusters, info on clusters
-        sizes = stats[1:, -1]
-        nb_blobs -= 1
+        labels, n_clusters = get_cluster_labels(mask)
+        sizes = get_cluster_stats(labels, n_clusters)[0]
         # min_size = np.percentile(sizes,size_thresh)  
         min_size = len_sig*size_thresh_alpha  
 
@@ -2134,10 +3675,7 @@ def get_permutation_cluster_2d(data_baseline, data_cond, n_surr, mode_grouped='m
             plt.vlines(min_size, ymin=0, ymax=count.max(), colors='r')
             plt.show()
 
-        mask_thresh = np.zeros_like(im_with_separated_blobs)
-        for blob in range(nb_blobs):
-            if sizes[blob] >= min_size:
-                mask_thresh[im_with_separated_blobs == blob + 1] = 1
+        mask_thresh = filter_clusters(labels, sizes >= min_size)
 
         if debug:
 
@@ -9,7 +9,9 @@ from statannotations.Annotator import Annotator
 import matplotlib.pyplot as plt
 from scipy import stats
 import itertools
+import math
 import statsmodels.formula.api as smf
+import patsy
 
 def mad(data, constant = 1.4826):
     median = np.median(data)
@@ -572,15 +574,156 @@ def qqplot(df, predictor, outcome, figsize = (10,15)):
         
     plt.show()
 
-def permutation_test_homemade(x,y, design = 'within', n_resamples=999):
-    def statistic(x, y):
-        return np.mean(x) - np.mean(y)
+#n_x, n_y, design = x.shape[-1], y.shape[-1], 'within'
+def get_permutation_resamples(n_x, n_y, design='within', n_resamples=999, seed=None):
+
+    """
+    Resamples shared by every variable : (n_resamples, n_x) bool sign flips for 'within', (n_resamples, n_x + n_y)
+    bool membership of x for 'between'
+    exact when every distinct resample fits in n_resamples (all sign patterns / all splits), identity included
+    """
+
+    rng = np.random.default_rng(seed)
+
     if design == 'within':
-        permutation_type = 'samples'
+
+        n_exact = 2**n_x
+
+        if n_exact <= n_resamples:
+            resamples = ((np.arange(n_exact).reshape(-1, 1) >> np.arange(n_x)) & 1).astype('bool')
+            return resamples, True
+
+        return rng.integers(0, 2, size=(n_resamples, n_x)).astype('bool'), False
+
+    elif design == 'between':
+
+        n_tot = n_x + n_y
+        n_exact = math.comb(n_tot, n_x)
+
+        if n_exact <= n_resamples:
+            resamples = np.zeros((n_exact, n_tot), dtype='bool')
+            for resample_i, sel in enumerate(itertools.combinations(range(n_tot), n_x)):
+                resamples[resample_i, list(sel)] = True
+            return resamples, True
+
+        random_sel = rng.permuted(np.tile(np.arange(n_tot), (n_resamples, 1)), axis=1)
+        resamples = np.zeros((n_resamples, n_tot), dtype='bool')
+        resamples[np.arange(n_resamples).reshape(-1, 1), random_sel[:, :n_x]] = True
+
+        return resamples, False
+
+
+#x, y, resamples, design, statistic = x, y, resamples[:10], 'within', 'mean'
+def get_permutation_stat_batch(x, y, resamples, design='within', statistic='mean'):
+
+    """
+    Statistic (batch, variable) of x (variable, n_x) vs y (variable, n_y) under each resample
+    mean and t from matrix products with the resamples, median by gathering
+    within : flipped pairs, t is the paired t ; between : relabelled pool, t is Welch
+    """
+
+    if design == 'within':
+
+        if statistic == 'median':
+            flip = resamples[:, np.newaxis, :]
+            return np.median(np.where(flip, y, x), axis=-1) - np.median(np.where(flip, x, y), axis=-1)
+
+        n = x.shape[-1]
+        d = x - y
+        sign = 1 - 2*resamples.astype('float')
+
+        mean_d = sign @ d.T / n
+
+        if statistic == 'mean':
+            return mean_d
+
+        #### sum of squares does not depend on the flips
+        var_d = np.clip(((d**2).sum(axis=-1) - n*mean_d**2) / (n - 1), 0, None)
+        return mean_d / np.sqrt(var_d / n)
+
     elif design == 'between':
-        permutation_type = 'independent'
-    res = stats.permutation_test(data=[x,y], statistic=statistic, permutation_type=permutation_type, n_resamples=n_resamples, batch=None, alternative='two-sided', axis=0, random_state=None)
-    return res.pvalue
+
+        n_x, n_y = x.shape[-1], y.shape[-1]
+        pool = np.concatenate((x, y), axis=-1)
+
+        if statistic == 'median':
+            order = np.argsort(~resamples, axis=1, kind='stable')
+            pool_perm = pool[:, order].transpose(1, 0, 2)
+            return np.median(pool_perm[..., :n_x], axis=-1) - np.median(pool_perm[..., n_x:], axis=-1)
+
+        assign = resamples.astype('float')
+        sum_x = assign @ pool.T
+        mean_x, mean_y = sum_x / n_x, (pool.sum(axis=-1) - sum_x) / n_y
+
+        if statistic == 'mean':
+            return mean_x - mean_y
+
+        sum_sq_x = assign @ (pool**2).T
+        var_x = np.clip(sum_sq_x - n_x*mean_x**2, 0, None) / (n_x - 1)
+        var_y = np.clip((pool**2).sum(axis=-1) - sum_sq_x - n_y*mean_y**2, 0, None) / (n_y - 1)
+        return (mean_x - mean_y) / np.sqrt(var_x/n_x + var_y/n_y)
+
+
+#x, y = x, y
+def permutation_test_batched(x, y, design='within', statistic='mean', n_resamples=999, max_stat=False, batch_mem=perm_batch_mem, seed=None):
+
+    """
+    Two-sided permutation test of every variable of x (..., n_x) vs y (..., n_y), samples on the last axis,
+    all variables share the same resamples, drawn once and evaluated in batches bounded by batch_mem
+    statistic : 'mean' (mean difference, as permutation_test_homemade), 't' or 'median' (median difference)
+    p as scipy.stats.permutation_test, exact when every resample fits in n_resamples
+    max_stat : pval_maxstat against the max |stat| over variables of each resample, FWER across variables
+    """
+
+    x, y = np.asarray(x, dtype='float'), np.asarray(y, dtype='float')
+    var_shape = x.shape[:-1]
+    x, y = x.reshape(-1, x.shape[-1]), y.reshape(-1, y.shape[-1])
+    n_var = x.shape[0]
+
+    resamples, exact = get_permutation_resamples(x.shape[-1], y.shape[-1], design=design, n_resamples=n_resamples, seed=seed)
+    n_perm = resamples.shape[0]
+    adjustment = 0 if exact else 1
+
+    #### observed, identity resample
+    identity = np.zeros((1, resamples.shape[1]), dtype='bool')
+    if design == 'between':
+        identity[:, :x.shape[-1]] = True
+    obs = get_permutation_stat_batch(x, y, identity, design=design, statistic=statistic)[0]
+    gamma = np.abs(1e-14 * obs)
+
+    count_less, count_greater = np.zeros(n_var), np.zeros(n_var)
+    null_max = np.zeros(n_perm)
+
+    sample_mem = 8 * n_var * (resamples.shape[1] if statistic == 'median' else 4)
+    batch_size = int(np.clip(batch_mem // sample_mem, 1, n_perm))
+
+    for batch_start in range(0, n_perm, batch_size):
+
+        null = get_permutation_stat_batch(x, y, resamples[batch_start:batch_start+batch_size], design=design, statistic=statistic)
+
+        count_less += (null <= obs + gamma).sum(axis=0)
+        count_greater += (null >= obs - gamma).sum(axis=0)
+
+        if max_stat:
+            null_max[batch_start:batch_start+null.shape[0]] = np.nanmax(np.abs(null), axis=1)
+
+    p_less = (count_less + adjustment) / (n_perm + adjustment)
+    p_greater = (count_greater + adjustment) / (n_perm + adjustment)
+    pval = np.clip(2 * np.minimum(p_less, p_greater), 0, 1)
+
+    res = {'obs' : obs.reshape(var_shape), 'pval' : pval.reshape(var_shape), 'exact' : exact}
+
+    if max_stat:
+        pval_maxstat = ((null_max.reshape(-1, 1) >= np.abs(obs) - gamma).sum(axis=0) + adjustment) / (n_perm + adjustment)
+        res.update({'pval_maxstat' : pval_maxstat.reshape(var_shape), 'null_max' : null_max})
+
+    return res
+
+
+def permutation_test_homemade(x,y, design = 'within', n_resamples=999, axis=0):
+    x, y = np.moveaxis(np.asarray(x), axis, -1), np.moveaxis(np.asarray(y), axis, -1)
+    res = permutation_test_batched(x, y, design=design, statistic='mean', n_resamples=n_resamples)
+    return res['pval']
 
 def permutation(df, predictor, outcome , design = 'within' , subject = None, n_resamples=999):
     pairs = list((itertools.combinations(df[predictor].unique(), 2)))
@@ -647,6 +790,134 @@ def lmm(df, predictor, outcome, subject, order=None):
     return mdf
 
 
+#X, g_idx, Y = X, g_idx, Y
+def get_lmm_suff_stats(X, g_idx, Y):
+
+    """
+    Sufficient statistics of the random intercept model, shared design X (obs, p), group index (obs), responses Y (obs, resp)
+    """
+
+    n_groups = g_idx.max() + 1
+
+    suff = {'XtX' : X.T @ X, 'XtY' : X.T @ Y, 'YtY' : (Y**2).sum(axis=0), 'n_g' : np.bincount(g_idx, minlength=n_groups).astype('float'),
+            'Xg' : np.stack([np.bincount(g_idx, weights=X[:, p_i], minlength=n_groups) for p_i in range(X.shape[1])], axis=1),
+            'Yg' : np.zeros((n_groups, Y.shape[1]))}
+    np.add.at(suff['Yg'], g_idx, Y)
+
+    return suff
+
+
+#suff, log_gamma = suff, np.zeros(n_resp)
+def get_lmm_reml_profile(suff, log_gamma, n_obs):
+
+    """
+    -2 REML log likelihood profiled on sigma2, for every response at its own gamma = group var / residual var
+    H = I + gamma Z Z' has the closed form inverse I - c_g J per group with c_g = gamma / (1 + gamma n_g)
+    returns the criterion, beta, A = X' H^-1 X and r' H^-1 r
+    """
+
+    n_fe = suff['XtX'].shape[0]
+    gamma = np.exp(log_gamma)
+
+    c = gamma[:, np.newaxis] / (1 + gamma[:, np.newaxis] * suff['n_g'])
+
+    A = suff['XtX'] - np.einsum('rg,gp,gq->rpq', c, suff['Xg'], suff['Xg'])
+    b = suff['XtY'].T - np.einsum('rg,gp,gr->rp', c, suff['Xg'], suff['Yg'])
+    q = suff['YtY'] - (c * suff['Yg'].T**2).sum(axis=1)
+
+    beta = np.linalg.solve(A, b[..., np.newaxis])[..., 0]
+    rHr = q - (b * beta).sum(axis=1)
+
+    logdet_H = np.log(1 + gamma[:, np.newaxis] * suff['n_g']).sum(axis=1)
+    logdet_A = np.linalg.slogdet(A)[1]
+
+    crit = (n_obs - n_fe) * np.log(rHr / (n_obs - n_fe)) + logdet_H + logdet_A
+
+    return crit, beta, A, rHr
+
+
+#df, predictor, subject, Y = df, 'cond', 'sujet', Y
+def lmm_batched(df, predictor, subject, Y, response_names=None, re_formula=None, log_gamma_range=(-12, 8), n_grid=41, n_golden=50):
+
+    """
+    Random intercept LMM of lmm (predictor terms, groups=subject) on every column of Y (obs, resp), rows of Y follow df
+    the design is built once, REML is profiled on gamma and evaluated in closed form from group sums for all responses,
+    gamma from a log grid then a vectorized golden section around the best grid point
+    re_formula (random slopes) or NaN in Y : statsmodels mixedlm per response
+    returns the fixed effect table (response, term) with coef, se, z, p, group_var and p_fdr per term across responses
+    """
+
+    if isinstance(predictor, str):
+        formula_fe = f'{predictor}'
+    elif isinstance(predictor, list):
+        formula_fe = '*'.join(predictor)
+
+    Y = np.asarray(Y, dtype='float').reshape(df.shape[0], -1)
+    n_obs, n_resp = Y.shape
+
+    if response_names is None:
+        response_names = np.arange(n_resp)
+
+    X = patsy.dmatrix(formula_fe, df, return_type='dataframe')
+    term_names = list(X.columns)
+
+    if re_formula is None and np.isfinite(Y).all():
+
+        X = X.values
+        g_idx = pd.factorize(df[subject])[0]
+        suff = get_lmm_suff_stats(X, g_idx, Y)
+
+        #### grid, then golden section on the bracket of the best grid point
+        grid = np.linspace(log_gamma_range[0], log_gamma_range[1], n_grid)
+        crit_grid = np.stack([get_lmm_reml_profile(suff, np.full(n_resp, log_gamma), n_obs)[0] for log_gamma in grid])
+        best_i = np.argmin(crit_grid, axis=0)
+
+        step = grid[1] - grid[0]
+        low, high = np.maximum(grid[best_i] - step, grid[0]), np.minimum(grid[best_i] + step, grid[-1])
+        ratio = (np.sqrt(5) - 1) / 2
+
+        for golden_i in range(n_golden):
+
+            mid_low, mid_high = high - ratio*(high - low), low + ratio*(high - low)
+            keep_low = get_lmm_reml_profile(suff, mid_low, n_obs)[0] < get_lmm_reml_profile(suff, mid_high, n_obs)[0]
+            high = np.where(keep_low, mid_high, high)
+            low = np.where(keep_low, low, mid_low)
+
+        log_gamma = (low + high) / 2
+        crit, beta, A, rHr = get_lmm_reml_profile(suff, log_gamma, n_obs)
+
+        sigma2 = rHr / (n_obs - X.shape[1])
+        se = np.sqrt(sigma2[:, np.newaxis] * np.diagonal(np.linalg.inv(A), axis1=1, axis2=2))
+        group_var = np.exp(log_gamma) * sigma2
+
+    else:
+
+        beta, se, group_var = np.zeros((n_resp, len(term_names))), np.zeros((n_resp, len(term_names))), np.zeros(n_resp)
+
+        for resp_i in range(n_resp):
+
+            df_resp = df.assign(_outcome=Y[:, resp_i]).dropna(subset=['_outcome'])
+            mdf = smf.mixedlm(f'_outcome ~ {formula_fe}', data=df_resp, groups=df_resp[subject], re_formula=re_formula).fit(reml=True)
+
+            beta[resp_i], se[resp_i] = mdf.fe_params[term_names].values, mdf.bse_fe[term_names].values
+            group_var[resp_i] = mdf.cov_re.values[0, 0]
+
+    z = beta / se
+    pvals = 2 * stats.norm.sf(np.abs(z))
+
+    df_lmm = pd.DataFrame({'response' : np.repeat(response_names, len(term_names)), 'term' : np.tile(term_names, n_resp),
+                           'coef' : beta.reshape(-1), 'se' : se.reshape(-1), 'z' : z.reshape(-1), 'p' : pvals.reshape(-1),
+                           'group_var' : np.repeat(group_var, len(term_names))})
+
+    #### FDR per term across responses
+    df_lmm['p_fdr'] = np.nan
+    for term in term_names:
+        sel = df_lmm['term'] == term
+        df_lmm.loc[sel, 'p_fdr'] = fdr_bh(df_lmm.loc[sel, 'p'].values)
+
+    return df_lmm
+
+
 def confidence_interval(x, confidence = 0.95, verbose = False):
     m = x.mean() 
     s = x.std() 
@@ -1057,3 +1328,251 @@ def get_summary_stats(df, predictor, outcome, subject=None, design='within', exp
         return df_res
 
 
+
+
+
+########################################
+######## MASS UNIVARIATE ########
+########################################
+
+
+#pvals = pvals
+def fdr_bh(pvals):
+
+    """
+    Benjamini-Hochberg over the whole array as one family, NaN left out
+    """
+
+    pvals = np.asarray(pvals, dtype='float')
+    p_fdr = np.full(pvals.shape, np.nan)
+    finite = np.isfinite(pvals)
+
+    if finite.sum() > 0:
+        p_fdr[finite] = pg.multicomp(pvals[finite], method='fdr_bh')[1]
+
+    return p_fdr
+
+
+#pvals = post_pval
+def holm_tensor(pvals, axis=0):
+
+    """
+    Holm along axis, one family per slice
+    """
+
+    pvals = np.moveaxis(np.asarray(pvals, dtype='float'), axis, -1)
+    m = pvals.shape[-1]
+
+    order = np.argsort(pvals, axis=-1)
+    p_sorted = np.take_along_axis(pvals, order, axis=-1)
+    p_adj_sorted = np.minimum(np.maximum.accumulate(p_sorted * (m - np.arange(m)), axis=-1), 1)
+
+    p_adj = np.empty(pvals.shape)
+    np.put_along_axis(p_adj, order, p_adj_sorted, axis=-1)
+
+    return np.moveaxis(p_adj, -1, axis)
+
+
+#x = x
+def normality_tensor(x, alpha=0.05):
+
+    """
+    x (subject, group, point), True where every group passes Shapiro, as normality
+    """
+
+    return (stats.shapiro(x, axis=0).pvalue > alpha).all(axis=0)
+
+
+#x = x
+def sphericity_tensor(x, alpha=0.05):
+
+    """
+    x (subject, group, point), Mauchly on the covariance of orthonormal contrasts, as pg.sphericity
+    """
+
+    n, k = x.shape[:2]
+    d = k - 1
+
+    if d <= 1:
+        return np.ones(x.shape[2:], dtype='bool')
+
+    #### orthonormal contrasts, columns orthogonal to the constant
+    C = np.linalg.qr(np.concatenate((np.ones((k, 1)), np.eye(k)[:, :d]), axis=1))[0][:, 1:]
+
+    y = np.einsum('nkp,kd->npd', x, C)
+    y = y - y.mean(axis=0)
+    M = np.einsum('npd,npe->pde', y, y) / (n - 1)
+
+    sign, logdet = np.linalg.slogdet(M)
+    logW = np.where(sign > 0, logdet - d * np.log(np.trace(M, axis1=-2, axis2=-1) / d), -np.inf)
+
+    df_resid = n - 1
+    ddof = (d * (d + 1)) / 2 - 1
+    f = 1 - (2 * d**2 + d + 2) / (6 * d * df_resid)
+    w2 = (d + 2) * (d - 1) * (d - 2) * (2 * d**3 + 6 * d**2 + 3 * k + 2) / (288 * (df_resid * d * f) ** 2)
+    chi_sq = -df_resid * f * logW
+    p1, p2 = stats.chi2.sf(chi_sq, ddof), stats.chi2.sf(chi_sq, ddof + 4)
+
+    return p1 + w2 * (p2 - p1) > alpha
+
+
+#x = x
+def homoscedasticity_tensor(x, alpha=0.05):
+
+    """
+    x (subject, group, point), Levene across groups, as pg.homoscedasticity
+    """
+
+    return stats.levene(*[x[:, group_i] for group_i in range(x.shape[1])], axis=0).pvalue > alpha
+
+
+#x, test = x, 'rm_anova'
+def pg_compute_pre_tensor(x, test):
+
+    """
+    x (subject, group, point), p of the pre test on every point, same tests as pg_compute_pre
+    """
+
+    n, k = x.shape[:2]
+    groups = [x[:, group_i] for group_i in range(k)]
+
+    if test == 't-test_ind':
+        pval = stats.ttest_ind(groups[0], groups[1], axis=0).pvalue
+
+    elif test == 't-test_paired':
+        pval = stats.ttest_rel(groups[0], groups[1], axis=0).pvalue
+
+    elif test == 'anova':
+        pval = stats.f_oneway(*groups, axis=0).pvalue
+
+    elif test == 'rm_anova':
+        grand = x.mean(axis=(0, 1))
+        ss_effect = n * ((x.mean(axis=0) - grand)**2).sum(axis=0)
+        ss_subject = k * ((x.mean(axis=1) - grand)**2).sum(axis=0)
+        ss_error = ((x - grand)**2).sum(axis=(0, 1)) - ss_effect - ss_subject
+        F = (ss_effect / (k - 1)) / (ss_error / ((k - 1) * (n - 1)))
+        pval = stats.f.sf(F, k - 1, (k - 1) * (n - 1))
+
+    elif test == 'Mann-Whitney':
+        pval = stats.mannwhitneyu(groups[0], groups[1], axis=0, use_continuity=True, alternative='two-sided').pvalue
+
+    elif test == 'Wilcoxon':
+        pval = stats.wilcoxon(groups[0], groups[1], axis=0).pvalue
+
+    elif test == 'Kruskal':
+        pval = stats.kruskal(*groups, axis=0).pvalue
+
+    elif test == 'friedman':
+        ranked = stats.rankdata(x, axis=1)
+        ssbn = (ranked.sum(axis=0)**2).sum(axis=0)
+        ties = ((x[:, :, np.newaxis] == x[:, np.newaxis, :]).sum(axis=2)**2 - 1).sum(axis=(0, 1))
+        W = (12 * ssbn - 3 * n**2 * k * (k + 1)**2) / (n**2 * k * (k - 1) * (k + 1) - n * ties)
+        pval = stats.chi2.sf(n * (k - 1) * W, k - 1)
+
+    return pval
+
+
+#x, test, pairs = x, post_test, pairs
+def pg_compute_post_hoc_tensor(x, test, pairs):
+
+    """
+    x (subject, group, point), uncorrected p (pair, point) of the post hoc of pg_compute_post_hoc
+    nonparametric under 15 subjects falls back to the permutation test like permutation
+    """
+
+    n, k = x.shape[:2]
+    x_A, x_B = x[:, [pair[0] for pair in pairs]], x[:, [pair[1] for pair in pairs]]
+
+    if test == 'pairwise_tukey':
+        ms_error = (x.var(axis=0, ddof=1) * (n - 1)).sum(axis=0) / (n*k - k)
+        q = np.abs(x_A.mean(axis=0) - x_B.mean(axis=0)) / np.sqrt(ms_error / n)
+        pval = stats.studentized_range.sf(q, k, n*k - k)
+
+    elif test == 'pairwise_tests_paired_paramTrue':
+        pval = stats.ttest_rel(x_A, x_B, axis=0).pvalue
+
+    elif test == 'pairwise_tests_ind_paramFalse':
+        if n >= 15:
+            pval = stats.mannwhitneyu(x_A, x_B, axis=0, use_continuity=True, alternative='two-sided').pvalue
+        else:
+            pval = permutation_test_homemade(x_A, x_B, design='between', axis=0)
+
+    elif test == 'pairwise_tests_paired_paramFalse':
+        if n >= 15:
+            pval = stats.wilcoxon(x_A, x_B, axis=0).pvalue
+        else:
+            pval = permutation_test_homemade(x_A, x_B, design='within', axis=0)
+
+    return pval
+
+
+#data, dims, coords, predictor, subject = xr_minmax.values, list(xr_minmax.dims), coords, 'odor', 'sujet'
+def get_auto_stats_tensor(data, dims, coords, predictor, subject='sujet', design='within', alpha=0.05):
+
+    """
+    get_auto_stats_df for every point of a wide tensor at once, data numpy with dims names and coords {dim : labels}
+    the subject and predictor axes hold the samples, every other axis is the family of points
+    per point parametricity (Shapiro + Mauchly or Levene) picks the tests like guidelines, tests run vectorized
+    over all points that picked them
+    returns a long df, one row per point and predictor pair, with pre_test_pval_fdr and p_fdr the
+    Benjamini-Hochberg correction of pre_test_pval and p_unc across the family
+    """
+
+    family_dims = [dim for dim in dims if dim not in [subject, predictor]]
+
+    x = np.moveaxis(np.asarray(data, dtype='float'), [dims.index(subject), dims.index(predictor)], [0, 1])
+    x = x.reshape(x.shape[0], x.shape[1], -1)
+    n_points = x.shape[-1]
+
+    groups = list(coords[predictor])
+    pairs = list(itertools.combinations(range(len(groups)), 2))
+
+    #### parametricity per point
+    if design == 'within':
+        equal_var = sphericity_tensor(x, alpha)
+    elif design == 'between':
+        equal_var = homoscedasticity_tensor(x, alpha)
+
+    parametricity = normality_tensor(x, alpha) & equal_var
+
+    pre_test = np.zeros(n_points, dtype=object)
+    pre_pval = np.zeros(n_points)
+    post_pval = np.zeros((len(pairs), n_points))
+    post_pcorr = np.zeros((len(pairs), n_points))
+
+    #### each test once on the points that picked it
+    for param in [True, False]:
+
+        sel = parametricity == param
+
+        if sel.sum() == 0:
+            continue
+
+        tests = guidelines(pd.DataFrame({predictor : groups}), predictor, None, design, param)
+
+        pre_test[sel] = tests['pre']
+        pre_pval[sel] = pg_compute_pre_tensor(x[..., sel], tests['pre'])
+
+        if tests['post'] is None:
+            post_pval[:, sel] = pre_pval[sel]
+            post_pcorr[:, sel] = pre_pval[sel]
+        else:
+            post_pval[:, sel] = pg_compute_post_hoc_tensor(x[..., sel], tests['post'], pairs)
+            post_pcorr[:, sel] = holm_tensor(post_pval[:, sel], axis=0)
+
+    #### long df, points as outer loop like the query loops
+    family_index = pd.MultiIndex.from_product([coords[dim] for dim in family_dims], names=family_dims).to_frame(index=False)
+    df_stats = family_index.loc[np.repeat(np.arange(n_points), len(pairs))].reset_index(drop=True)
+
+    df_stats['pre_test'] = np.repeat(pre_test, len(pairs))
+    df_stats['pre_test_pval'] = np.repeat(np.round(pre_pval, 4), len(pairs))
+    df_stats['pre_test_pval_fdr'] = np.repeat(fdr_bh(pre_pval), len(pairs))
+    df_stats['Contrast'] = predictor
+    df_stats['A'] = np.tile([groups[pair[0]] for pair in pairs], n_points)
+    df_stats['B'] = np.tile([groups[pair[1]] for pair in pairs], n_points)
+    df_stats['p_unc'] = post_pval.T.reshape(-1)
+    df_stats['p_corr'] = post_pcorr.T.reshape(-1)
+    df_stats['p_fdr'] = fdr_bh(post_pval.T.reshape(-1))
+
+    return df_stats
+
@@ -1061,7 +1061,7 @@ if __name__== '__main__':
     time_vec = np.arange(0, section_time_general, 1/srate)
 
     xr_dict_preproc = {'sujet' : sujet_list, 'cond' : cond_list, 'chan' : chan_list, 'time' : time_vec}
-    xr_data_preproc = np.zeros(( len(sujet_list), len(cond_list), chan_list.shape[0], time_vec.shape[0] ))
+    xr_data_preproc = zeros_policy(( len(sujet_list), len(cond_list), chan_list.shape[0], time_vec.shape[0] ))
 
     os.chdir(path_prep)
 
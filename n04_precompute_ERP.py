@@ -165,9 +165,8 @@ def compute_ERP_stretch():
 
         xr_dict_stretch = {'sujet' : sujet_list, 'cond' : cond_list, 'nchan' : chan_list_eeg, 'phase' : np.arange(stretch_point_ERP)}
         
-        os.chdir(path_memmap)
-        data_stretch_ERP = np.memmap(f'data_stretch_ERP.dat', dtype=np.float64, mode='w+', shape=(len(sujet_list), len(cond_list), len(chan_list_eeg), stretch_point_ERP))
-        data_sem_stretch_ERP = np.memmap(f'data_sem_stretch_ERP.dat', dtype=np.float64, mode='w+', shape=(len(sujet_list), len(cond_list), len(chan_list_eeg), stretch_point_ERP))
+        data_stretch_ERP = scratch_memmap('data_stretch_ERP', (len(sujet_list), len(cond_list), len(chan_list_eeg), stretch_point_ERP))
+        data_sem_stretch_ERP = scratch_memmap('data_sem_stretch_ERP', (len(sujet_list), len(cond_list), len(chan_list_eeg), stretch_point_ERP))
 
         #sujet_i, sujet = 0, sujet_list[0]
         def get_stretch_data_for_ERP(sujet_i, sujet):
@@ -229,23 +228,12 @@ def compute_ERP_stretch():
         #### parallelize
         joblib.Parallel(n_jobs = n_core, prefer = 'processes')(joblib.delayed(get_stretch_data_for_ERP)(sujet_i, sujet) for sujet_i, sujet in enumerate(sujet_list))
 
-        #### load data in xr
-        xr_data_stretch = xr.DataArray(data=data_stretch_ERP, dims=xr_dict_stretch.keys(), coords=xr_dict_stretch.values())
-        xr_data_sem_stretch = xr.DataArray(data=data_sem_stretch_ERP, dims=xr_dict_stretch.keys(), coords=xr_dict_stretch.values())
+        #### load data in xr, out of scratch
+        xr_data_stretch = xr.DataArray(data=np.array(data_stretch_ERP), dims=xr_dict_stretch.keys(), coords=xr_dict_stretch.values())
+        xr_data_sem_stretch = xr.DataArray(data=np.array(data_sem_stretch_ERP), dims=xr_dict_stretch.keys(), coords=xr_dict_stretch.values())
 
-        os.chdir(path_memmap)
-        try:
-            os.remove(f'data_stretch_ERP.dat')
-            del data_stretch_ERP
-        except:
-            pass
-
-        os.chdir(path_memmap)
-        try:
-            os.remove(f'data_sem_stretch_ERP.dat')
-            del data_sem_stretch_ERP
-        except:
-            pass
+        release_scratch_memmap(data_stretch_ERP)
+        release_scratch_memmap(data_sem_stretch_ERP)
 
         #### save data
         os.chdir(os.path.join(path_precompute, 'ERP'))
@@ -264,7 +252,11 @@ def compute_ERP_stretch():
 
 
 # data_baseline, data_cond = data_baseline_chan, data_cond_chan
-def get_permutation_cluster_1d(data_baseline, data_cond, n_surr):
+def get_permutation_cluster_1d(data_baseline, data_cond, n_surr, mode_cluster=cluster_inference_mode):
+
+    #### max cluster mass or TFCE inference from the shared engine
+    if mode_cluster in ['mass', 'tfce']:
+        return get_permutation_cluster_mass(data_baseline, data_cond, n_surr, mode_inference={'mass' : 'cluster_mass', 'tfce' : 'tfce'}[mode_cluster])['mask_signi']
 
     if debug:
 
@@ -632,30 +624,34 @@ def get_cluster_stats_manual_prem_subject_wise(stretch=False):
 
 
 
-def shuffle_data_ERP(data):
+#data = data_chunk
+def shuffle_data_ERP(data, n_surr=None, seed=None):
 
-    ERP_shuffle = np.zeros(data.shape)
+    """
+    Trial average of circularly shifted trials, one surrogate (time) or n_surr surrogates (n_surr, time)
+    """
 
-    for ERP_i in range(data.shape[0]):
+    ERP_shuffle = np.concatenate(list(get_circular_shift_surrogates(data, 1 if n_surr is None else n_surr, mode='mean', seed=seed)))
 
-        cut = np.random.randint(0, data.shape[1], 1)[0]
-        ERP_shuffle[ERP_i,:data[ERP_i,cut:].shape[0]] = data[ERP_i,cut:]
-        ERP_shuffle[ERP_i,data[ERP_i,cut:].shape[0]:] = data[ERP_i,:cut]
+    if n_surr is None:
+        return ERP_shuffle[0]
 
-    return ERP_shuffle.mean(0)
+    return ERP_shuffle
 
 
 
 
-def shuffle_data_ERP_linear_based(data):
+#data = data_chunk
+def shuffle_data_ERP_linear_based(data, n_surr=None, seed=None):
 
-    ERP_shuffle = np.zeros(data.shape)
+    """
+    Circularly shifted trials, one surrogate (trials, time) or n_surr surrogates (n_surr, trials, time)
+    """
 
-    for ERP_i in range(data.shape[0]):
+    ERP_shuffle = np.concatenate(list(get_circular_shift_surrogates(data, 1 if n_surr is None else n_surr, mode='stack', seed=seed)))
 
-        cut = np.random.randint(0, data.shape[1], 1)[0]
-        ERP_shuffle[ERP_i,:data[ERP_i,cut:].shape[0]] = data[ERP_i,cut:]
-        ERP_shuffle[ERP_i,data[ERP_i,cut:].shape[0]:] = data[ERP_i,:cut]
+    if n_surr is None:
+        return ERP_shuffle[0]
 
     return ERP_shuffle
 
@@ -664,41 +660,19 @@ def shuffle_data_ERP_linear_based(data):
 
 
 #baseline_values, cond_values = xr_lm_data.loc[:, 'CO2', 'o', :, 'slope'].values, xr_lm_data.loc[:, 'CO2', '-', :, 'slope'].values
-def get_stats_topoplots(baseline_values, cond_values, chan_list_eeg):
-
-    data = {'sujet' : [], 'cond' : [], 'chan' : [], 'value' : []}
-
-    for sujet_i in range(baseline_values.shape[0]):
-
-        for chan_i, chan in enumerate(chan_list_eeg):
-
-            data['sujet'].append(sujet_i)
-            data['cond'].append('baseline')
-            data['chan'].append(chan)
-            data['value'].append(baseline_values[sujet_i, chan_i])
-
-            data['sujet'].append(sujet_i)
-            data['cond'].append('cond')
-            data['chan'].append(chan)
-            data['value'].append(cond_values[sujet_i, chan_i])
-    
-    df_stats = pd.DataFrame(data)
+def get_stats_topoplots(baseline_values, cond_values, chan_list_eeg, n_surr=ERP_n_surrogate, seed=None):
 
-    mask_signi = np.array((), dtype='bool')
+    """
+    Channels of a paired (sujet, chan) contrast inside a significant spatial cluster over the montage adjacency, FWER corrected
+    """
 
-    for chan in chan_list_eeg:
-
-        pval = get_stats_df(df=df_stats.query(f"chan == '{chan}'"), predictor='cond', outcome='value', subject='sujet', design='within')
-
-        if pval < 0.05:
-            mask_signi = np.append(mask_signi, True)
-        else:
-            mask_signi = np.append(mask_signi, False)
+    res_perm = get_permutation_cluster_spatiotemporal(baseline_values[..., np.newaxis], cond_values[..., np.newaxis], chan_list_eeg, n_surr, seed=seed)
+    mask_signi = res_perm['mask_signi'].any(axis=-1)
 
     if debug:
 
-        plt.hist(df_stats.query(f"chan == '{chan}' and cond == 'cond'")['value'].values, bins=50)
-        plt.hist(df_stats.query(f"chan == '{chan}' and cond == 'baseline'")['value'].values, bins=50)
+        plt.hist(cond_values.reshape(-1), bins=50)
+        plt.hist(baseline_values.reshape(-1), bins=50)
         plt.show()
 
     return mask_signi
@@ -715,65 +689,28 @@ def get_stats_topoplots(baseline_values, cond_values, chan_list_eeg):
 
 def get_permutation_cluster_1d_stretch_one_cond(data_cond, x, respfeatures_stretch, n_surr):
 
-    cycles_length = respfeatures_stretch[['inspi_index', 'expi_index', 'next_inspi_index']].diff(axis=1)[['expi_index', 'next_inspi_index']].values
-
-    n_trials_cond = cycles_length.shape[0]
-
-    respfeatures_surr = respfeatures_stretch.copy()
-    start_inspi_init = respfeatures_stretch['inspi_index'].values[0]
-
-    surr_cycles = np.zeros((n_trials_cond, 3), dtype='int')
-    surr_cycles[0,0] = start_inspi_init 
-    surr_erp_data = np.zeros((n_trials_cond, data_cond.shape[-1]))
     surr_erp_data_median = np.zeros((n_surr, data_cond.shape[-1]))
 
-    #surr_i = 0
-    for surr_i in range(n_surr):
-
-        #### shuffle
-        shuffle = np.random.choice(np.arange(n_trials_cond), size=n_trials_cond, replace=False)
-        cycles_length_shuffled = cycles_length[shuffle,:]
-
-        for cycle_i in range(cycles_length_shuffled.shape[0]):
-
-            if cycle_i == n_trials_cond-1:
-
-                surr_cycles[cycle_i,1] = surr_cycles[cycle_i,0] + cycles_length_shuffled[cycle_i,0]
-                surr_cycles[cycle_i,2] = surr_cycles[cycle_i,1] + cycles_length_shuffled[cycle_i,1]
-
-            else:
-
-                surr_cycles[cycle_i,1] = surr_cycles[cycle_i,0] + cycles_length_shuffled[cycle_i,0]
-                surr_cycles[cycle_i,2] = surr_cycles[cycle_i,1] + cycles_length_shuffled[cycle_i,1]
-                surr_cycles[cycle_i+1,0] = surr_cycles[cycle_i,2]
-
+    #### shuffled cycle surrogates, warped by blocks on the raw signal
+    surr_i = 0
+    for surr_erp_data in get_stretch_surrogates(x, respfeatures_stretch, stretch_point_ERP, n_surr):
 
-        respfeatures_surr.iloc[:,1], respfeatures_surr.iloc[:,2], respfeatures_surr.iloc[:,3] = surr_cycles[:,0], surr_cycles[:,1], surr_cycles[:,2]
-        respfeatures_surr.iloc[:,4], respfeatures_surr.iloc[:,5], respfeatures_surr.iloc[:,6] = respfeatures_surr.iloc[:,1]/srate, respfeatures_surr.iloc[:,2]/srate, respfeatures_surr.iloc[:,3]/srate
-
-        surr_erp_data, mean_inspi_ratio = stretch_data(respfeatures_surr, stretch_point_ERP, x, srate)
+        n_batch = surr_erp_data.shape[0]
 
         if debug:
-            for i in range(n_trials_cond):
-                plt.plot(surr_erp_data[i,:], alpha=0.4)
-            plt.plot(surr_erp_data.mean(axis=0), color='r')
+            for i in range(surr_erp_data.shape[1]):
+                plt.plot(surr_erp_data[0,i,:], alpha=0.4)
+            plt.plot(surr_erp_data[0].mean(axis=0), color='r')
             plt.show()
 
             plt.plot(data_cond.mean(axis=0), label='cond')
-            plt.plot(surr_erp_data.mean(axis=0), label='surr')
+            plt.plot(surr_erp_data[0].mean(axis=0), label='surr')
             plt.legend()
             plt.show()
             
-        #### inverse to have inspi on the right and expi on the left
-        # surr_erp_data = np.hstack((surr_erp_data[:,int(stretch_point_ERP/2):], surr_erp_data[:,:int(stretch_point_ERP/2)]))
-        
         #### export data
-        surr_erp_data_median[surr_i,:] = np.mean(surr_erp_data, axis=0)
-
-        if debug:
-
-            plt.plot(np.mean(surr_erp_data, axis=0))
-            plt.show()
+        surr_erp_data_median[surr_i:surr_i+n_batch,:] = np.mean(surr_erp_data, axis=1)
+        surr_i += n_batch
 
     # min, max = np.median(pixel_based_distrib[:,0,:], axis=0), np.median(pixel_based_distrib[:,1,:], axis=0) 
     min, max = np.percentile(surr_erp_data_median, 1, axis=0), np.percentile(surr_erp_data_median, 99, axis=0)
@@ -847,44 +784,28 @@ def get_permutation_cluster_1d_one_cond(data_cond, x, n_surr):
 
     n_trials_cond = data_cond.shape[0]
 
-    surr_erp_data = np.zeros((n_trials_cond*2, data_cond.shape[-1]))
     surr_erp_data_median = np.zeros((n_surr, data_cond.shape[-1]))
 
     pixel_based_distrib = np.zeros((n_surr, 2, data_cond.shape[-1]))
 
-    #surr_i = 0
-    for surr_i in range(n_surr):
+    #### random epochs by blocks of surrogates, clean ones averaged
+    surr_i = 0
+    for surr_erp_data, epoch_keep in get_epoch_surrogates(x, data_cond.shape[-1], n_trials_cond, n_surr):
 
-        #### shuffle
-        seeds = np.random.randint(low=0, high=x.size-data_cond.shape[-1], size=n_trials_cond*2)
+        n_batch = surr_erp_data.shape[0]
 
         if debug:
-
-            plt.plot(x)
-            plt.vlines(seeds, ymin=x.min(), ymax=x.max(), color='r')
-            plt.show()
-
-        for seed_i, seed in enumerate(seeds):
-            t_start = seed
-            t_stop = seed+data_cond.shape[-1]
-            x_chunk = x[t_start:t_stop]
-
-            surr_erp_data[seed_i,:] = (x_chunk - x_chunk.mean()) / x_chunk.std()
-
-        surr_erp_data_clean = surr_erp_data[((surr_erp_data <= -3) | (surr_erp_data >= 3)).sum(axis=1) == 0]
-        surr_erp_data_clean = surr_erp_data_clean[:n_trials_cond,:]
-
-        if debug:
-            for i in range(n_trials_cond):
-                plt.plot(surr_erp_data_clean[i,:])
+            for i in np.where(epoch_keep[0])[0]:
+                plt.plot(surr_erp_data[0,i,:])
             plt.show()
 
             plt.plot(data_cond.mean(axis=0), label='cond')
-            plt.plot(surr_erp_data_clean.mean(axis=0), label='surr')
+            plt.plot(surr_erp_data[0,epoch_keep[0]].mean(axis=0), label='surr')
             plt.legend()
             plt.show()
             
-        surr_erp_data_median[surr_i,:] = np.mean(surr_erp_data_clean, axis=0)
+        surr_erp_data_median[surr_i:surr_i+n_batch,:] = np.einsum('bet,be->bt', surr_erp_data, epoch_keep) / epoch_keep.sum(axis=1).reshape(-1,1)
+        surr_i += n_batch
 
     # min, max = np.median(pixel_based_distrib[:,0,:], axis=0), np.median(pixel_based_distrib[:,1,:], axis=0) 
     min, max = np.percentile(surr_erp_data_median, 1, axis=0), np.percentile(surr_erp_data_median, 99, axis=0)
@@ -907,21 +828,10 @@ def get_permutation_cluster_1d_one_cond(data_cond, x, n_surr):
         plt.legend()
         plt.show()
 
-        for i in range(400):
-
-            seeds = np.random.randint(low=0, high=x.size-data_cond.shape[-1], size=n_trials_cond*2)
-
-            for seed_i, seed in enumerate(seeds):
-                t_start = seed
-                t_stop = seed+data_cond.shape[-1]
-                x_chunk = x[t_start:t_stop]
-
-                surr_erp_data[seed_i,:] = (x_chunk - x_chunk.mean()) / x_chunk.std()
+        for surr_erp_data, epoch_keep in get_epoch_surrogates(x, data_cond.shape[-1], n_trials_cond, 400):
 
-            surr_erp_data_clean = surr_erp_data[((surr_erp_data <= -3) | (surr_erp_data >= 3)).sum(axis=1) == 0]
-            surr_erp_data_clean = surr_erp_data_clean[:n_trials_cond,:]
-
-            plt.plot(surr_erp_data_clean.mean(axis=0), alpha=0.3)
+            for i in range(surr_erp_data.shape[0]):
+                plt.plot(surr_erp_data[i,epoch_keep[i]].mean(axis=0), alpha=0.3)
 
         plt.plot(data_cond.mean(axis=0), color='r', label='cond')
         plt.show()
@@ -997,6 +907,7 @@ def compute_topoplot_stats_allsujet_perm(xr_data, perm_type):
     ch_types = ['eeg'] * len(chan_list_eeg)
     info = mne.create_info(chan_list_eeg, ch_types=ch_types, sfreq=srate)
     info.set_montage('standard_1020')
+    adjacency, adjacency_names = mne.channels.find_ch_adjacency(info, 'eeg')
 
     times = xr_data['time'].values
 
@@ -1047,36 +958,27 @@ def compute_topoplot_stats_allsujet_perm(xr_data, perm_type):
             data_perm = data_cond_red - data_baseline_red 
             data_perm_topo = data_perm.mean(axis=0)
 
-            #chan_i, chan = 0, chan_list_eeg[0]
-            for chan_i, chan in enumerate(chan_list_eeg):
-
-                data_baseline_chan = data_baseline[:, chan_i, :]
-                data_cond_chan = data_cond[:, chan_i, :] 
+            if perm_type == 'mne':
 
-                if perm_type == 'mne':
+                T_obs, clusters, clusters_p_values, H0 = spatio_temporal_cluster_1samp_test(
+                    (data_cond - data_baseline).transpose(0, 2, 1),
+                    adjacency=adjacency,
+                    n_permutations=1000,
+                    threshold=None,
+                    tail=0,
+                    n_jobs=4,
+                    out_type="mask",
+                    verbose=False
+                )
 
-                    data_perm = data_cond_chan - data_baseline_chan 
+                for cluster_i in np.where(clusters_p_values < 0.05)[0]:
+                    mask_signi |= clusters[cluster_i].any(axis=0)
 
-                    T_obs, clusters, clusters_p_values, H0 = permutation_cluster_1samp_test(
-                        data_perm,
-                        n_permutations=1000,
-                        threshold=None,
-                        tail=0,
-                        n_jobs=4,
-                        out_type="mask",
-                        verbose=False
-                    )
-
-                    if (clusters_p_values < 0.05).any():
-                        
-                        mask_signi[chan_i] = True
-
-                else:
-
-                    perm_vec = get_permutation_cluster_1d(data_baseline_chan, data_cond_chan, ERP_n_surrogate)
+            else:
 
-                    if perm_vec.sum() >= int(erp_time_cluster_thresh*1e-3*srate): 
-                        mask_signi[chan_i] = True 
+                res_perm = get_permutation_cluster_spatiotemporal(data_baseline, data_cond, chan_list_eeg, ERP_n_surrogate)
+                #### chan kept with at least erp_time_cluster_thresh ms inside significant clusters
+                mask_signi = res_perm['mask_signi'].sum(axis=-1) >= int(erp_time_cluster_thresh*1e-3*srate)
 
             ax = axs[odor_i, cond_i]
 
@@ -1143,37 +1045,28 @@ def compute_topoplot_stats_allsujet_perm(xr_data, perm_type):
             data_perm = data_cond_red - data_baseline_red 
             data_perm_topo = data_perm.mean(axis=0)
 
-            #chan_i, chan = 0, chan_list_eeg[0]
-            for chan_i, chan in enumerate(chan_list_eeg):
-
-                data_baseline_chan = data_baseline[:, chan_i, :]
-                data_cond_chan = data_cond[:, chan_i, :] 
-
-                if perm_type == 'mne':
+            if perm_type == 'mne':
 
-                    data_perm = data_cond_chan - data_baseline_chan 
+                T_obs, clusters, clusters_p_values, H0 = spatio_temporal_cluster_1samp_test(
+                    (data_cond - data_baseline).transpose(0, 2, 1),
+                    adjacency=adjacency,
+                    n_permutations=1000,
+                    threshold=None,
+                    tail=0,
+                    n_jobs=4,
+                    out_type="mask",
+                    verbose=False
+                )
 
-                    T_obs, clusters, clusters_p_values, H0 = permutation_cluster_1samp_test(
-                        data_perm,
-                        n_permutations=1000,
-                        threshold=None,
-                        tail=0,
-                        n_jobs=4,
-                        out_type="mask",
-                        verbose=False
-                    )
+                for cluster_i in np.where(clusters_p_values < 0.05)[0]:
+                    mask_signi |= clusters[cluster_i].any(axis=0)
 
-                    if (clusters_p_values < 0.05).any():
-                            
-                        mask_signi[chan_i] = True
-
-                else:
+            else:
 
-                    perm_vec = get_permutation_cluster_1d(data_baseline_chan, data_cond_chan, ERP_n_surrogate)
+                res_perm = get_permutation_cluster_spatiotemporal(data_baseline, data_cond, chan_list_eeg, ERP_n_surrogate)
+                #### chan kept with at least erp_time_cluster_thresh ms inside significant clusters
+                mask_signi = res_perm['mask_signi'].sum(axis=-1) >= int(erp_time_cluster_thresh*1e-3*srate)
 
-                    if perm_vec.sum() >= int(erp_time_cluster_thresh*1e-3*srate): 
-                        mask_signi[chan_i] = True 
-            
             ax = axs[odor_i, cond_i]
 
             ax.set_title(f"{cond} {odor}")
@@ -8,6 +8,7 @@ import mne
 import pandas as pd
 import xarray as xr
 import joblib
+import h5py
 
 from n00_config_params import *
 from n00bis_config_analysis_functions import *
@@ -19,6 +20,61 @@ debug = False
 
 
 
+################################
+######## BASELINES ########
+################################
+
+#sujet = sujet_list[0]
+def precompute_baselines(sujet):
+
+    path_baselines = os.path.join(path_precompute, sujet, 'baselines')
+
+    if os.path.exists(os.path.join(path_baselines, f'{sujet}_baselines.npy')):
+        print(f'{sujet} BASELINES ALREADY COMPUTED')
+        return
+
+    if os.path.exists(path_baselines) == False:
+        os.makedirs(path_baselines)
+
+    print(f'#### {sujet} BASELINES {baseline_cond} ####')
+
+    #### load
+    data = load_data_sujet(sujet, baseline_cond)
+    chan_sel_i = [chan_i for chan_i, chan in enumerate(chan_list_eeg) if chan in chan_list_eeg_short]
+    data = data[chan_sel_i,:]
+
+    wavelets = get_wavelets()
+
+    baselines = zeros_policy((data.shape[0], nfrex, len(baseline_stat_list)))
+
+    #chan_i = 0
+    def compute_baselines_nchan(chan_i):
+
+        print_advancement(chan_i, data.shape[0], steps=[25, 50, 75])
+
+        tf_i = get_tf_conv(data[chan_i,:], wavelets)
+
+        #### all stats in one pass over the chan
+        baselines[chan_i,:,:] = get_baseline_stats(tf_i)
+
+    joblib.Parallel(n_jobs = n_core, prefer = 'threads')(joblib.delayed(compute_baselines_nchan)(chan_i) for chan_i in range(data.shape[0]))
+
+    if debug:
+        for stat_i, stat in enumerate(baseline_stat_list):
+            plt.plot(frex, baselines[0,:,stat_i], label=stat)
+        plt.yscale('log')
+        plt.legend()
+        plt.show()
+
+    #### save
+    np.save(os.path.join(path_baselines, f'{sujet}_baselines.npy'), baselines)
+
+
+
+
+
+
+
 ################################
 ######## ALL CONV ########
 ################################
@@ -26,11 +82,13 @@ debug = False
 #sujet = sujet_list[0]
 def precompute_tf_all_conv(sujet):
 
+    #### ERP power is zscored on the baselines, computed here so the job never runs ahead of them
+    precompute_baselines(sujet)
+
     #cond = cond_list[0]
     for cond in cond_list:
 
-        os.chdir(os.path.join(path_precompute, 'TF', 'STRETCH'))
-        if os.path.exists(f'{sujet}_{cond}_tf_stretch.npy'):
+        if os.path.exists(os.path.join(path_precompute, 'TF', 'STRETCH', f'{sujet}_{cond}_tf_stretch.npy')) and os.path.exists(os.path.join(path_precompute, 'TF', 'ERP', f'{sujet}_{cond}_itc_erp.npy')):
             print(f'{sujet} {cond} ALREADY COMPUTED')
             continue
 
@@ -41,38 +99,60 @@ def precompute_tf_all_conv(sujet):
         chan_sel_i = [chan_i for chan_i, chan in enumerate(chan_list_eeg) if chan in chan_list_eeg_short]
         data = data[chan_sel_i,:]
 
-        #### convolution
+        #### convolution, inspi locked power and ITC from the same analytic signal
         wavelets = get_wavelets()
+        respfeatures = load_respfeatures(sujet)[cond]
+
+        #### power kept decimated per wavelet, rows grouped by decimation factor
+        q_list = get_tf_decimation_factors(wavelets['freqs'], wavelets['ncycles'])
+        q_groups = {q : np.where(q_list == q)[0] for q in np.unique(q_list)}
 
-        tf_conv = np.zeros((data.shape[0], nfrex, data.shape[1]))
+        tf_conv = {q : zeros_policy((data.shape[0], rows.size, int(np.ceil(data.shape[1]/q)))) for q, rows in q_groups.items()}
+        time_vec_erp = np.arange(ERP_time_vec[0], ERP_time_vec[1], 1/srate)
+        tf_erp = zeros_policy((data.shape[0], nfrex, time_vec_erp.size))
+        itc_erp = zeros_policy((data.shape[0], nfrex, time_vec_erp.size))
     
         #chan_i = 0
         def compute_tf_convolution_nchan(chan_i):
 
             print_advancement(chan_i, data.shape[0], steps=[25, 50, 75])
 
-            x = data[chan_i,:]
+            tf_complex = get_tf_conv(data[chan_i,:], wavelets, output='complex')
+            tf_erp[chan_i,:,:], itc_erp[chan_i,:,:] = get_tf_erp(tf_complex, respfeatures['inspi_index'].values)
 
-            tf_i = np.zeros((nfrex, x.shape[0]))
+            power = np.abs(tf_complex)**2
 
-            for fi in range(nfrex):
-                
-                tf_i[fi,:] = abs(scipy.signal.fftconvolve(x, wavelets[fi,:], 'same'))**2 
-
-            tf_conv[chan_i,:,:] = tf_i
+            for q, rows in q_groups.items():
+                tf_conv[q][chan_i,:,:] = decimate_tf(power[rows], q)
 
         joblib.Parallel(n_jobs = n_core, prefer = 'threads')(joblib.delayed(compute_tf_convolution_nchan)(chan_i) for chan_i in range(data.shape[0]))
 
         if debug:
-            plt.pcolormesh(tf_conv[0,:,:int(tf_conv.shape[-1]/4)])
+            q = q_list[-1]
+            plt.pcolormesh(tf_conv[q][0,:,:int(tf_conv[q].shape[-1]/4)])
+            plt.show()
+
+        #### inspi locked, normalized on the baseline cond
+        tf_erp = norm_tf(sujet, tf_erp, 'zscore_baseline')
+
+        os.makedirs(os.path.join(path_precompute, 'TF', 'ERP'), exist_ok=True)
+        os.chdir(os.path.join(path_precompute, 'TF', 'ERP'))
+        np.save(f'{sujet}_{cond}_tf_erp.npy', tf_erp)
+        np.save(f'{sujet}_{cond}_itc_erp.npy', itc_erp)
+
+        if debug:
+            plt.pcolormesh(time_vec_erp, frex, tf_erp[0,:,:])
+            plt.show()
+
+            plt.pcolormesh(time_vec_erp, frex, itc_erp[0,:,:])
             plt.show()
 
         #### stretch median
-        tf_stretch = np.zeros((len(chan_list_eeg_short), nfrex, stretch_point_ERP))
-        respfeatures = load_respfeatures(sujet)[cond]
+        tf_stretch = zeros_policy((len(chan_list_eeg_short), nfrex, stretch_point_ERP))
 
         for chan_i, chan in enumerate(chan_list_eeg_short):
-            tf_stretch[chan_i,:,:] = np.median(stretch_data_tf(respfeatures, stretch_point_ERP, tf_conv[chan_i,:,:], srate)[0], axis=0)
+            for q, rows in q_groups.items():
+                tf_stretch[chan_i,rows,:] = np.median(stretch_data_tf(respfeatures, stretch_point_ERP, tf_conv[q][chan_i,:,:], srate/q)[0], axis=0)
 
         if debug:
             tf_plot = tf_stretch[0,:,:]
@@ -120,9 +200,12 @@ if __name__ == '__main__':
 
     #sujet = sujet_list[0]
     for sujet in sujet_list:
-    
+
+        #### baselines run at the start of the conv job, zscore_baseline of the ERP power needs them
         # precompute_tf_all_conv(sujet)
         execute_function_in_slurm_bash('n05_precompute_TF', 'precompute_tf_all_conv', [sujet], n_core=15, mem='15G')
         #sync_folders__push_to_crnldata()
 
+    #### the TF store (compile_tf_store) is built on demand by n06 / n11 once every sujet is done
+
 
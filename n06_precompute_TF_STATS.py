@@ -37,25 +37,11 @@ def precompute_tf_STATS_allsujet(chan):
         return
 
     ######## LOAD ########
-    os.chdir(os.path.join(path_precompute, 'TF', 'STRETCH'))
+    print('#### LOAD ####', flush=True)
 
-    print('#### LOAD BASELINE ####', flush=True)
-
-    tf_stretch_baseline_allsujet = np.zeros((len(sujet_list), nfrex, stretch_point_ERP))
-
-    #sujet_i, sujet = 0, sujet_list[0]
-    for sujet_i, sujet in enumerate(sujet_list):
-
-        tf_stretch_baseline_allsujet[sujet_i,:,:] = np.load(f'{sujet}_VS_tf_stretch.npy')[np.where(chan_list_eeg_short == chan)[0][0],:,:]
-
-    print('#### LOAD COND ####', flush=True)
-
-    tf_stretch_cond_allsujet = np.zeros((len(sujet_list), nfrex, stretch_point_ERP))
-
-    #sujet_i, sujet = 0, sujet_list[47]
-    for sujet_i, sujet in enumerate(sujet_list):
-
-        tf_stretch_cond_allsujet[sujet_i,:,:] = np.load(f'{sujet}_CHARGE_tf_stretch.npy')[np.where(chan_list_eeg_short == chan)[0][0],:,:]
+    #### only the chan chunk is read from the store
+    tf_stretch_allsujet = load_tf_store_chan(chan, cond_sel=['VS', 'CHARGE'])
+    tf_stretch_baseline_allsujet, tf_stretch_cond_allsujet = tf_stretch_allsujet[0], tf_stretch_allsujet[1]
 
     ######## COMPUTE SURROGATES & STATS ########
 
@@ -83,6 +69,9 @@ def precompute_tf_STATS_allsujet(chan):
 
 if __name__ == '__main__':
 
+    #### store built or refreshed once here, before the per chan jobs read it
+    compile_tf_store()
+
     #chan = chan_list_eeg_short[0]
     for chan in chan_list_eeg_short:
                 
@@ -56,7 +56,7 @@ def get_MI_allsujet(stretch):
     else:
         time_vec = np.arange(ERP_time_vec[0], ERP_time_vec[1], 1/srate)
 
-    MI_allsujet = np.zeros((len(sujet_list), len(pairs_to_compute), len(cond_list), time_vec.size))
+    MI_allsujet = zeros_policy((len(sujet_list), len(pairs_to_compute), len(cond_list), time_vec.size))
 
     #### compute
     #sujet = sujet_list[0]
@@ -229,6 +229,26 @@ def get_MI_allsujet(stretch):
 ################################
 
 
+#data, wavelets = data, get_wavelets_fc(freq_band_fc[band])
+def get_convolutions_fc(data, wavelets):
+
+    """
+    Analytic signals (chan, freq, time) of data (chan, time) for the band wavelets
+    """
+
+    convolutions = zeros_policy((data.shape[0], wavelets['freqs'].size, data.shape[-1]), kind='complex')
+
+    #nchan_i = 0
+    for nchan_i in range(data.shape[0]):
+
+        print_advancement(nchan_i, data.shape[0], steps=[25, 50, 75])
+
+        convolutions[nchan_i,:,:] = convolve_wavelet_family(data[nchan_i,:], wavelets)
+
+    return convolutions
+
+
+
 def compilation_ispc_wpli(stretch):
 
     #### verify computation
@@ -264,9 +284,8 @@ def compilation_ispc_wpli(stretch):
     
     #### prep compute
     # xr_data = np.zeros((len(sujet_list), len(freq_band_fc_list), len(cond_list), 2, len(pairs_to_compute), time_vec.shape[0]))
-    os.chdir(path_memmap)
-    xr_data_ispc = np.memmap(f'res_fc_ispc_{stretch}.dat', dtype=np.float64, mode='w+', shape=(len(sujet_list), len(freq_band_fc_list), len(cond_list), len(pairs_to_compute), time_vec.shape[0]))
-    xr_data_wpli = np.memmap(f'res_fc_wpli_{stretch}.dat', dtype=np.float64, mode='w+', shape=(len(sujet_list), len(freq_band_fc_list), len(cond_list), len(pairs_to_compute), time_vec.shape[0]))
+    xr_data_ispc = scratch_memmap(f'res_fc_ispc_{stretch}', (len(sujet_list), len(freq_band_fc_list), len(cond_list), len(pairs_to_compute), time_vec.shape[0]))
+    xr_data_wpli = scratch_memmap(f'res_fc_wpli_{stretch}', (len(sujet_list), len(freq_band_fc_list), len(cond_list), len(pairs_to_compute), time_vec.shape[0]))
     xr_dict = {'sujet':sujet_list, 'band':freq_band_fc_list, 'cond':cond_list, 'pair':pairs_to_compute, 'time':time_vec}
 
     params_list = []
@@ -290,7 +309,7 @@ def compilation_ispc_wpli(stretch):
 
         #### load data
         data = load_data_sujet(sujet, cond)
-        data = data[[chan_i for chan_i, chan in enumerate(chan_list_eeg) if chan in chan_list_eeg_short]]
+        data = data[[chan_i for chan_i, chan in enumerate(chan_list_eeg) if chan in chan_list_eeg_short]].astype(get_dtype('float'))
         
         data_length = data.shape[-1]
 
@@ -298,28 +317,9 @@ def compilation_ispc_wpli(stretch):
 
         respfeatures_allcond = load_respfeatures(sujet)
 
-        #### initiate res
-        convolutions = np.zeros((len(chan_list_eeg_short), wavelets.shape[0], data_length), dtype=np.complex128)
-
         print('CONV')
 
-        #nchan_i = 0
-        # def convolution_x_wavelets_nchan(nchan_i, nchan):
-        for nchan_i in range(chan_list_eeg_short.size):
-
-            print_advancement(nchan_i, len(chan_list_eeg_short), steps=[25, 50, 75])
-            
-            nchan_conv = np.zeros((wavelets.shape[0], np.size(data,1)), dtype='complex')
-
-            x = data[nchan_i,:]
-
-            for fi in range(wavelets.shape[0]):
-
-                nchan_conv[fi,:] = scipy.signal.fftconvolve(x, wavelets[fi,:], 'same')
-
-            convolutions[nchan_i,:,:] = nchan_conv
-
-        # joblib.Parallel(n_jobs = n_core, prefer = 'processes')(joblib.delayed(convolution_x_wavelets_nchan)(nchan_i, nchan) for nchan_i, nchan in enumerate(chan_list_eeg))    
+        convolutions = get_convolutions_fc(data, wavelets)
 
         #### verif conv
         if debug:
@@ -361,9 +361,9 @@ def compilation_ispc_wpli(stretch):
             as1 = convolutions[pair_A_i,:,:]
             as2 = convolutions[pair_B_i,:,:]
 
-            cross_corr = np.zeros((as1.shape), dtype='complex128')
+            cross_corr = zeros_policy((as1.shape), kind='complex')
 
-            for fi in range(wavelets.shape[0]):
+            for fi in range(wavelets['freqs'].size):
 
                 cross_corr[fi,:] = scipy.signal.correlate(as1[fi,:], as2[fi,:], mode='same', method='fft') 
 
@@ -391,10 +391,10 @@ def compilation_ispc_wpli(stretch):
 
                 inspi_starts = respfeatures_allcond[cond]['inspi_index'].values
 
-                as1_chunk = np.zeros((inspi_starts.size, wavelets.shape[0], time_vec.size), dtype=np.complex128)
-                as2_chunk = np.zeros((inspi_starts.size, wavelets.shape[0], time_vec.size), dtype=np.complex128)
+                as1_chunk = zeros_policy((inspi_starts.size, wavelets['freqs'].size, time_vec.size), kind='complex')
+                as2_chunk = zeros_policy((inspi_starts.size, wavelets['freqs'].size, time_vec.size), kind='complex')
 
-                as_chunk_crosscorr = np.zeros((inspi_starts.size, wavelets.shape[0], time_vec.size), dtype=np.complex128)
+                as_chunk_crosscorr = zeros_policy((inspi_starts.size, wavelets['freqs'].size, time_vec.size), kind='complex')
 
                 if debug:
 
@@ -414,7 +414,7 @@ def compilation_ispc_wpli(stretch):
                     t_start = int(start_time + ERP_time_vec[0]*srate)
                     t_stop = int(start_time + ERP_time_vec[-1]*srate)
 
-                    if t_start < 0 or t_stop > x.size:
+                    if t_start < 0 or t_stop > data_length:
                         remove_i_list.append(start_i)
                         continue
 
@@ -480,18 +480,338 @@ def compilation_ispc_wpli(stretch):
         xr_wpli.to_netcdf(f"WPLI_allsujet.nc")
 
     #### clean
-    os.chdir(path_memmap)
-    try:
-        os.remove(f'res_fc_ispc_{stretch}.dat')
-        del xr_data
-    except:
-        pass
+    release_scratch_memmap(xr_data_ispc)
+    release_scratch_memmap(xr_data_wpli)
+
+
+
+
+
+
+################################
+######## SPECTRAL FC ########
+################################
+
+
+#conv_freq, respfeatures_cond = convolutions[:,fi,:], respfeatures_allcond[cond]
+def get_fc_epochs(conv_freq, respfeatures_cond, stretch, freq=None, ncycle=None):
+
+    """
+    Epochs (epoch, chan, time) of the analytic signals of one wavelet (chan, time), stretched cycles or inspi locked
+    ERP_time_vec windows as in get_pli_ispc, windows out of the recording left out
+    stretch with the wavelet freq / ncycle : demodulated and decimated before stretching (decimate_tf), the
+    inspi locked windows stay at srate
+    """
+
+    if stretch:
+
+        if freq is None:
+            return stretch_data_tf(respfeatures_cond, stretch_point_ERP, conv_freq, srate)[0]
+
+        q = get_tf_decimation_factors([freq], [ncycle])[0]
+
+        return stretch_data_tf(respfeatures_cond, stretch_point_ERP, decimate_tf(conv_freq, q, freqs=freq), srate/q)[0]
+
+    inspi_starts = respfeatures_cond['inspi_index'].values
+
+    t_start = (inspi_starts + ERP_time_vec[0]*srate).astype(int)
+    t_stop = (inspi_starts + ERP_time_vec[-1]*srate).astype(int)
+    t_start = t_start[(t_start >= 0) & (t_stop <= conv_freq.shape[-1])]
+
+    time_idx = t_start.reshape(-1,1) + np.arange(int((ERP_time_vec[-1] - ERP_time_vec[0])*srate))
+
+    return conv_freq[:, time_idx].transpose(1, 0, 2)
+
+
+
+#convolutions, respfeatures_cond = convolutions, respfeatures_allcond[cond]
+def get_csd_metrics(convolutions, respfeatures_cond, stretch, freqs=None, ncycles=None, batch_mem=perm_batch_mem):
+
+    """
+    Coherence, imaginary coherence, lagged coherence and debiased WPLI (chan, chan, time) of every pair at once,
+    from the cross spectral density S (chan, chan, time) over epochs, one einsum per wavelet
+    dWPLI sums over epochs : Im(S) from the same tensor, Im**2 from einsums of the squared real / imag parts,
+    |Im| accumulated over epoch blocks, metrics averaged over the band wavelets as ISPC / WPLI
+    """
+
+    n_freq = convolutions.shape[1]
+    metrics = {metric : 0 for metric in ['COH', 'ICOH', 'LCOH', 'DWPLI']}
+
+    #fi = 0
+    for fi in range(n_freq):
+
+        if freqs is None:
+            X = get_fc_epochs(convolutions[:,fi,:], respfeatures_cond, stretch).astype(np.complex128)
+        else:
+            X = get_fc_epochs(convolutions[:,fi,:], respfeatures_cond, stretch, freq=freqs[fi], ncycle=ncycles[fi]).astype(np.complex128)
+        n_epoch = X.shape[0]
+
+        S = np.einsum('ect,edt->cdt', X, np.conj(X)) / n_epoch
+        power = S[np.arange(S.shape[0]), np.arange(S.shape[0])].real
+        power_prod = power[:,np.newaxis,:] * power[np.newaxis,:,:]
+
+        metrics['COH'] += np.abs(S) / np.sqrt(power_prod) / n_freq
+        metrics['ICOH'] += np.abs(S.imag) / np.sqrt(power_prod) / n_freq
+        metrics['LCOH'] += np.abs(S.imag) / np.sqrt(np.clip(power_prod - S.real**2, 1e-30, None)) / n_freq
+
+        #### dWPLI, Im(x_i conj(x_j)) = v_i u_j - u_i v_j
+        u, v = X.real, X.imag
+        sum_im = n_epoch * S.imag
+        sum_im_sq = np.einsum('ect,edt->cdt', v**2, u**2) + np.einsum('ect,edt->cdt', u**2, v**2) - 2*np.einsum('ect,edt->cdt', u*v, u*v)
+
+        sum_abs_im = np.zeros(S.shape)
+        block_size = int(np.clip(batch_mem // (S.size*8*3), 1, n_epoch))
+
+        for block_start in range(0, n_epoch, block_size):
+
+            u_block, v_block = u[block_start:block_start+block_size], v[block_start:block_start+block_size]
+            sum_abs_im += np.abs(v_block[:,:,np.newaxis] * u_block[:,np.newaxis] - u_block[:,:,np.newaxis] * v_block[:,np.newaxis]).sum(axis=0)
+
+        metrics['DWPLI'] += (sum_im**2 - sum_im_sq) / np.where(sum_abs_im**2 - sum_im_sq > 0, sum_abs_im**2 - sum_im_sq, np.inf) / n_freq
+
+    return metrics
+
+
+
+#convolutions, respfeatures_cond = convolutions, respfeatures_allcond[cond]
+def get_aec_metrics(convolutions, respfeatures_cond, stretch, freqs=None, ncycles=None, batch_mem=perm_batch_mem):
+
+    """
+    Amplitude envelope correlation over epochs (chan, chan, time) of every pair at once,
+    AEC : one einsum of the envelopes z-scored over epochs
+    AEC_ORTH : envelope of x_j orthogonalized to x_i, |Im(x_j conj(x_i))| / |x_i|, correlated with |x_i| in chan blocks,
+    symmetrized over both directions, metrics averaged over the band wavelets
+    """
+
+    n_freq = convolutions.shape[1]
+    metrics = {metric : 0 for metric in ['AEC', 'AEC_ORTH']}
+
+    def _zscore(x):
+        std = x.std(axis=0)
+        return (x - x.mean(axis=0)) / np.where(std > 0, std, np.inf)
+
+    #fi = 0
+    for fi in range(n_freq):
+
+        if freqs is None:
+            X = get_fc_epochs(convolutions[:,fi,:], respfeatures_cond, stretch).astype(np.complex128)
+        else:
+            X = get_fc_epochs(convolutions[:,fi,:], respfeatures_cond, stretch, freq=freqs[fi], ncycle=ncycles[fi]).astype(np.complex128)
+        n_epoch, n_chan = X.shape[:2]
+
+        amp = np.abs(X)
+        amp_z = _zscore(amp)
+
+        metrics['AEC'] += np.einsum('ect,edt->cdt', amp_z, amp_z) / n_epoch / n_freq
+
+        #### orthogonalized, [i, j] : x_j orthogonalized to x_i
+        u, v = X.real, X.imag
+        aec_orth = np.zeros((n_chan, n_chan, X.shape[-1]))
+        block_size = int(np.clip(batch_mem // (X.size*8*3), 1, n_chan))
+
+        for block_start in range(0, n_chan, block_size):
 
-    try:
-        os.remove(f'res_fc_wpli_{stretch}.dat')
-        del xr_data
-    except:
-        pass
+            block = slice(block_start, block_start+block_size)
+            amp_orth = np.abs(v[:,np.newaxis] * u[:,block,np.newaxis] - u[:,np.newaxis] * v[:,block,np.newaxis]) / np.where(amp[:,block,np.newaxis] > 0, amp[:,block,np.newaxis], np.inf)
+            aec_orth[block] = (amp_z[:,block,np.newaxis] * _zscore(amp_orth)).mean(axis=0)
+
+        metrics['AEC_ORTH'] += (aec_orth + aec_orth.transpose(1,0,2)) / 2 / n_freq
+
+    return metrics
+
+
+
+def compilation_spectral_fc(stretch, fc_kind='csd'):
+
+    """
+    Allsujet arrays (sujet, band, cond, pair, time), same layout and files as ISPC / WPLI
+    fc_kind 'csd' : COH, ICOH, LCOH and DWPLI from get_csd_metrics, 'aec' : AEC and AEC_ORTH from get_aec_metrics
+    """
+
+    metric_list = {'csd' : ['COH', 'ICOH', 'LCOH', 'DWPLI'], 'aec' : ['AEC', 'AEC_ORTH']}[fc_kind]
+    get_metrics = {'csd' : get_csd_metrics, 'aec' : get_aec_metrics}[fc_kind]
+
+    #### verify computation
+    if all([os.path.exists(os.path.join(path_precompute, 'FC', metric, f'{metric}_allsujet{"_stretch" if stretch else ""}.nc')) for metric in metric_list]):
+        print(f'ALREADY DONE')
+        return
+
+    for metric in metric_list:
+        os.makedirs(os.path.join(path_precompute, 'FC', metric), exist_ok=True)
+
+    #### params
+    if stretch:
+        time_vec = np.arange(stretch_point_ERP)
+    else:
+        time_vec = np.arange(ERP_time_vec[0], ERP_time_vec[1], 1/srate)
+
+    pairs_to_compute = []
+
+    for pair_A in chan_list_eeg_short:
+
+        for pair_B in chan_list_eeg_short:
+
+            if pair_A == pair_B or f'{pair_A}-{pair_B}' in pairs_to_compute or f'{pair_B}-{pair_A}' in pairs_to_compute:
+                continue
+
+            pairs_to_compute.append(f'{pair_A}-{pair_B}')
+
+    pair_A_i = np.array([chan_list_eeg_short.tolist().index(pair.split('-')[0]) for pair in pairs_to_compute])
+    pair_B_i = np.array([chan_list_eeg_short.tolist().index(pair.split('-')[-1]) for pair in pairs_to_compute])
+
+    xr_dict = {'sujet':sujet_list, 'band':freq_band_fc_list, 'cond':cond_list, 'pair':pairs_to_compute, 'time':time_vec}
+    xr_data = {metric : scratch_memmap(f'res_fc_{metric}_{stretch}', tuple(len(coord) for coord in xr_dict.values())) for metric in metric_list}
+
+    params_list = [[sujet, cond, band] for sujet in sujet_list for cond in cond_list for band in freq_band_fc_list]
+
+    ######## COMPUTE FUNCTION ########
+    #sujet, cond, band = sujet_list[0], cond_list[0], freq_band_fc_list[0]
+    def get_spectral_fc(sujet, cond, band):
+
+        print(f'{sujet} {cond} {band} stretch:{stretch}')
+
+        data = load_data_sujet(sujet, cond)
+        data = data[[chan_i for chan_i, chan in enumerate(chan_list_eeg) if chan in chan_list_eeg_short]].astype(get_dtype('float'))
+
+        wavelets = get_wavelets_fc(freq_band_fc[band])
+        convolutions = get_convolutions_fc(data, wavelets)
+        metrics = get_metrics(convolutions, load_respfeatures(sujet)[cond], stretch, freqs=wavelets['freqs'], ncycles=wavelets['ncycles'])
+
+        for metric in metric_list:
+            xr_data[metric][sujet_list.index(sujet), freq_band_fc_list.index(band), cond_list.index(cond)] = metrics[metric][pair_A_i, pair_B_i, :]
+
+    joblib.Parallel(n_jobs = n_core, prefer = 'processes')(joblib.delayed(get_spectral_fc)(sujet, cond, band) for sujet, cond, band in params_list)
+
+    #### save
+    for metric in metric_list:
+
+        xr_metric = xr.DataArray(data=xr_data[metric], dims=xr_dict.keys(), coords=xr_dict.values())
+
+        os.chdir(os.path.join(path_precompute, 'FC', metric))
+        if stretch:
+            xr_metric.to_netcdf(f"{metric}_allsujet_stretch.nc")
+        else:
+            xr_metric.to_netcdf(f"{metric}_allsujet.nc")
+
+        release_scratch_memmap(xr_data[metric])
+
+
+
+
+
+
+################################
+######## DYNAMIC FC ########
+################################
+
+
+#convolutions, pairs_to_compute = convolutions, pairs_to_compute
+def get_dfc_sliding_win(convolutions, pairs_to_compute, win_size=dfc_win_size, step=dfc_win_step):
+
+    """
+    ISPC, WPLI and amplitude correlation (pair, metric, window) on sliding windows over the whole recording
+    window sums come from cumulative sums over time of the phase difference vector, the imaginary cross spectrum
+    and the amplitude moments so each window is O(1), metrics averaged over the band wavelets as in get_pli_ispc
+    """
+
+    n_times = convolutions.shape[-1]
+    win_len = int(win_size*srate)
+
+    win_start = np.arange(0, n_times - win_len + 1, int(step*srate))
+    win_stop = win_start + win_len
+    win_center = (win_start + win_len/2) / srate
+
+    #### cumulative sums, float64 to avoid drift on long recordings
+    def _cumsum(x):
+        return np.concatenate((np.zeros(x.shape[:-1] + (1,), dtype=x.dtype), np.cumsum(x, axis=-1)), axis=-1)
+
+    def _win_mean(cs):
+        return (cs[..., win_stop] - cs[..., win_start]) / win_len
+
+    chan_list = chan_list_eeg_short.tolist()
+    res_dfc = np.zeros((len(pairs_to_compute), 3, win_start.size))
+
+    #pair_i, pair = 0, pairs_to_compute[0]
+    for pair_i, pair in enumerate(pairs_to_compute):
+
+        pair_A, pair_B = pair.split('-')[0], pair.split('-')[-1]
+        as1, as2 = convolutions[chan_list.index(pair_A)].astype(np.complex128), convolutions[chan_list.index(pair_B)].astype(np.complex128)
+
+        amp1, amp2 = np.abs(as1), np.abs(as2)
+        cross_spectrum = as1 * np.conj(as2)
+
+        #### ISPC
+        cdd = cross_spectrum / np.where(amp1*amp2 > 0, amp1*amp2, 1)
+        res_dfc[pair_i, 0, :] = np.abs(_win_mean(_cumsum(cdd))).mean(axis=0)
+
+        #### WPLI
+        res_dfc[pair_i, 1, :] = (np.abs(_win_mean(_cumsum(cross_spectrum.imag))) / _win_mean(_cumsum(np.abs(cross_spectrum.imag)))).mean(axis=0)
+
+        #### amplitude correlation
+        mean1, mean2 = _win_mean(_cumsum(amp1)), _win_mean(_cumsum(amp2))
+        cov = _win_mean(_cumsum(amp1*amp2)) - mean1*mean2
+        var1 = np.clip(_win_mean(_cumsum(amp1**2)) - mean1**2, 0, None)
+        var2 = np.clip(_win_mean(_cumsum(amp2**2)) - mean2**2, 0, None)
+        res_dfc[pair_i, 2, :] = (cov / np.sqrt(var1*var2)).mean(axis=0)
+
+    if debug:
+
+        for metric_i, metric in enumerate(['ISPC', 'WPLI', 'AMPCORR']):
+            plt.plot(win_center, res_dfc[:,metric_i,:].mean(axis=0), label=metric)
+        plt.legend()
+        plt.show()
+
+    return res_dfc, win_center
+
+
+
+#sujet = sujet_list[0]
+def compute_dfc_sujet(sujet):
+
+    """
+    Dynamic FC of one sujet, {sujet}_{cond}_DFC.nc per cond (metric, pair, band, window) with window the window centers in sec,
+    pairs named as the other FC arrays for from_pairs_2mat, read back per metric with load_dfc_sujet
+    """
+
+    os.makedirs(os.path.join(path_precompute, 'FC', 'DFC'), exist_ok=True)
+
+    pairs_to_compute = []
+
+    for pair_A in chan_list_eeg_short:
+
+        for pair_B in chan_list_eeg_short:
+
+            if pair_A == pair_B or f'{pair_A}-{pair_B}' in pairs_to_compute or f'{pair_B}-{pair_A}' in pairs_to_compute:
+                continue
+
+            pairs_to_compute.append(f'{pair_A}-{pair_B}')
+
+    #cond = cond_list[0]
+    for cond in cond_list:
+
+        if os.path.exists(os.path.join(path_precompute, 'FC', 'DFC', f'{sujet}_{cond}_DFC.nc')):
+            print(f'ALREADY DONE DFC {sujet} {cond}')
+            continue
+
+        print(f'{sujet} {cond}', flush=True)
+
+        data = load_data_sujet(sujet, cond)
+        data = data[[chan_i for chan_i, chan in enumerate(chan_list_eeg) if chan in chan_list_eeg_short]].astype(get_dtype('float'))
+
+        res_dfc_bands = []
+
+        for band in freq_band_fc_list:
+
+            convolutions = get_convolutions_fc(data, get_wavelets_fc(freq_band_fc[band]))
+            res_dfc, win_center = get_dfc_sliding_win(convolutions, pairs_to_compute)
+            res_dfc_bands.append(res_dfc)
+
+        #### (band, pair, metric, window) -> (metric, pair, band, window)
+        xr_dict = {'metric' : ['ISPC', 'WPLI', 'AMPCORR'], 'pair' : pairs_to_compute, 'band' : freq_band_fc_list, 'window' : win_center}
+        xr_dfc = xr.DataArray(data=np.stack(res_dfc_bands).transpose(2, 1, 0, 3).astype(get_dtype('float')), dims=xr_dict.keys(), coords=xr_dict.values())
+
+        os.chdir(os.path.join(path_precompute, 'FC', 'DFC'))
+        xr_dfc.to_netcdf(f'{sujet}_{cond}_DFC.nc')
 
 
 
@@ -518,6 +838,20 @@ if __name__ == '__main__':
         #compilation_ispc_wpli(stretch)
         execute_function_in_slurm_bash('n07_precompute_FC', 'compilation_ispc_wpli', [stretch], n_core=15, mem='50G')
         #sync_folders__push_to_crnldata()
+
+        #compilation_spectral_fc(stretch)
+        execute_function_in_slurm_bash('n07_precompute_FC', 'compilation_spectral_fc', [stretch], n_core=15, mem='50G')
+
+        #compilation_spectral_fc(stretch, 'aec')
+        execute_function_in_slurm_bash('n07_precompute_FC', 'compilation_spectral_fc', [stretch, 'aec'], n_core=15, mem='50G')
+
+    ######## DYNAMIC FC ########
+
+    #sujet = sujet_list[0]
+    for sujet in sujet_list:
+
+        #compute_dfc_sujet(sujet)
+        execute_function_in_slurm_bash('n07_precompute_FC', 'compute_dfc_sujet', [sujet], n_core=15, mem='30G')
     
 
 
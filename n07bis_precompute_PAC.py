@@ -0,0 +1,129 @@
+
+
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+import scipy.signal
+import joblib
+import xarray as xr
+
+from n00_config_params import *
+from n00bis_config_analysis_functions import *
+
+debug = False
+
+
+
+
+
+
+################################
+######## PAC ########
+################################
+
+
+#sujet, cond = sujet_list[0], cond_list[0]
+def get_pac_sujet(sujet, cond):
+
+    """
+    MI / MVL comodulogram (chan, phase_band, amp_freq, metric) of one sujet and cond,
+    phase and amplitude from the wavelet filter bank of get_wavelets_fc, respiratory phase from respfeatures,
+    metric MI, MVL and their surrogate thresholds (percentile 95 of the shifted amplitude)
+    """
+
+    print(f'{sujet} {cond}', flush=True)
+
+    #### load data
+    data = load_data_sujet(sujet, cond)[:chan_list_eeg.size].astype(get_dtype('float'))
+    respfeatures = load_respfeatures(sujet)[cond]
+
+    wavelets_amp = [get_wavelets_fc(freq_band_fc[band]) for band in pac_amp_band_list]
+    wavelets_phase = {band : get_wavelets_fc(freq_band_fc[band]) for band in pac_phase_band_list if band != 'resp'}
+    amp_freqs = np.concatenate([wavelets['freqs'] for wavelets in wavelets_amp])
+
+    phase_resp = get_resp_phase(respfeatures, data.shape[-1], srate)
+
+    pac_sujet = np.zeros((chan_list_eeg.size, len(pac_phase_band_list), amp_freqs.size, 4))
+
+    #chan_i = 0
+    for chan_i in range(chan_list_eeg.size):
+
+        print_advancement(chan_i, chan_list_eeg.size, steps=[25, 50, 75])
+
+        x = data[chan_i,:]
+
+        amp = np.concatenate([np.abs(convolve_wavelet_family(x, wavelets)) for wavelets in wavelets_amp])
+
+        for phase_band_i, phase_band in enumerate(pac_phase_band_list):
+
+            if phase_band == 'resp':
+                phase = phase_resp
+            else:
+                #### band phase from the mean analytic signal of the band wavelets
+                phase = np.angle(np.mean(convolve_wavelet_family(x, wavelets_phase[phase_band]), axis=0))
+
+            distrib, MI, MVL, MI_surr, MVL_surr = get_pac_surr(phase, amp, n_surr_pac, seed=[sujet_list.index(sujet), cond_list.index(cond), chan_i, phase_band_i])
+
+            pac_sujet[chan_i, phase_band_i, :, 0], pac_sujet[chan_i, phase_band_i, :, 1] = MI, np.percentile(MI_surr, 95, axis=1)
+            pac_sujet[chan_i, phase_band_i, :, 2], pac_sujet[chan_i, phase_band_i, :, 3] = MVL, np.percentile(MVL_surr, 95, axis=1)
+
+        if debug:
+
+            plt.pcolormesh(amp_freqs, np.arange(len(pac_phase_band_list)), pac_sujet[chan_i,:,:,0])
+            plt.yticks(np.arange(len(pac_phase_band_list)), pac_phase_band_list)
+            plt.show()
+
+    return pac_sujet
+
+
+
+def compute_pac_allsujet():
+
+    """
+    Phase amplitude coupling of every sujet and cond, saved as PAC_allsujet.nc (sujet, cond, chan, phase_band, amp_freq, metric)
+    """
+
+    if os.path.exists(os.path.join(path_precompute, 'FC', 'PAC', 'PAC_allsujet.nc')):
+        print('ALREADY DONE PAC')
+        return
+
+    os.makedirs(os.path.join(path_precompute, 'FC', 'PAC'), exist_ok=True)
+
+    amp_freqs = np.concatenate([frex[(frex >= freq_band_fc[band][0]) & (frex <= freq_band_fc[band][-1])] for band in pac_amp_band_list])
+    metric_list = ['MI', 'MI_thresh', 'MVL', 'MVL_thresh']
+
+    xr_dict = {'sujet' : sujet_list, 'cond' : cond_list, 'chan' : chan_list_eeg, 'phase_band' : pac_phase_band_list, 'amp_freq' : amp_freqs, 'metric' : metric_list}
+    pac_allsujet = scratch_memmap('res_pac', tuple(len(coord) for coord in xr_dict.values()))
+
+    def get_pac_sujet_cond(sujet, cond):
+
+        pac_allsujet[sujet_list.index(sujet), cond_list.index(cond)] = get_pac_sujet(sujet, cond)
+
+    joblib.Parallel(n_jobs = n_core, prefer = 'processes')(joblib.delayed(get_pac_sujet_cond)(sujet, cond) for sujet in sujet_list for cond in cond_list)
+
+    #### save
+    xr_pac = xr.DataArray(data=np.array(pac_allsujet), dims=xr_dict.keys(), coords=xr_dict.values())
+
+    os.chdir(os.path.join(path_precompute, 'FC', 'PAC'))
+    xr_pac.to_netcdf('PAC_allsujet.nc')
+
+    #### clean
+    release_scratch_memmap(pac_allsujet)
+
+
+
+
+
+
+################################
+######## EXECUTE ########
+################################
+
+
+
+if __name__ == '__main__':
+
+    #compute_pac_allsujet()
+    execute_function_in_slurm_bash('n07bis_precompute_PAC', 'compute_pac_allsujet', [], n_core=15, mem='30G')
+    #sync_folders__push_to_crnldata()
+
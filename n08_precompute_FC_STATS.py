@@ -18,156 +18,155 @@ debug = False
 
 
 ########################################
-######## FC STATE ANALYSIS ########
+######## FC STATS ENGINE ########
 ########################################
 
 
 
 
-#stretch = True
-def compute_stats_MI_allsujet_state(stretch):
+#fc_metric, stretch = 'WPLI', True
+def load_fc_allsujet_array(fc_metric, stretch):
 
-    #fc_metric = 'MI'
-    for fc_metric in ['MI']:
+    """
+    Load FC allsujet once as numpy (sujet, band, cond, pair, time), MI gets a single 'MI' band so all metrics share the layout
+    """
 
-        #### verify computation
-        if stretch:
+    os.chdir(os.path.join(path_precompute, 'FC', fc_metric))
+    if stretch:
+        fc_allsujet = xr.open_dataarray(f'{fc_metric}_allsujet_stretch.nc')
+    else:
+        fc_allsujet = xr.open_dataarray(f'{fc_metric}_allsujet.nc')
 
-            if os.path.exists(os.path.join(path_precompute, 'FC', fc_metric, f'{fc_metric}_allsujet_STATS_state_stretch.nc')):
-                print(f'ALREADY DONE STATS {fc_metric} STRETCH')
-                continue
+    if 'band' not in fc_allsujet.dims:
+        fc_allsujet = fc_allsujet.expand_dims(band=[fc_metric])
 
-        else:
+    fc_allsujet = fc_allsujet.transpose('sujet', 'band', 'cond', 'pair', 'time')
 
-            if os.path.exists(os.path.join(path_precompute, 'FC', fc_metric, f'{fc_metric}_allsujet_STATS_state.nc')):
-                print(f'ALREADY DONE STATS {fc_metric}')
-                continue
+    fc_coords = {dim : fc_allsujet[dim].values for dim in fc_allsujet.dims}
+    fc_data = fc_allsujet.values
 
-        print(f'compute {fc_metric} stretch:{stretch}')
+    fc_allsujet.close()
 
-        #### load
-        os.chdir(os.path.join(path_precompute, 'FC', fc_metric))
-        if stretch:
-            fc_allsujet = xr.open_dataarray(f'{fc_metric}_allsujet_stretch.nc')
-        else:
-            fc_allsujet = xr.open_dataarray(f'{fc_metric}_allsujet.nc')
+    return fc_data, fc_coords
 
-        time_vec = fc_allsujet['time'].values
-        
-        if stretch:
-            time_vec_stats = time_vec
-        else:
-            time_vec_stats = time_vec <= 0
 
-        pairs_to_compute = fc_allsujet['pair'].values
 
-        if stretch:
+#time_vec, stretch = fc_coords['time'], True
+def get_fc_phase_index(time_vec, stretch):
 
-            phase_list = ['whole', 'I', 'T_IE', 'E', 'T_EI']
-            phase_shift = 125 
-            # 0-125, 125-375, 375-625, 625-875, 875-1000, shift on origial TF
-            phase_vec = {'whole' : np.arange(stretch_point_ERP), 'I' : np.arange(250), 'T_IE' : np.arange(250)+250, 'E' : np.arange(250)+500, 'T_EI' : np.arange(250)+750} 
+    """
+    Time index of every respi phase window on the unshifted axis, the roll by phase_shift becomes a modulo
+    not stretched : one 'whole' window on time <= 0
+    """
 
-            # pvals_wk = np.zeros((len(phase_list), pairs_to_compute.size))
-            pvals_perm = np.zeros((len(phase_list), pairs_to_compute.size))
+    if stretch == False:
+        return {'whole' : np.where(time_vec <= 0)[0]}
 
-            shifted_fc_allsujet = fc_allsujet.roll(time=-phase_shift, roll_coords=False)
+    phase_shift = 125 
+    # 0-125, 125-375, 375-625, 625-875, 875-1000, shift on origial TF
+    phase_vec = {'whole' : np.arange(stretch_point_ERP), 'I' : np.arange(250), 'T_IE' : np.arange(250)+250, 'E' : np.arange(250)+500, 'T_EI' : np.arange(250)+750} 
 
-            #phase_i, phase = 0, phase_list[0]
-            for phase_i, phase in enumerate(phase_list):
+    phase_index = {phase : (phase_vec[phase] + phase_shift) % time_vec.size for phase in phase_vec}
 
-                print(phase)
+    return phase_index
 
-                #pair_i, pair = 0, pairs_to_compute[0]
-                for pair_i, pair in enumerate(pairs_to_compute):
 
-                    # print_advancement(pair_i, len(pairs_to_compute))
 
-                    data_baseline = np.median(shifted_fc_allsujet.loc[:, pair, 'VS', phase_vec[phase]].values, axis=1)
-                    data_cond = np.median(shifted_fc_allsujet.loc[:, pair, 'CHARGE', phase_vec[phase]].values, axis=1)
+#fc_metric, stretch = 'WPLI', True
+def get_fc_stats_state(fc_metric, stretch):
 
-                    # stat, pvals_wk[phase_i, pair_i] = scipy.stats.wilcoxon(data_baseline, data_cond)
-                    pvals_perm[phase_i, pair_i] = get_permutation_2groups(data_baseline, data_cond, n_surr_fc)
+    """
+    Permutation VS vs CHARGE on the phase median of every (phase, band, pair) in one tensor call
+    """
 
-                    if debug:
+    fc_data, fc_coords = load_fc_allsujet_array(fc_metric, stretch)
+    phase_index = get_fc_phase_index(fc_coords['time'], stretch)
+    cond_list_fc = list(fc_coords['cond'])
 
-                        plt.hist(data_baseline, bins=50, alpha=0.5, label='VS')
-                        plt.hist(data_cond, bins=50, alpha=0.5, label='CHARGE')
-                        plt.vlines([np.median(data_baseline)], ymin=0, ymax=10, color='r')
-                        plt.vlines([np.median(data_cond)], ymin=0, ymax=10, color='r')
-                        plt.legend()
-                        plt.show()
+    #### median over each phase window, (sujet, phase, band, cond, pair)
+    fc_phase = np.stack([np.median(fc_data[..., phase_index[phase]], axis=-1) for phase in phase_index], axis=1)
 
-            # Apply Benjamini-Hochberg correction
-            # reject, pvals_adjusted, _, _ = multipletests(pvals_wk, alpha=0.05, method='fdr_bh')
+    data_baseline = fc_phase[:,:,:,cond_list_fc.index('VS'),:]
+    data_cond = fc_phase[:,:,:,cond_list_fc.index('CHARGE'),:]
 
-            if debug:
+    pvals_perm = get_permutation_2groups_tensor(data_baseline, data_cond, n_surr_fc)
 
-                plt.plot(pvals_perm, label='perm')
-                # plt.plot(reject, label='Benjamini-Hochberg')
-                plt.legend()
-                plt.show()
+    if debug:
 
-            #### export
-            fc_stats_dict = {'phase' : phase_list, 'pair' : pairs_to_compute}
+        plt.hist(data_baseline.reshape(-1), bins=50, alpha=0.5, label='VS', color='b')
+        plt.hist(data_cond.reshape(-1), bins=50, alpha=0.5, label='CHARGE', color='r')
+        plt.legend()
+        plt.show()
 
-            xr_fc_stats = xr.DataArray(data=pvals_perm, dims=fc_stats_dict.keys(), coords=fc_stats_dict.values())
-            
-            os.chdir(os.path.join(path_precompute, 'FC', fc_metric))
+        plt.plot(pvals_perm.reshape(-1), label='perm')
+        plt.legend()
+        plt.show()
 
-            xr_fc_stats.to_netcdf(f'{fc_metric}_allsujet_STATS_state_stretch.nc')
+    fc_stats_dict = {'phase' : list(phase_index.keys()), 'band' : fc_coords['band'], 'pair' : fc_coords['pair']}
 
-        else:
+    xr_fc_stats = xr.DataArray(data=pvals_perm.astype('float'), dims=fc_stats_dict.keys(), coords=fc_stats_dict.values())
 
-            # pvals_wk = np.zeros((pairs_to_compute.size))
-            pvals_perm = np.zeros((pairs_to_compute.size))
+    return xr_fc_stats
 
-            #pair_i, pair = 0, pairs_to_compute[0]
-            for pair_i, pair in enumerate(pairs_to_compute):
 
-                # print_advancement(pair_i, len(pairs_to_compute))
 
-                data_baseline = np.median(fc_allsujet.loc[:, pair, 'VS', time_vec_stats].values, axis=1)
-                data_cond = np.median(fc_allsujet.loc[:, pair, 'CHARGE', time_vec_stats].values, axis=1)
+#fc_metric, stretch = 'WPLI', True
+def get_fc_stats_time(fc_metric, stretch):
 
-                if debug:
+    """
+    Cluster permutation VS vs CHARGE along time for every (band, pair) in one tensor call, time > 0 left False when not stretched
+    """
 
-                    plt.hist(data_baseline, bins=50, alpha=0.5, label='VS')
-                    plt.hist(data_cond, bins=50, alpha=0.5, label='CHARGE')
-                    plt.vlines([np.median(data_baseline)], ymin=0, ymax=10, color='r')
-                    plt.vlines([np.median(data_cond)], ymin=0, ymax=10, color='r')
-                    plt.legend()
-                    plt.show()
+    fc_data, fc_coords = load_fc_allsujet_array(fc_metric, stretch)
+    time_vec = fc_coords['time']
+    cond_list_fc = list(fc_coords['cond'])
 
-                # stat, pvals_wk[pair_i] = scipy.stats.wilcoxon(data_baseline, data_cond)
-                pvals_perm[pair_i] = get_permutation_2groups(data_baseline, data_cond, n_surr_fc)
+    if stretch:
+        time_vec_stats = np.ones(time_vec.size, dtype='bool')
+    else:
+        time_vec_stats = time_vec <= 0
 
+    data_baseline = fc_data[:,:,cond_list_fc.index('VS'),:,:][..., time_vec_stats]
+    data_cond = fc_data[:,:,cond_list_fc.index('CHARGE'),:,:][..., time_vec_stats]
 
-            # Apply Benjamini-Hochberg correction
-            # reject, pvals_adjusted, _, _ = multipletests(pvals_wk, alpha=0.05, method='fdr_bh')
+    clusters = np.zeros((fc_coords['band'].size, fc_coords['pair'].size, time_vec.size))
+    clusters[..., time_vec_stats] = get_permutation_cluster_1d_tensor(data_baseline, data_cond, n_surr_fc)
 
-            if debug:
+    if debug:
 
-                plt.plot(pvals_perm, label='perm')
-                # plt.plot(reject, label='Benjamini-Hochberg')
-                plt.legend()
-                plt.show()
+        band_i, pair_i = 0, 0
+        min, max = np.concatenate((data_baseline[:,band_i,pair_i].mean(axis=0), data_cond[:,band_i,pair_i].mean(axis=0))).min(), np.concatenate((data_baseline[:,band_i,pair_i].mean(axis=0), data_cond[:,band_i,pair_i].mean(axis=0))).max()
+        fig, ax = plt.subplots()
+        ax.plot(time_vec[time_vec_stats], data_baseline[:,band_i,pair_i].mean(axis=0), label='VS')
+        ax.plot(time_vec[time_vec_stats], data_cond[:,band_i,pair_i].mean(axis=0), label='CHARGE')
+        ax.fill_between(time_vec, min, max, where=clusters[band_i,pair_i].astype('int'), alpha=0.3, color='r')
+        plt.show()
+
+    fc_stats_dict = {'band' : fc_coords['band'], 'pair' : fc_coords['pair'], 'time' : time_vec}
+
+    xr_fc_stats = xr.DataArray(data=clusters, dims=fc_stats_dict.keys(), coords=fc_stats_dict.values())
+
+    return xr_fc_stats
+
+
+
+
+
+
+
+
+########################################
+######## FC STATE ANALYSIS ########
+########################################
 
-            #### export
-            fc_stats_dict = {'pair' : pairs_to_compute}
 
-            xr_fc_stats = xr.DataArray(data=pvals_perm, dims=fc_stats_dict.keys(), coords=fc_stats_dict.values())
-            
-            os.chdir(os.path.join(path_precompute, 'FC', fc_metric))
 
-            xr_fc_stats.to_netcdf(f'{fc_metric}_allsujet_STATS_state.nc')
-    
 
 #stretch = True
-def compute_stats_ispc_wpli_allsujet_state(stretch):
+def compute_stats_MI_allsujet_state(stretch):
 
-    #fc_metric = 'WPLI'
-    for fc_metric in ['WPLI', 'ISPC']:
+    #fc_metric = 'MI'
+    for fc_metric in ['MI']:
 
         #### verify computation
         if stretch:
@@ -184,130 +183,47 @@ def compute_stats_ispc_wpli_allsujet_state(stretch):
 
         print(f'compute {fc_metric} stretch:{stretch}')
 
-        #### load
+        xr_fc_stats = get_fc_stats_state(fc_metric, stretch).isel(band=0, drop=True)
+
+        #### export
         os.chdir(os.path.join(path_precompute, 'FC', fc_metric))
-        if stretch:
-            fc_allsujet = xr.open_dataarray(f'{fc_metric}_allsujet_stretch.nc')
-        else:
-            fc_allsujet = xr.open_dataarray(f'{fc_metric}_allsujet.nc')
 
-        time_vec = fc_allsujet['time'].values
-        
         if stretch:
-            time_vec_stats = time_vec
+            xr_fc_stats.to_netcdf(f'{fc_metric}_allsujet_STATS_state_stretch.nc')
         else:
-            time_vec_stats = time_vec <= 0
-
-        pairs_to_compute = fc_allsujet['pair'].values
-
-        if stretch:
-
-            phase_list = ['whole', 'I', 'T_IE', 'E', 'T_EI']
-            phase_shift = 125 
-            # 0-125, 125-375, 375-625, 625-875, 875-1000, shift on origial TF
-            phase_vec = {'whole' : np.arange(stretch_point_ERP), 'I' : np.arange(250), 'T_IE' : np.arange(250)+250, 'E' : np.arange(250)+500, 'T_EI' : np.arange(250)+750} 
-
-            # pvals_wk = np.zeros((len(phase_list), len(freq_band_fc_list), pairs_to_compute.size))
-            pvals_perm = np.zeros((len(phase_list), len(freq_band_fc_list), pairs_to_compute.size))
-
-            shifted_fc_allsujet = fc_allsujet.roll(time=-phase_shift, roll_coords=False)
-
-            for phase_i, phase in enumerate(phase_list):
-
-                for band_i, band in enumerate(freq_band_fc_list):
-
-                    print(phase, band)
-
-                    #pair_i, pair = 0, pairs_to_compute[0]
-                    for pair_i, pair in enumerate(pairs_to_compute):
-
-                        # print_advancement(pair_i, len(pairs_to_compute))
-
-                        data_baseline = np.median(shifted_fc_allsujet.loc[:, band, 'VS', pair, phase_vec[phase]].values, axis=1)
-                        data_cond = np.median(shifted_fc_allsujet.loc[:, band, 'CHARGE', pair, phase_vec[phase]].values, axis=1)
+            xr_fc_stats.isel(phase=0, drop=True).to_netcdf(f'{fc_metric}_allsujet_STATS_state.nc')
+    
 
-                        # stat, pvals_wk[band_i, pair_i] = scipy.stats.wilcoxon(data_baseline, data_cond)
-                        pvals_perm[phase_i, band_i, pair_i] = get_permutation_2groups(data_baseline, data_cond, n_surr_fc)
+#stretch = True
+def compute_stats_ispc_wpli_allsujet_state(stretch):
 
-                        if debug:
+    #fc_metric = 'WPLI'
+    for fc_metric in fc_metric_band_list:
 
-                            plt.hist(data_baseline, bins=50, alpha=0.5, label='VS', color='b')
-                            plt.hist(data_cond, bins=50, alpha=0.5, label='CHARGE', color='r')
-                            plt.vlines([np.median(data_baseline)], ymin=0, ymax=10, color='b')
-                            plt.vlines([np.median(data_cond)], ymin=0, ymax=10, color='r')
-                            plt.title(f"signi:{pvals_perm[phase_i, band_i, pair_i]}")
-                            plt.legend()
-                            plt.show()
+        #### verify computation
+        if stretch:
 
+            if os.path.exists(os.path.join(path_precompute, 'FC', fc_metric, f'{fc_metric}_allsujet_STATS_state_stretch.nc')):
+                print(f'ALREADY DONE STATS {fc_metric} STRETCH')
+                continue
 
-            # Apply Benjamini-Hochberg correction
-            # for band_i in range(len(freq_band_fc_list)):
-            #     pvals_wk[band_i,:], pvals_adjusted, _, _ = multipletests(pvals_wk[band_i,:], alpha=0.05, method='fdr_bh')
+        else:
 
-            if debug:
+            if os.path.exists(os.path.join(path_precompute, 'FC', fc_metric, f'{fc_metric}_allsujet_STATS_state.nc')):
+                print(f'ALREADY DONE STATS {fc_metric}')
+                continue
 
-                plt.plot(pvals_perm, label='perm')
-                # plt.plot(pvals_wk, label='Benjamini-Hochberg')
-                plt.legend()
-                plt.show()
+        print(f'compute {fc_metric} stretch:{stretch}')
 
-            #### export
-            fc_stats_dict = {'phase' : phase_list, 'band' : freq_band_fc_list, 'pair' : pairs_to_compute}
+        xr_fc_stats = get_fc_stats_state(fc_metric, stretch)
 
-            xr_fc_stats = xr.DataArray(data=pvals_perm, dims=fc_stats_dict.keys(), coords=fc_stats_dict.values())
-            
-            os.chdir(os.path.join(path_precompute, 'FC', fc_metric))
+        #### export
+        os.chdir(os.path.join(path_precompute, 'FC', fc_metric))
 
+        if stretch:
             xr_fc_stats.to_netcdf(f'{fc_metric}_allsujet_STATS_state_stretch.nc')
-
         else:
-
-            # pvals_wk = np.zeros((len(freq_band_fc_list), pairs_to_compute.size))
-            pvals_perm = np.zeros((len(freq_band_fc_list), pairs_to_compute.size))
-
-            for band_i, band in enumerate(freq_band_fc_list):
-
-                print(band)
-
-                #pair_i, pair = 0, pairs_to_compute[0]
-                for pair_i, pair in enumerate(pairs_to_compute):
-
-                    # print_advancement(pair_i, len(pairs_to_compute))
-
-                    data_baseline = np.median(fc_allsujet.loc[:, band, 'VS', pair, time_vec_stats].values, axis=1)
-                    data_cond = np.median(fc_allsujet.loc[:, band, 'CHARGE', pair, time_vec_stats].values, axis=1)
-
-                    if debug:
-
-                        plt.hist(data_baseline, bins=50, alpha=0.5, label='VS')
-                        plt.hist(data_cond, bins=50, alpha=0.5, label='CHARGE')
-                        plt.vlines([np.median(data_baseline)], ymin=0, ymax=10, color='r')
-                        plt.vlines([np.median(data_cond)], ymin=0, ymax=10, color='r')
-                        plt.legend()
-                        plt.show()
-
-                    # stat, pvals_wk[band_i, pair_i] = scipy.stats.wilcoxon(data_baseline, data_cond)
-                    pvals_perm[band_i, pair_i] = get_permutation_2groups(data_baseline, data_cond, n_surr_fc)
-
-            # Apply Benjamini-Hochberg correction
-            # for band_i in range(len(freq_band_fc_list)):
-            #     pvals_wk[band_i,:], pvals_adjusted, _, _ = multipletests(pvals_wk[band_i,:], alpha=0.05, method='fdr_bh')
-
-            if debug:
-
-                plt.plot(pvals_perm, label='perm')
-                # plt.plot(pvals_wk, label='Benjamini-Hochberg')
-                plt.legend()
-                plt.show()
-
-            #### export
-            fc_stats_dict = {'band' : freq_band_fc_list, 'pair' : pairs_to_compute}
-
-            xr_fc_stats = xr.DataArray(data=pvals_perm, dims=fc_stats_dict.keys(), coords=fc_stats_dict.values())
-            
-            os.chdir(os.path.join(path_precompute, 'FC', fc_metric))
-
-            xr_fc_stats.to_netcdf(f'{fc_metric}_allsujet_STATS_state.nc')
+            xr_fc_stats.isel(phase=0, drop=True).to_netcdf(f'{fc_metric}_allsujet_STATS_state.nc')
 
 
     
@@ -342,115 +258,9 @@ def compute_stats_MI_allsujet_time(stretch):
             print(f'ALREADY DONE STATS MI')
             return
 
-    #### load
-    os.chdir(os.path.join(path_precompute, 'FC', 'MI'))
-    if stretch:
-        MI_allsujet = xr.open_dataarray('MI_allsujet_stretch.nc')
-    else:
-        MI_allsujet = xr.open_dataarray('MI_allsujet.nc')
-
-
-    #### verify computation
-    if stretch:
-
-        if os.path.exists(os.path.join(path_precompute, 'FC', 'MI', f'MI_allsujet_STATS_time_stretch.nc')):
-            print(f'ALREADY DONE STATS MI STRETCH')
-            return
-
-    else:
-
-        if os.path.exists(os.path.join(path_precompute, 'FC', 'MI', f'MI_allsujet_STATS_time.nc')):
-            print(f'ALREADY DONE STATS MI')
-            return
-
-    #### load
-    os.chdir(os.path.join(path_precompute, 'FC', 'MI'))
-    if stretch:
-        MI_allsujet = xr.open_dataarray('MI_allsujet_stretch.nc')
-    else:
-        MI_allsujet = xr.open_dataarray('MI_allsujet.nc')
-
-    time_vec = MI_allsujet['time'].values
-    
-    if stretch:
-        time_vec_stats = time_vec
-    else:
-        time_vec_stats = time_vec <= 0
-
-    pairs_to_compute = MI_allsujet['pair'].values
-
-    clusters = np.zeros((pairs_to_compute.size, time_vec.size))
-
-    #pair_i, pair = 5, pairs_to_compute[5]
-    for pair_i, pair in enumerate(pairs_to_compute):
-
-        print_advancement(pair_i, len(pairs_to_compute))
-
-        data_baseline = MI_allsujet.loc[:, pair, 'VS', time_vec_stats].values
-        data_cond = MI_allsujet.loc[:, pair, 'CHARGE', time_vec_stats].values
-
-        if debug:
-
-            for i in range(len(sujet_list)):
-                plt.plot(data_baseline[i,:], alpha=0.2)
-            plt.plot(data_baseline.mean(axis=0), color='k')
-            plt.show()
-
-            for i in range(len(sujet_list)):
-                plt.plot(data_cond[i,:], alpha=0.2)
-            plt.plot(data_cond.mean(axis=0), color='k')
-            plt.show()
-
-            plt.hist(data_baseline.reshape(-1), bins=50, alpha=0.5, label='VS')
-            plt.hist(data_cond.reshape(-1), bins=50, alpha=0.5, label='CHARGE')
-            plt.legend()
-            plt.show()
-
-        _cluster = get_permutation_cluster_1d(data_baseline, data_cond, n_surr_fc)
-
-        if debug:
-
-            mode = 'mean'
-
-            if mode == 'mean':
-                data_baseline_grouped = np.mean(data_baseline, axis=0)
-                data_cond_grouped = np.mean(data_cond, axis=0)
-            elif mode == 'median':
-                data_baseline_grouped = np.median(data_baseline, axis=0)
-                data_cond_grouped = np.median(data_cond, axis=0)
-            
-            time = np.arange(data_baseline.shape[-1])
-            sem_baseline = data_baseline.std(axis=0)/np.sqrt(data_baseline.shape[0])
-            sem_cond = data_cond.std(axis=0)/np.sqrt(data_cond.shape[0])
-
-            plt.plot(time, data_baseline_grouped, label='baseline', color='c')
-            plt.fill_between(time, data_baseline_grouped-sem_baseline, data_baseline_grouped+sem_baseline, color='c', alpha=0.5)
-            plt.plot(time, data_cond_grouped, label='cond', color='g')
-            plt.fill_between(time, data_cond_grouped-sem_cond, data_cond_grouped+sem_cond, color='g', alpha=0.5)
-            plt.fill_between(time, data_baseline_grouped.min(), data_cond_grouped.max(), where=_cluster, color='r', alpha=0.5)
-            plt.title(f'{pair} {pair_i}')
-            plt.legend()
-            plt.show()
-
-        if not stretch:
-            _cluster = np.concatenate((_cluster, np.zeros((time_vec.size - time_vec[time_vec_stats].size)).astype('bool')))
-
-        if debug:
-
-            min, max = np.concatenate((data_baseline.mean(axis=0), data_cond.mean(axis=0))).min(), np.concatenate((data_baseline.mean(axis=0), data_cond.mean(axis=0))).max()
-            fig, ax = plt.subplots()
-            ax.plot(time_vec, data_baseline.mean(axis=0), label='VS')
-            ax.plot(time_vec, data_cond.mean(axis=0), label='CHARGE')
-            ax.fill_between(time_vec, min, max, where=_cluster.astype('int'), alpha=0.3, color='r')
-            plt.show()
-
-        clusters[pair_i, :] = _cluster 
+    xr_MI_stats = get_fc_stats_time('MI', stretch).isel(band=0, drop=True)
 
     #### export
-    MI_stats_dict = {'pair' : pairs_to_compute, 'time' : time_vec}
-
-    xr_MI_stats = xr.DataArray(data=clusters, dims=MI_stats_dict.keys(), coords=MI_stats_dict.values())
-    
     os.chdir(os.path.join(path_precompute, 'FC', 'MI'))
 
     if stretch:
@@ -467,7 +277,7 @@ def compute_stats_MI_allsujet_time(stretch):
 def compute_stats_wpli_ispc_allsujet_time(stretch):
 
     #fc_metric = 'ISPC'
-    for fc_metric in ['ISPC', 'WPLI']:
+    for fc_metric in fc_metric_band_list:
 
         #### verify computation
         if stretch:
@@ -484,58 +294,9 @@ def compute_stats_wpli_ispc_allsujet_time(stretch):
             
         print(f'COMPUTE stretch:{stretch} {fc_metric}')
 
-        #### load
-        os.chdir(os.path.join(path_precompute, 'FC', fc_metric))
-        if stretch:
-            fc_allsujet = xr.open_dataarray(f'{fc_metric}_allsujet_stretch.nc')
-        else:
-            fc_allsujet = xr.open_dataarray(f'{fc_metric}_allsujet.nc')
-        
-        time_vec = fc_allsujet['time'].values
-
-        if stretch:    
-            time_vec_stats = time_vec
-        else:
-            time_vec_stats = time_vec <= 0
-
-        pairs_to_compute = fc_allsujet['pair'].values
-
-        clusters = np.zeros((len(freq_band_fc_list), pairs_to_compute.size, time_vec.size))
-
-        #band_i, band = 0, freq_band_fc_list[0]
-        for band_i, band in enumerate(freq_band_fc_list):
-
-            print(band)
-
-            #pair_i, pair = 1, pairs_to_compute[1]
-            for pair_i, pair in enumerate(pairs_to_compute):
-
-                print_advancement(pair_i, len(pairs_to_compute))
-
-                data_baseline = fc_allsujet.loc[:, band, 'VS', pair, time_vec_stats].values
-                data_cond = fc_allsujet.loc[:, band, 'CHARGE', pair, time_vec_stats].values
-
-                _cluster = get_permutation_cluster_1d(data_baseline, data_cond, n_surr_fc)
-
-                if not stretch:
-                    _cluster = np.concatenate((_cluster, np.zeros((time_vec.size - time_vec[time_vec_stats].size)).astype('bool')))
-
-                if debug:
-
-                    min, max = np.concatenate((data_baseline.mean(axis=0), data_cond.mean(axis=0))).min(), np.concatenate((data_baseline.mean(axis=0), data_cond.mean(axis=0))).max()
-                    fig, ax = plt.subplots()
-                    ax.plot(time_vec, data_baseline.mean(axis=0), label='VS')
-                    ax.plot(time_vec, data_cond.mean(axis=0), label='CHARGE')
-                    ax.fill_between(time_vec, min, max, where=_cluster.astype('int'), alpha=0.3, color='r')
-                    plt.show()
-
-                clusters[band_i, pair_i, :] = _cluster 
+        xr_fc_stats = get_fc_stats_time(fc_metric, stretch)
 
         #### export
-        fc_stats_dict = {'band' : freq_band_fc_list, 'pair' : pairs_to_compute, 'time' : time_vec}
-
-        xr_fc_stats = xr.DataArray(data=clusters, dims=fc_stats_dict.keys(), coords=fc_stats_dict.values())
-        
         os.chdir(os.path.join(path_precompute, 'FC', fc_metric))
 
         if stretch:
@@ -319,30 +319,34 @@ def compute_ERP_stretch():
 
 
 
-def shuffle_data_ERP(data):
+#data = data_chunk
+def shuffle_data_ERP(data, n_surr=None, seed=None):
 
-    ERP_shuffle = np.zeros(data.shape)
+    """
+    Trial average of circularly shifted trials, one surrogate (time) or n_surr surrogates (n_surr, time)
+    """
 
-    for ERP_i in range(data.shape[0]):
+    ERP_shuffle = np.concatenate(list(get_circular_shift_surrogates(data, 1 if n_surr is None else n_surr, mode='mean', seed=seed)))
 
-        cut = np.random.randint(0, data.shape[1], 1)[0]
-        ERP_shuffle[ERP_i,:data[ERP_i,cut:].shape[0]] = data[ERP_i,cut:]
-        ERP_shuffle[ERP_i,data[ERP_i,cut:].shape[0]:] = data[ERP_i,:cut]
+    if n_surr is None:
+        return ERP_shuffle[0]
 
-    return ERP_shuffle.mean(0)
+    return ERP_shuffle
 
 
 
 
-def shuffle_data_ERP_linear_based(data):
+#data = data_chunk
+def shuffle_data_ERP_linear_based(data, n_surr=None, seed=None):
 
-    ERP_shuffle = np.zeros(data.shape)
+    """
+    Circularly shifted trials, one surrogate (trials, time) or n_surr surrogates (n_surr, trials, time)
+    """
 
-    for ERP_i in range(data.shape[0]):
+    ERP_shuffle = np.concatenate(list(get_circular_shift_surrogates(data, 1 if n_surr is None else n_surr, mode='stack', seed=seed)))
 
-        cut = np.random.randint(0, data.shape[1], 1)[0]
-        ERP_shuffle[ERP_i,:data[ERP_i,cut:].shape[0]] = data[ERP_i,cut:]
-        ERP_shuffle[ERP_i,data[ERP_i,cut:].shape[0]:] = data[ERP_i,:cut]
+    if n_surr is None:
+        return ERP_shuffle[0]
 
     return ERP_shuffle
 
@@ -351,48 +355,66 @@ def shuffle_data_ERP_linear_based(data):
 
 
 #baseline_values, cond_values = xr_lm_data.loc[:, 'CO2', 'o', :, 'slope'].values, xr_lm_data.loc[:, 'CO2', '-', :, 'slope'].values
-def get_stats_topoplots(baseline_values, cond_values, chan_list_eeg):
+def get_stats_topoplots(baseline_values, cond_values, chan_list_eeg, n_surr=ERP_n_surrogate, seed=None):
 
-    data = {'sujet' : [], 'cond' : [], 'chan' : [], 'value' : []}
+    """
+    Channels of a paired (sujet, chan) contrast inside a significant spatial cluster over the montage adjacency, FWER corrected
+    """
 
-    for sujet_i in range(baseline_values.shape[0]):
+    res_perm = get_permutation_cluster_spatiotemporal(baseline_values[..., np.newaxis], cond_values[..., np.newaxis], chan_list_eeg, n_surr, seed=seed)
+    mask_signi = res_perm['mask_signi'].any(axis=-1)
 
-        for chan_i, chan in enumerate(chan_list_eeg):
+    if debug:
 
-            data['sujet'].append(sujet_i)
-            data['cond'].append('baseline')
-            data['chan'].append(chan)
-            data['value'].append(baseline_values[sujet_i, chan_i])
+        plt.hist(cond_values.reshape(-1), bins=50)
+        plt.hist(baseline_values.reshape(-1), bins=50)
+        plt.show()
 
-            data['sujet'].append(sujet_i)
-            data['cond'].append('cond')
-            data['chan'].append(chan)
-            data['value'].append(cond_values[sujet_i, chan_i])
-    
-    df_stats = pd.DataFrame(data)
+    return mask_signi
 
-    mask_signi = np.array((), dtype='bool')
 
-    for chan in chan_list_eeg:
 
-        pval = get_stats_df(df=df_stats.query(f"chan == '{chan}'"), predictor='cond', outcome='value', subject='sujet', design='within')
 
-        if pval < 0.05:
-            mask_signi = np.append(mask_signi, True)
-        else:
-            mask_signi = np.append(mask_signi, False)
 
-    if debug:
 
-        plt.hist(df_stats.query(f"chan == '{chan}' and cond == 'cond'")['value'].values, bins=50)
-        plt.hist(df_stats.query(f"chan == '{chan}' and cond == 'baseline'")['value'].values, bins=50)
-        plt.show()
 
-    return mask_signi
 
+#data_cond, X_time, time_vec_mask, n_surr = data_cond, time_vec, time_vec_mask, ERP_n_surrogate
+def get_PPI_slope_surr(data_cond, X_time, time_vec_mask, n_surr, percentile=5, seed=None):
+
+    """
+    Observed and circular shift surrogate slopes / intercepts of the ERP linear fit on time_vec_mask
+    slope and intercept are linear in the ERP, weights from the closed form cov / var, so a shifted epoch only enters through
+    its circular cross-correlation with the weights : one FFT per epoch for all shifts, then one (surr, epoch) index array of cuts
+    returns slope_observed, intercept_observed, surr (n_surr, 2) slope / intercept, thresh the percentile of the surrogate slopes
+    """
+
+    rng = np.random.default_rng(seed)
+
+    n_erp, n_time = data_cond.shape
+    X = X_time[time_vec_mask]
+
+    #### closed form weights, slope = w_slope @ Y, intercept = w_intercept @ Y
+    X_centered = X - X.mean()
+    w_slope = np.zeros(n_time)
+    w_slope[time_vec_mask] = X_centered / (X_centered**2).sum()
+    w_intercept = np.zeros(n_time)
+    w_intercept[time_vec_mask] = 1/X.size - X.mean()*X_centered / (X_centered**2).sum()
 
+    w_fit = np.stack((w_slope, w_intercept))
 
+    fit_observed = w_fit @ data_cond.mean(axis=0)
 
+    #### fit of every epoch at every circular shift, fit_shift[e, k] = sum_t w[t] * x[e, (t+k) % n_time]
+    fit_shift = np.fft.irfft(np.conj(np.fft.rfft(w_fit, axis=-1))[:,np.newaxis,:] * np.fft.rfft(data_cond, axis=-1)[np.newaxis,:,:], n=n_time, axis=-1)
+
+    #### all cuts at once, surrogate fit is the epoch mean of the shifted fits
+    cut = rng.integers(0, n_time, size=(n_surr, n_erp))
+    surr = fit_shift[:, np.arange(n_erp), cut].mean(axis=-1).T
+
+    thresh = np.percentile(surr[:,0], percentile)
+
+    return fit_observed[0], fit_observed[1], surr, thresh
 
 
 
@@ -555,32 +577,8 @@ def get_PPI_count(xr_data):
                             
                                 data_cond = data_chunk_allcond[cond][odor][nchan]
 
-                                Y = data_cond.mean(axis=0)[time_vec_mask]
-                                X = time_vec[time_vec_mask]
-
-                                slope_observed, intercept, r_value, p_value, std_err = scipy.stats.linregress(X, Y)
-
-                                _ERP_surr = np.zeros((ERP_n_surrogate))
-
-                                for surr_i in range(ERP_n_surrogate):
-
-                                    ERP_shuffle = np.zeros(data_cond.shape)
-
-                                    for erp_i in range(data_cond.shape[0]):
-
-                                        cut = np.random.randint(0, data_cond.shape[1], 1)[0]
-
-                                        ERP_shuffle[erp_i,:data_cond[:,cut:].shape[1]] = data_cond[erp_i,cut:]
-                                        ERP_shuffle[erp_i,data_cond[:,cut:].shape[1]:] = data_cond[erp_i,:cut]
-                                            
-                                    surr_i_mean = ERP_shuffle.mean(axis=0)
-
-                                    Y = surr_i_mean[time_vec_mask]
-                                    X = time_vec[time_vec_mask]
-
-                                    slope, intercept, r_value, p_value, std_err = scipy.stats.linregress(X, Y)
-                                    
-                                    _ERP_surr[surr_i] = slope
+                                slope_observed, intercept_observed, ERP_surr, thresh_surr = get_PPI_slope_surr(data_cond, time_vec, time_vec_mask, ERP_n_surrogate)
+                                _ERP_surr = ERP_surr[:,0]
 
                                 if debug:
 
@@ -601,7 +599,7 @@ def get_PPI_count(xr_data):
                                     plt.title(nchan)
                                     plt.show()
 
-                                if slope_observed < np.percentile(_ERP_surr, 5):
+                                if slope_observed < thresh_surr:
 
                                     xr_PPI_count.loc[examinateur, sujet, cond, odor, nchan] = 1
 
@@ -1684,91 +1682,29 @@ def get_df_stats(xr_data):
         # df_sig = xr_data.loc[:, :, :, :, time_vec_mask].min('time').to_dataframe(name='val').reset_index(drop=False)
         # df_sig = xr_data.loc[:, :, :, :, time_vec_mask].median('time').to_dataframe(name='val').reset_index(drop=False)
 
-        df_min = xr_data.loc[:, :, :, :, time_vec_mask].min('time').to_dataframe(name='val').reset_index(drop=False)
-        df_max = xr_data.loc[:, :, :, :, time_vec_mask].max('time').to_dataframe(name='val').reset_index(drop=False)
-
-        df_minmax = df_min.copy()
-        df_minmax['val'] = np.abs(df_min['val'].values) + np.abs(df_max['val'].values)
+        xr_minmax = np.abs(xr_data.loc[:, :, :, :, time_vec_mask].min('time')) + np.abs(xr_data.loc[:, :, :, :, time_vec_mask].max('time'))
 
-        #### plot
-        os.chdir(os.path.join(path_results, 'allplot', 'ERP', 'ERP_response_profile'))
+        sujet_group_sel = {'allsujet' : xr_minmax['sujet'].values, 'rep' : sujet_best_list_rev, 'non_rep' : sujet_no_respond_rev}
 
-        #### df generation
-        predictor = 'odor'
-        outcome = 'val'
+        #### one tensor call per group and contrast, FDR across (cond or odor, nchan)
+        df_stats_all = {'inter' : [], 'intra' : []}
 
-        for group_i, group in enumerate(sujet_group):
-
-            for nchan_i, nchan in enumerate(chan_list_eeg):
-
-                #cond_i, cond = 2, conditions[2]
-                for cond_i, cond in enumerate(conditions):
-
-                    if group == 'allsujet':
-                        # df_stats = df_sig.query(f"cond == '{cond}' and nchan == '{nchan}'")
-                        df_stats = df_minmax.query(f"cond == '{cond}' and nchan == '{nchan}'")
-                    if group == 'rep':
-                        # df_stats = df_sig.query(f"cond == '{cond}' and nchan == '{nchan}' and sujet in {sujet_best_list.tolist()}")
-                        df_stats = df_minmax.query(f"cond == '{cond}' and nchan == '{nchan}' and sujet in {sujet_best_list_rev.tolist()}")
-                    if group == 'non_rep':
-                        # df_stats = df_sig.query(f"cond == '{cond}' and nchan == '{nchan}' and sujet in {sujet_no_respond_rev.tolist()}")
-                        df_stats = df_minmax.query(f"cond == '{cond}' and nchan == '{nchan}' and sujet in {sujet_no_respond_rev.tolist()}")
-        
-                    if group_i + nchan_i + cond_i == 0:
-                        df_stats_all = get_auto_stats_df(df_stats, predictor, outcome, subject='sujet', design='within', transform=False, verbose=False)[['pre_test', 'pre_test_pval', 'Contrast', 'A', 'B', 'p_unc']]
-                        df_stats_all.insert(0, 'group', np.array([group]*df_stats_all.shape[0]))
-                        df_stats_all.insert(0, 'nchan', np.array([nchan]*df_stats_all.shape[0]))
-                        df_stats_all.insert(0, 'cond', np.array([cond]*df_stats_all.shape[0]))
-
-                    else:
-                        _df_stats_all = get_auto_stats_df(df_stats, predictor, outcome, subject='sujet', design='within', transform=False, verbose=False)[['pre_test', 'pre_test_pval', 'Contrast', 'A', 'B', 'p_unc']]
-                        _df_stats_all.insert(0, 'group', np.array([group]*_df_stats_all.shape[0]))
-                        _df_stats_all.insert(0, 'nchan', np.array([nchan]*_df_stats_all.shape[0]))
-                        _df_stats_all.insert(0, 'cond', np.array([cond]*_df_stats_all.shape[0]))
-                        df_stats_all = pd.concat([df_stats_all, _df_stats_all], axis=0)
-
-        df_stats_all['comp_type'] = np.array(['inter'] * df_stats_all.shape[0])
-        df_stats_all = df_stats_all.reset_index(drop=True)
-
-        df_stats_all_inter = df_stats_all.copy()
-
-        predictor = 'cond'
-        outcome = 'val'
-
-        for group_i, group in enumerate(sujet_group):
-
-            for nchan_i, nchan in enumerate(chan_list_eeg):
+        for group in sujet_group:
 
-                #odor_i, odor = 2, odor_list[2]
-                for odor_i, odor in enumerate(odor_list):
+            xr_group = xr_minmax.sel(sujet=sujet_group_sel[group], cond=conditions, odor=odor_list, nchan=chan_list_eeg)
+            coords = {dim : xr_group[dim].values for dim in xr_group.dims}
 
-                    if group == 'allsujet':
-                        # df_stats = df_sig.query(f"odor == '{odor}' and nchan == '{nchan}'")
-                        df_stats = df_minmax.query(f"odor == '{odor}' and nchan == '{nchan}'")
-                    if group == 'rep':
-                        # df_stats = df_sig.query(f"odor == '{odor}' and nchan == '{nchan}' and sujet in {sujet_best_list.tolist()}")
-                        df_stats = df_minmax.query(f"odor == '{odor}' and nchan == '{nchan}' and sujet in {sujet_best_list_rev.tolist()}")
-                    if group == 'non_rep':
-                        # df_stats = df_sig.query(f"odor == '{odor}' and nchan == '{nchan}' and sujet in {sujet_no_respond_rev.tolist()}")
-                        df_stats = df_minmax.query(f"odor == '{odor}' and nchan == '{nchan}' and sujet in {sujet_no_respond_rev.tolist()}")
-        
-                    if group_i + nchan_i + odor_i == 0:
-                        df_stats_all = get_auto_stats_df(df_stats, predictor, outcome, subject='sujet', design='within', transform=False, verbose=False)[['pre_test', 'pre_test_pval', 'Contrast', 'A', 'B', 'p_unc']]
-                        df_stats_all.insert(0, 'group', np.array([group]*df_stats_all.shape[0]))
-                        df_stats_all.insert(0, 'nchan', np.array([nchan]*df_stats_all.shape[0]))
-                        df_stats_all.insert(0, 'odor', np.array([odor]*df_stats_all.shape[0]))
+            #comp_type, predictor = 'inter', 'odor'
+            for comp_type, predictor in [('inter', 'odor'), ('intra', 'cond')]:
 
-                    else:
-                        _df_stats_all = get_auto_stats_df(df_stats, predictor, outcome, subject='sujet', design='within', transform=False, verbose=False)[['pre_test', 'pre_test_pval', 'Contrast', 'A', 'B', 'p_unc']]
-                        _df_stats_all.insert(0, 'group', np.array([group]*_df_stats_all.shape[0]))
-                        _df_stats_all.insert(0, 'nchan', np.array([nchan]*_df_stats_all.shape[0]))
-                        _df_stats_all.insert(0, 'odor', np.array([odor]*_df_stats_all.shape[0]))
-                        df_stats_all = pd.concat([df_stats_all, _df_stats_all], axis=0)
+                _df_stats_all = get_auto_stats_tensor(xr_group.values, list(xr_group.dims), coords, predictor, subject='sujet', design='within')
+                _df_stats_all.insert(2, 'group', np.array([group]*_df_stats_all.shape[0]))
+                _df_stats_all['comp_type'] = np.array([comp_type]*_df_stats_all.shape[0])
 
-        df_stats_all['comp_type'] = np.array(['intra'] * df_stats_all.shape[0])
-        df_stats_all = df_stats_all.reset_index(drop=True)
+                df_stats_all[comp_type].append(_df_stats_all)
 
-        df_stats_all_intra = df_stats_all.copy()
+        df_stats_all_inter = pd.concat(df_stats_all['inter'], axis=0).reset_index(drop=True)
+        df_stats_all_intra = pd.concat(df_stats_all['intra'], axis=0).reset_index(drop=True)
 
         df_stats_all_intra = df_stats_all_intra.query(f"A == 'FR_CV_1' or B == 'FR_CV_1'")
         df_stats_all_inter = df_stats_all_inter.query(f"A == 'o' or B == 'o'")
@@ -1778,8 +1714,9 @@ def get_df_stats(xr_data):
         df_stats_all_intra.to_excel('df_stats_all_intra.xlsx')
         df_stats_all_inter.to_excel('df_stats_all_inter.xlsx')
 
-        df_stats_all_intra.query(f"pre_test_pval <= 0.05 and p_unc <= 0.05").query(f"A == 'FR_CV_1' or B == 'FR_CV_1'").to_excel('df_stats_all_intra_signi.xlsx')
-        df_stats_all_inter.query(f"pre_test_pval <= 0.05 and p_unc <= 0.05").query(f"A == 'o' or B == 'o'").to_excel('df_stats_all_inter_signi.xlsx')
+        #### signi on the FDR corrected pre and post tests
+        df_stats_all_intra.query(f"pre_test_pval_fdr <= 0.05 and p_fdr <= 0.05").query(f"A == 'FR_CV_1' or B == 'FR_CV_1'").to_excel('df_stats_all_intra_signi.xlsx')
+        df_stats_all_inter.query(f"pre_test_pval_fdr <= 0.05 and p_fdr <= 0.05").query(f"A == 'o' or B == 'o'").to_excel('df_stats_all_inter_signi.xlsx')
 
         df_stats_all = {'intra' : df_stats_all_intra, 'inter' : df_stats_all_inter}
 
@@ -2026,65 +1963,28 @@ def get_cluster_stats(xr_data):
 
 def get_permutation_cluster_1d_stretch_one_cond(data_cond, x, respfeatures_stretch, n_surr):
 
-    cycles_length = respfeatures_stretch[['inspi_index', 'expi_index', 'next_inspi_index']].diff(axis=1)[['expi_index', 'next_inspi_index']].values
-
-    n_trials_cond = cycles_length.shape[0]
-
-    respfeatures_surr = respfeatures_stretch.copy()
-    start_inspi_init = respfeatures_stretch['inspi_index'].values[0]
-
-    surr_cycles = np.zeros((n_trials_cond, 3), dtype='int')
-    surr_cycles[0,0] = start_inspi_init 
-    surr_erp_data = np.zeros((n_trials_cond, data_cond.shape[-1]))
     surr_erp_data_median = np.zeros((n_surr, data_cond.shape[-1]))
 
-    #surr_i = 0
-    for surr_i in range(n_surr):
-
-        #### shuffle
-        shuffle = np.random.choice(np.arange(n_trials_cond), size=n_trials_cond, replace=False)
-        cycles_length_shuffled = cycles_length[shuffle,:]
-
-        for cycle_i in range(cycles_length_shuffled.shape[0]):
-
-            if cycle_i == n_trials_cond-1:
-
-                surr_cycles[cycle_i,1] = surr_cycles[cycle_i,0] + cycles_length_shuffled[cycle_i,0]
-                surr_cycles[cycle_i,2] = surr_cycles[cycle_i,1] + cycles_length_shuffled[cycle_i,1]
-
-            else:
-
-                surr_cycles[cycle_i,1] = surr_cycles[cycle_i,0] + cycles_length_shuffled[cycle_i,0]
-                surr_cycles[cycle_i,2] = surr_cycles[cycle_i,1] + cycles_length_shuffled[cycle_i,1]
-                surr_cycles[cycle_i+1,0] = surr_cycles[cycle_i,2]
-
+    #### shuffled cycle surrogates, warped by blocks on the raw signal
+    surr_i = 0
+    for surr_erp_data in get_stretch_surrogates(x, respfeatures_stretch, stretch_point_ERP, n_surr):
 
-        respfeatures_surr.iloc[:,1], respfeatures_surr.iloc[:,2], respfeatures_surr.iloc[:,3] = surr_cycles[:,0], surr_cycles[:,1], surr_cycles[:,2]
-        respfeatures_surr.iloc[:,4], respfeatures_surr.iloc[:,5], respfeatures_surr.iloc[:,6] = respfeatures_surr.iloc[:,1]/srate, respfeatures_surr.iloc[:,2]/srate, respfeatures_surr.iloc[:,3]/srate
-
-        surr_erp_data, mean_inspi_ratio = stretch_data(respfeatures_surr, stretch_point_ERP, x, srate)
+        n_batch = surr_erp_data.shape[0]
 
         if debug:
-            for i in range(n_trials_cond):
-                plt.plot(surr_erp_data[i,:], alpha=0.4)
-            plt.plot(surr_erp_data.mean(axis=0), color='r')
+            for i in range(surr_erp_data.shape[1]):
+                plt.plot(surr_erp_data[0,i,:], alpha=0.4)
+            plt.plot(surr_erp_data[0].mean(axis=0), color='r')
             plt.show()
 
             plt.plot(data_cond.mean(axis=0), label='cond')
-            plt.plot(surr_erp_data.mean(axis=0), label='surr')
+            plt.plot(surr_erp_data[0].mean(axis=0), label='surr')
             plt.legend()
             plt.show()
             
-        #### inverse to have inspi on the right and expi on the left
-        # surr_erp_data = np.hstack((surr_erp_data[:,int(stretch_point_ERP/2):], surr_erp_data[:,:int(stretch_point_ERP/2)]))
-        
         #### export data
-        surr_erp_data_median[surr_i,:] = np.mean(surr_erp_data, axis=0)
-
-        if debug:
-
-            plt.plot(np.mean(surr_erp_data, axis=0))
-            plt.show()
+        surr_erp_data_median[surr_i:surr_i+n_batch,:] = np.mean(surr_erp_data, axis=1)
+        surr_i += n_batch
 
     # min, max = np.median(pixel_based_distrib[:,0,:], axis=0), np.median(pixel_based_distrib[:,1,:], axis=0) 
     min, max = np.percentile(surr_erp_data_median, 1, axis=0), np.percentile(surr_erp_data_median, 99, axis=0)
@@ -2158,44 +2058,28 @@ def get_permutation_cluster_1d_one_cond(data_cond, x, n_surr):
 
     n_trials_cond = data_cond.shape[0]
 
-    surr_erp_data = np.zeros((n_trials_cond*2, data_cond.shape[-1]))
     surr_erp_data_median = np.zeros((n_surr, data_cond.shape[-1]))
 
     pixel_based_distrib = np.zeros((n_surr, 2, data_cond.shape[-1]))
 
-    #surr_i = 0
-    for surr_i in range(n_surr):
+    #### random epochs by blocks of surrogates, clean ones averaged
+    surr_i = 0
+    for surr_erp_data, epoch_keep in get_epoch_surrogates(x, data_cond.shape[-1], n_trials_cond, n_surr):
 
-        #### shuffle
-        seeds = np.random.randint(low=0, high=x.size-data_cond.shape[-1], size=n_trials_cond*2)
+        n_batch = surr_erp_data.shape[0]
 
         if debug:
-
-            plt.plot(x)
-            plt.vlines(seeds, ymin=x.min(), ymax=x.max(), color='r')
-            plt.show()
-
-        for seed_i, seed in enumerate(seeds):
-            t_start = seed
-            t_stop = seed+data_cond.shape[-1]
-            x_chunk = x[t_start:t_stop]
-
-            surr_erp_data[seed_i,:] = (x_chunk - x_chunk.mean()) / x_chunk.std()
-
-        surr_erp_data_clean = surr_erp_data[((surr_erp_data <= -3) | (surr_erp_data >= 3)).sum(axis=1) == 0]
-        surr_erp_data_clean = surr_erp_data_clean[:n_trials_cond,:]
-
-        if debug:
-            for i in range(n_trials_cond):
-                plt.plot(surr_erp_data_clean[i,:])
+            for i in np.where(epoch_keep[0])[0]:
+                plt.plot(surr_erp_data[0,i,:])
             plt.show()
 
             plt.plot(data_cond.mean(axis=0), label='cond')
-            plt.plot(surr_erp_data_clean.mean(axis=0), label='surr')
+            plt.plot(surr_erp_data[0,epoch_keep[0]].mean(axis=0), label='surr')
             plt.legend()
             plt.show()
             
-        surr_erp_data_median[surr_i,:] = np.mean(surr_erp_data_clean, axis=0)
+        surr_erp_data_median[surr_i:surr_i+n_batch,:] = np.einsum('bet,be->bt', surr_erp_data, epoch_keep) / epoch_keep.sum(axis=1).reshape(-1,1)
+        surr_i += n_batch
 
     # min, max = np.median(pixel_based_distrib[:,0,:], axis=0), np.median(pixel_based_distrib[:,1,:], axis=0) 
     min, max = np.percentile(surr_erp_data_median, 1, axis=0), np.percentile(surr_erp_data_median, 99, axis=0)
@@ -2218,21 +2102,10 @@ def get_permutation_cluster_1d_one_cond(data_cond, x, n_surr):
         plt.legend()
         plt.show()
 
-        for i in range(400):
-
-            seeds = np.random.randint(low=0, high=x.size-data_cond.shape[-1], size=n_trials_cond*2)
+        for surr_erp_data, epoch_keep in get_epoch_surrogates(x, data_cond.shape[-1], n_trials_cond, 400):
 
-            for seed_i, seed in enumerate(seeds):
-                t_start = seed
-                t_stop = seed+data_cond.shape[-1]
-                x_chunk = x[t_start:t_stop]
-
-                surr_erp_data[seed_i,:] = (x_chunk - x_chunk.mean()) / x_chunk.std()
-
-            surr_erp_data_clean = surr_erp_data[((surr_erp_data <= -3) | (surr_erp_data >= 3)).sum(axis=1) == 0]
-            surr_erp_data_clean = surr_erp_data_clean[:n_trials_cond,:]
-
-            plt.plot(surr_erp_data_clean.mean(axis=0), alpha=0.3)
+            for i in range(surr_erp_data.shape[0]):
+                plt.plot(surr_erp_data[i,epoch_keep[i]].mean(axis=0), alpha=0.3)
 
         plt.plot(data_cond.mean(axis=0), color='r', label='cond')
         plt.show()
@@ -2284,7 +2157,11 @@ def get_permutation_cluster_1d_one_cond(data_cond, x, n_surr):
 
 
 # data_baseline, data_cond = data_baseline_chan, data_cond_chan
-def get_permutation_cluster_1d(data_baseline, data_cond, n_surr):
+def get_permutation_cluster_1d(data_baseline, data_cond, n_surr, mode_cluster=cluster_inference_mode):
+
+    #### max cluster mass or TFCE inference from the shared engine
+    if mode_cluster in ['mass', 'tfce']:
+        return get_permutation_cluster_mass(data_baseline, data_cond, n_surr, mode_inference={'mass' : 'cluster_mass', 'tfce' : 'tfce'}[mode_cluster])['mask_signi']
 
     n_trials_baselines = data_baseline.shape[0]
     n_trials_cond = data_cond.shape[0]
@@ -3413,6 +3290,7 @@ def compute_topoplot_stats_allsujet_perm(xr_data, perm_type):
     ch_types = ['eeg'] * len(chan_list_eeg)
     info = mne.create_info(chan_list_eeg, ch_types=ch_types, sfreq=srate)
     info.set_montage('standard_1020')
+    adjacency, adjacency_names = mne.channels.find_ch_adjacency(info, 'eeg')
 
     times = xr_data['time'].values
 
@@ -3463,36 +3341,27 @@ def compute_topoplot_stats_allsujet_perm(xr_data, perm_type):
             data_perm = data_cond_red - data_baseline_red 
             data_perm_topo = data_perm.mean(axis=0)
 
-            #chan_i, chan = 0, chan_list_eeg[0]
-            for chan_i, chan in enumerate(chan_list_eeg):
-
-                data_baseline_chan = data_baseline[:, chan_i, :]
-                data_cond_chan = data_cond[:, chan_i, :] 
-
-                if perm_type == 'mne':
+            if perm_type == 'mne':
 
-                    data_perm = data_cond_chan - data_baseline_chan 
+                T_obs, clusters, clusters_p_values, H0 = spatio_temporal_cluster_1samp_test(
+                    (data_cond - data_baseline).transpose(0, 2, 1),
+                    adjacency=adjacency,
+                    n_permutations=1000,
+                    threshold=None,
+                    tail=0,
+                    n_jobs=4,
+                    out_type="mask",
+                    verbose=False
+                )
 
-                    T_obs, clusters, clusters_p_values, H0 = permutation_cluster_1samp_test(
-                        data_perm,
-                        n_permutations=1000,
-                        threshold=None,
-                        tail=0,
-                        n_jobs=4,
-                        out_type="mask",
-                        verbose=False
-                    )
+                for cluster_i in np.where(clusters_p_values < 0.05)[0]:
+                    mask_signi |= clusters[cluster_i].any(axis=0)
 
-                    if (clusters_p_values < 0.05).any():
-                        
-                        mask_signi[chan_i] = True
-
-                else:
-
-                    perm_vec = get_permutation_cluster_1d(data_baseline_chan, data_cond_chan, ERP_n_surrogate)
+            else:
 
-                    if perm_vec.sum() >= int(erp_time_cluster_thresh*1e-3*srate): 
-                        mask_signi[chan_i] = True 
+                res_perm = get_permutation_cluster_spatiotemporal(data_baseline, data_cond, chan_list_eeg, ERP_n_surrogate)
+                #### chan kept with at least erp_time_cluster_thresh ms inside significant clusters
+                mask_signi = res_perm['mask_signi'].sum(axis=-1) >= int(erp_time_cluster_thresh*1e-3*srate)
 
             ax = axs[odor_i, cond_i]
 
@@ -3559,37 +3428,28 @@ def compute_topoplot_stats_allsujet_perm(xr_data, perm_type):
             data_perm = data_cond_red - data_baseline_red 
             data_perm_topo = data_perm.mean(axis=0)
 
-            #chan_i, chan = 0, chan_list_eeg[0]
-            for chan_i, chan in enumerate(chan_list_eeg):
-
-                data_baseline_chan = data_baseline[:, chan_i, :]
-                data_cond_chan = data_cond[:, chan_i, :] 
+            if perm_type == 'mne':
 
-                if perm_type == 'mne':
+                T_obs, clusters, clusters_p_values, H0 = spatio_temporal_cluster_1samp_test(
+                    (data_cond - data_baseline).transpose(0, 2, 1),
+                    adjacency=adjacency,
+                    n_permutations=1000,
+                    threshold=None,
+                    tail=0,
+                    n_jobs=4,
+                    out_type="mask",
+                    verbose=False
+                )
 
-                    data_perm = data_cond_chan - data_baseline_chan 
+                for cluster_i in np.where(clusters_p_values < 0.05)[0]:
+                    mask_signi |= clusters[cluster_i].any(axis=0)
 
-                    T_obs, clusters, clusters_p_values, H0 = permutation_cluster_1samp_test(
-                        data_perm,
-                        n_permutations=1000,
-                        threshold=None,
-                        tail=0,
-                        n_jobs=4,
-                        out_type="mask",
-                        verbose=False
-                    )
-
-                    if (clusters_p_values < 0.05).any():
-                            
-                        mask_signi[chan_i] = True
-
-                else:
+            else:
 
-                    perm_vec = get_permutation_cluster_1d(data_baseline_chan, data_cond_chan, ERP_n_surrogate)
+                res_perm = get_permutation_cluster_spatiotemporal(data_baseline, data_cond, chan_list_eeg, ERP_n_surrogate)
+                #### chan kept with at least erp_time_cluster_thresh ms inside significant clusters
+                mask_signi = res_perm['mask_signi'].sum(axis=-1) >= int(erp_time_cluster_thresh*1e-3*srate)
 
-                    if perm_vec.sum() >= int(erp_time_cluster_thresh*1e-3*srate): 
-                        mask_signi[chan_i] = True 
-            
             ax = axs[odor_i, cond_i]
 
             ax.set_title(f"{cond} {odor}")
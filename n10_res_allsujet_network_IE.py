@@ -8,7 +8,6 @@ import joblib
 import gc
 import xarray as xr
 import seaborn as sns
-import cv2
 from matplotlib.animation import FuncAnimation
 
 from n00_config_params import *
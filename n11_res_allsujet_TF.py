@@ -40,30 +40,10 @@ def save_tf_allsujet(chan):
         return
 
     #### load data
-    data_allcond = {}
-    print('#### LOAD BASELINE ####', flush=True)
-
-    os.chdir(os.path.join(path_precompute, 'TF', 'STRETCH'))
-
-    tf_stretch_baseline_allsujet = np.zeros((len(sujet_list), nfrex, stretch_point_ERP))
-
-    #sujet_i, sujet = 46, sujet_list[46]
-    for sujet_i, sujet in enumerate(sujet_list):
-
-        tf_stretch_baseline_allsujet[sujet_i,:,:] = np.load(f'{sujet}_VS_tf_stretch.npy')[np.where(chan_list_eeg_short == chan)[0][0],:,:]
-
-    data_allcond['VS'] = np.median(tf_stretch_baseline_allsujet, axis=0)
-
-    print('#### LOAD COND ####', flush=True)
-
-    tf_stretch_cond_allsujet = np.zeros((len(sujet_list), nfrex, stretch_point_ERP))
-
-    #sujet_i, sujet = 0, sujet_list[47]
-    for sujet_i, sujet in enumerate(sujet_list):
-
-        tf_stretch_cond_allsujet[sujet_i,:,:] = np.load(f'{sujet}_CHARGE_tf_stretch.npy')[np.where(chan_list_eeg_short == chan)[0][0],:,:]
+    print('#### LOAD DATA ####', flush=True)
 
-    data_allcond['CHARGE'] = np.median(tf_stretch_cond_allsujet, axis=0)
+    tf_stretch_allsujet = load_tf_store_chan(chan)
+    data_allcond = {cond : np.median(tf_stretch_allsujet[cond_i], axis=0) for cond_i, cond in enumerate(cond_list)}
     
     #### load data thresh
     os.chdir(os.path.join(path_precompute, 'TF', 'STRETCH_STATS'))
@@ -129,27 +109,10 @@ def save_tf_subjectwise(chan):
         return
 
     #### load data
-    print('#### LOAD BASELINE ####', flush=True)
-
-    os.chdir(os.path.join(path_precompute, 'TF', 'STRETCH'))
-
-    tf_stretch_baseline_allsujet = np.zeros((len(sujet_list), nfrex, stretch_point_ERP))
-
-    #sujet_i, sujet = 46, sujet_list[46]
-    for sujet_i, sujet in enumerate(sujet_list):
-
-        tf_stretch_baseline_allsujet[sujet_i,:,:] = np.load(f'{sujet}_VS_tf_stretch.npy')[np.where(chan_list_eeg_short == chan)[0][0],:,:]
-
-    print('#### LOAD COND ####', flush=True)
-
-    tf_stretch_cond_allsujet = np.zeros((len(sujet_list), nfrex, stretch_point_ERP))
-
-    #sujet_i, sujet = 0, sujet_list[47]
-    for sujet_i, sujet in enumerate(sujet_list):
-
-        tf_stretch_cond_allsujet[sujet_i,:,:] = np.load(f'{sujet}_CHARGE_tf_stretch.npy')[np.where(chan_list_eeg_short == chan)[0][0],:,:]    
+    print('#### LOAD DATA ####', flush=True)
 
-    data_allcond = {'VS' : tf_stretch_baseline_allsujet, 'CHARGE' : tf_stretch_cond_allsujet}
+    tf_stretch_allsujet = load_tf_store_chan(chan)
+    data_allcond = {cond : tf_stretch_allsujet[cond_i] for cond_i, cond in enumerate(cond_list)}
 
     #### plot 
     #sujet_i, sujet = 0, sujet_list[0]
@@ -223,21 +186,8 @@ def save_topoplot_allsujet():
     #### load data
     print('#### LOAD DATA ####', flush=True)
 
-    tf = np.zeros((len(cond_list), len(chan_list_eeg_short), nfrex, stretch_point_ERP))
-    tf_stretch_allsujet = np.zeros((len(sujet_list), len(chan_list_eeg_short), nfrex, stretch_point_ERP))
-
-    os.chdir(os.path.join(path_precompute, 'TF', 'STRETCH'))
-
-    for cond_i, cond in enumerate(cond_list):
-
-        print(cond)
-
-        #sujet_i, sujet = 46, sujet_list[46]
-        for sujet_i, sujet in enumerate(sujet_list):
-
-            tf_stretch_allsujet[sujet_i,:,:,:] = np.load(f'{sujet}_{cond}_tf_stretch.npy')
-
-        tf[cond_i, :, :, :] = np.median(tf_stretch_allsujet, axis=0)
+    #### median across sujet chunk by chan chunk, never the whole store in memory
+    tf = get_tf_store_allsujet_median()
 
     tf_diff = tf[1,:,:,:] - tf[0,:,:,:]
 
@@ -335,6 +285,9 @@ def save_topoplot_allsujet():
 
 if __name__ == '__main__':
 
+    #### store built or refreshed once here, before the per chan reads
+    compile_tf_store()
+
     #chan = chan_list_eeg_short[0]
     for chan in chan_list_eeg_short:
                 
@@ -68,7 +68,7 @@ def plot_allsujet_FC_chunk():
     for stretch in [True, False]:
 
         #fc_metric = 'MI'
-        for fc_metric in ['MI', 'ISPC', 'WPLI']:
+        for fc_metric in ['MI'] + fc_metric_band_list:
 
             print(f'{fc_metric} PLOT stretch:{stretch}', flush=True)
 
@@ -210,7 +210,7 @@ def plot_allsujet_FC_mat():
     for stretch in [True, False]:
 
         #fc_metric = 'MI'
-        for fc_metric in ['MI', 'ISPC', 'WPLI']:
+        for fc_metric in ['MI'] + fc_metric_band_list:
 
             print(f'{fc_metric} PLOT stretch:{stretch}', flush=True)
 
@@ -619,7 +619,7 @@ def plot_allsujet_FC_graph_stretch():
     stretch=True
 
     #fc_metric = 'WPLI'
-    for fc_metric in ['MI', 'ISPC', 'WPLI']:
+    for fc_metric in ['MI'] + fc_metric_band_list:
 
         print(f'{fc_metric} PLOT stretch:{stretch}', flush=True)
 
@@ -854,7 +854,7 @@ def plot_allsujet_FC_graph_stretch():
 #     stretch=False
 
 #     #fc_metric = 'MI'
-#     for fc_metric in ['MI', 'ISPC', 'WPLI']:
+#     for fc_metric in ['MI'] + fc_metric_band_list:
 
 #         print(f'{fc_metric} PLOT stretch:{stretch}', flush=True)
 
@@ -1035,6 +1035,68 @@ def plot_allsujet_FC_graph_stretch():
 
 
 
+################################
+######## PLOT DFC ########
+################################
+
+
+def plot_allsujet_DFC():
+
+    """
+    Node strength time course of the sliding window FC (load_dfc_sujet), one graph per window with from_pairs_2mat,
+    median across sujet on the windows shared by every sujet, one figure per metric and band, one subplot per cond
+    """
+
+    os.makedirs(os.path.join(path_results, 'FC', 'DFC'), exist_ok=True)
+
+    #fc_metric = 'ISPC'
+    for fc_metric in ['ISPC', 'WPLI', 'AMPCORR']:
+
+        print(f'{fc_metric} PLOT DFC', flush=True)
+
+        #band = freq_band_fc_list[0]
+        for band in freq_band_fc_list:
+
+            fig, axs = plt.subplots(ncols=len(cond_list), figsize=(15, 5), sharey=True)
+
+            for cond_i, cond in enumerate(cond_list):
+
+                strength_allsujet = []
+
+                for sujet in sujet_list:
+
+                    dfc = load_dfc_sujet(sujet, cond, fc_metric).loc[:, band, :]
+                    pairs = dfc['pair'].values
+                    strength_allsujet.append(np.stack([from_pairs_2mat(dfc.values[:, win_i], pairs).sum(axis=1) for win_i in range(dfc['window'].size)], axis=-1))
+
+                #### recordings differ in length, windows cut to the shortest
+                n_win = np.min([strength.shape[-1] for strength in strength_allsujet])
+                strength_median = np.median(np.stack([strength[:, :n_win] for strength in strength_allsujet]), axis=0)
+                time_vec = dfc['window'].values[:n_win]
+
+                ax = axs[cond_i]
+
+                for chan_i, chan in enumerate(sorted(set([ch for pair in pairs for ch in pair.split("-")]))):
+                    ax.plot(time_vec, strength_median[chan_i, :], label=chan)
+
+                ax.set_title(cond)
+                ax.set_xlabel("Time (s)")
+                if cond_i == 0:
+                    ax.set_ylabel("Node strength")
+
+            axs[-1].legend(fontsize=6)
+            plt.suptitle(f"{fc_metric} {band} DFC")
+
+            os.chdir(os.path.join(path_results, 'FC', 'DFC'))
+            fig.savefig(f'{fc_metric}_{band}_DFC_strength.jpeg', dpi=150)
+
+            plt.close('all')
+
+
+
+
+
+
 ################################
 ######## EXECUTE ########
 ################################
@@ -1045,6 +1107,7 @@ if __name__ == '__main__':
     plot_allsujet_FC_chunk()
     plot_allsujet_FC_mat()
     plot_allsujet_FC_graph_stretch()
+    plot_allsujet_DFC()
     # plot_allsujet_FC_graph_nostretch()
 
 
@@ -0,0 +1,63 @@
+
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from n00bis_config_analysis_functions import get_tfce
+
+
+
+
+################################
+######## GET TFCE ########
+################################
+
+
+#stat, dh = stat, 0.1
+def get_tfce_1d_loop(stat, dh, E=0.5, H=2):
+
+    """
+    Reference 1d tfce, one threshold and one cluster at a time
+    """
+
+    tfce = np.zeros(stat.shape)
+
+    for sign in [1, -1]:
+
+        x = sign*stat
+
+        for h in dh*np.arange(1, np.ceil(x.max()/dh)):
+
+            mask = x > h
+            edges = np.diff(np.concatenate(([0], mask.astype(int), [0])))
+            for start, stop in zip(np.where(edges == 1)[0], np.where(edges == -1)[0]):
+                tfce[start:stop] += sign * (stop - start)**E * h**H * dh
+
+    return tfce
+
+
+
+def test_tfce_sign_max_below_first_step():
+
+    #### negative max in [dh/2, dh), no supra threshold voxel for that sign
+    stat = np.linspace(0.5, 5, 100)
+    stat[10] = -0.07
+
+    tfce = get_tfce(stat, 0.1, E=0.5, H=2)
+
+    assert tfce[10] == 0
+    assert np.allclose(tfce, get_tfce(stat, 0.1, E=0.5, H=2, tail=1))
+    assert np.allclose(tfce, get_tfce_1d_loop(stat, 0.1))
+
+
+
+def test_tfce_matches_loop():
+
+    stat = np.random.default_rng(0).normal(size=200).cumsum() / 5
+
+    assert np.allclose(get_tfce(stat, 0.1, E=0.5, H=2), get_tfce_1d_loop(stat, 0.1))
+
+
+